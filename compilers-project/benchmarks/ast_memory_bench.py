@@ -0,0 +1,46 @@
+# Memory per AST node of a parsed program with about 100k nodes.
+# Run with: poetry run python benchmarks/ast_memory_bench.py [number of statements]
+import sys
+import tracemalloc
+from compiler import ast
+from compiler.parser import parse
+from compiler.tokenizer import tokenize_compact
+from compiler.type_checker import typecheck
+from compiler.types import TypeTab
+
+statement = 'var x{i} = {i} * (y + 3) - f(x{j}, true); if x{i} > 2 then {{ y = y + 1 }} else y = -y;\n'
+
+def generate(statements: int) -> str:
+  parts = ['fun f(a: Int, b: Bool): Int { return a; }\n{ var y = 1;\nvar x0 = 0;\n']
+  for i in range(1, statements + 1):
+    parts.append(statement.format(i=i, j=i - 1))
+  parts.append('y }\n')
+  return ''.join(parts)
+
+def count_nodes(module: ast.Module) -> int:
+  stack: list[object] = [*module.funcs, module.body]
+  count = 0
+  while stack:
+    node = stack.pop()
+    count += 1
+    for name in getattr(node, '__dataclass_fields__', {}):
+      value = getattr(node, name)
+      if isinstance(value, (ast.Expression, ast.FunctionDefinition)):
+        stack.append(value)
+      elif isinstance(value, list):
+        stack.extend(value)
+  return count
+
+def main() -> None:
+  statements = int(sys.argv[1]) if len(sys.argv) > 1 else 3700
+  stream = tokenize_compact(generate(statements))
+  tracemalloc.start()
+  module = parse(stream)
+  retained, _ = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  typecheck(module, TypeTab)
+  nodes = count_nodes(module)
+  print(f'{nodes} nodes: {retained / 1e6:.1f} MB, {retained / nodes:.1f} bytes per node')
+
+if __name__ == '__main__':
+  main()
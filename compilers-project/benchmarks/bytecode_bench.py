@@ -0,0 +1,48 @@
+# Run times of the bytecode VM, compared with the tree interpreter and
+# the closure compiler where they can run the program, and with the
+# native executable.
+# Run with: poetry run python benchmarks/bytecode_bench.py
+import io
+import subprocess
+import tempfile
+import time
+from compiler.__main__ import compile_to_assembly, compile_to_ir
+from compiler.assembler import assemble
+from compiler.bytecode import execute, lower
+from compiler.interpreter import interperet
+from compiler.parser import parse
+from compiler.symtab import TopTab
+from compiler.tokenizer import tokenize, tokenize_compact
+
+programs = {
+  'count': ('var a = 1; while a < 1000000 do a = a + 1; a', True),
+  'sum': ('var s = 0; var i = 0; while i < 300000 do { i = i + 1; if i % 3 == 0 or i % 5 == 0 then { s = s + i; } }; s', True),
+  'fib': ('fun fib(n: Int): Int { if n < 2 then { return n; } return fib(n - 1) + fib(n - 2); } fib(25)', False),
+}
+
+def main() -> None:
+  with tempfile.TemporaryDirectory() as workdir:
+    for name, (source, expression) in programs.items():
+      print(f'{name}:')
+      if expression:
+        node = parse(tokenize(source)).body
+        for mode, compile in [('tree', False), ('closures', True)]:
+          start = time.perf_counter()
+          interperet(node, TopTab, compile)
+          print(f'  {mode:12} {time.perf_counter() - start:7.3f} s')
+
+      start = time.perf_counter()
+      program = lower(compile_to_ir(tokenize_compact(source)))
+      lowered = time.perf_counter()
+      execute(program, stdout=io.StringIO())
+      print(f'  {"bytecode":12} {time.perf_counter() - lowered:7.3f} s  (compiling {lowered - start:.3f} s)')
+
+      start = time.perf_counter()
+      executable = f'{workdir}/{name}'
+      assemble(compile_to_assembly(tokenize_compact(source)), executable)
+      assembled = time.perf_counter()
+      subprocess.run([executable], check=True, stdout=subprocess.DEVNULL)
+      print(f'  {"native":12} {time.perf_counter() - assembled:7.3f} s  (compiling {assembled - start:.3f} s)')
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,37 @@
+# Time of the dataflow analyses on the largest generated functions,
+# which have about 100k instructions.
+# Run with: poetry run python benchmarks/dataflow_bench.py
+import time
+from compiler.__main__ import compile_to_ir
+from compiler.cfg import build
+from compiler.dataflow import AvailableExpressions, Liveness, ReachingDefinitions, solve
+from compiler.tokenizer import tokenize_compact
+
+def branches(n: int) -> str:
+  return 'var x = read_int(); var s = 0;\n' + '\n'.join(
+    f'if x > {i} then {{ s = s + x * {i}; }} else {{ while s > {i} do s = s - x; }}' for i in range(n)
+  ) + '\ns'
+
+# Every variable is read in another block than the one that sets it
+def variables(n: int) -> str:
+  return 'var x = read_int(); var s = 0;\n' + '\n'.join(
+    f'var a{i} = x + {i}; if a{i} > s then {{ s = s + a{i}; }}' for i in range(n)
+  ) + '\n' + ' + '.join(f'a{i}' for i in range(0, n, 100))
+
+def main() -> None:
+  for source, n in [(branches, 1000), (branches, 3000), (branches, 6000), (variables, 3000), (variables, 12000)]:
+    instructions = compile_to_ir(tokenize_compact(source(n)))[('main', ())]
+    start = time.perf_counter()
+    cfg = build('main', instructions)
+    print(f'{source.__name__}: {len(instructions)} instructions, {len(cfg.blocks)} blocks: built in {time.perf_counter() - start:.3f} s')
+    for analysis in (Liveness, ReachingDefinitions, AvailableExpressions):
+      start = time.perf_counter()
+      problem = analysis(cfg)
+      solution = solve(problem)
+      print(
+        f'  {analysis.__name__:22} {problem.size:6} bits {time.perf_counter() - start:7.3f} s'
+        f'  {solution.rounds / len(cfg.blocks):.2f} visits per block'
+      )
+
+if __name__ == '__main__':
+  main()
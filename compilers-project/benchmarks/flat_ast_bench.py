@@ -0,0 +1,39 @@
+# Compares parsing into the flat AST with parsing into the tree.
+# Run with: poetry run python benchmarks/flat_ast_bench.py [number of statements]
+import pickle
+import sys
+import time
+import tracemalloc
+from typing import Callable
+from ast_memory_bench import generate
+from compiler.flat_ast import parse_flat, to_module
+from compiler.parser import parse
+from compiler.token import TokenStream
+from compiler.tokenizer import tokenize_compact
+
+def measure(name: str, parse_stream: Callable[[TokenStream], object], stream: TokenStream) -> None:
+  start = time.perf_counter()
+  parse_stream(stream)
+  elapsed = time.perf_counter() - start
+  tracemalloc.start()
+  module = parse_stream(stream)
+  retained, _ = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  start = time.perf_counter()
+  data = pickle.dumps(module)
+  pickled = time.perf_counter() - start
+  print(f'{name}: parse {elapsed:.2f} s, {retained / 1e6:.1f} MB, '
+    f'pickle {len(data) / 1e6:.1f} MB in {pickled:.2f} s')
+
+def main() -> None:
+  statements = int(sys.argv[1]) if len(sys.argv) > 1 else 3700
+  stream = tokenize_compact(generate(statements))
+  measure('tree', parse, stream)
+  measure('flat', parse_flat, stream)
+  flat = parse_flat(stream)
+  start = time.perf_counter()
+  to_module(flat)
+  print(f'flat to tree: {time.perf_counter() - start:.2f} s')
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,43 @@
+# Compile times of a 500-function module after single-function edits,
+# with and without the compilation cache.
+# Run with: poetry run python benchmarks/incremental_bench.py
+import time
+from typing import Callable
+from compiler.__main__ import compile_to_assembly
+from compiler.incremental import CompilationCache
+from compiler.tokenizer import tokenize_compact
+
+def generate(functions: int) -> str:
+  lines = ['fun f0(x: Int): Int { return x; }']
+  for i in range(1, functions):
+    lines.append(
+      f'fun f{i}(x: Int): Int {{ var y = f{i - 1}(x) + {i}; '
+      f'if y > {i} then {{ y = y - 1; }} while y > 100 do {{ y = y / 2; }} return y; }}'
+    )
+  lines.append(f'print_int(f{functions - 1}(1));')
+  return '\n'.join(lines)
+
+def timed(compile: Callable[[str], str], source: str) -> float:
+  start = time.perf_counter()
+  compile(source)
+  return time.perf_counter() - start
+
+def main() -> None:
+  source = generate(500)
+  edits: dict[str, Callable[[int], str]] = {
+    'body edit': lambda i: source.replace(f'+ {i};', f'+ {i + 1};'),
+    'parameter renamed': lambda i: source.replace(f'fun f{i}(x: Int): Int {{ var y = f{i - 1}(x)', f'fun f{i}(z: Int): Int {{ var y = f{i - 1}(z)'),
+  }
+  full = lambda s: compile_to_assembly(tokenize_compact(s))
+  print(f'full compilation:    {timed(full, source) * 1000:7.1f} ms')
+
+  cache = CompilationCache()
+  print(f'cold cache:          {timed(cache.compile_to_assembly, source) * 1000:7.1f} ms')
+  print(f'unchanged:           {timed(cache.compile_to_assembly, source) * 1000:7.1f} ms')
+  for name, edit in edits.items():
+    times = [timed(cache.compile_to_assembly, edit(i)) for i in range(100, 110)]
+    print(f'{name + ":":20} {sum(times) / len(times) * 1000:7.1f} ms')
+  print(f'hits {cache.hits}, misses {cache.misses}')
+
+if __name__ == '__main__':
+  main()
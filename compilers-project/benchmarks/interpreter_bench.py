@@ -0,0 +1,43 @@
+# Loops in the style of tests/interpeter_test.py, run by the tree
+# interpreter, by the closure compiler and as modules by the frame
+# interpreter, and a recursive function run by the frame interpreter.
+# Run with: poetry run python benchmarks/interpreter_bench.py [iterations]
+import sys
+import time
+from compiler.interpreter import interperet, interperet_module
+from compiler.parser import parse
+from compiler.symtab import TopTab
+from compiler.tokenizer import tokenize
+
+programs = {
+  'count': 'var a = 1; while a < {n} do a = a + 1; a',
+  'sum': 'var s = 0; var i = 0; while i < {n} do {{ i = i + 1; if i % 3 == 0 or i % 5 == 0 then {{ s = s + i; }} }}; s',
+}
+
+fib = 'fun fib(n: Int): Int {{ if n < 2 then {{ return n; }} return fib(n - 1) + fib(n - 2); }} fib({n})'
+
+def timed(source: str, compile: bool) -> float:
+  node = parse(tokenize(source)).body
+  start = time.perf_counter()
+  interperet(node, TopTab, compile)
+  return time.perf_counter() - start
+
+def timed_module(source: str) -> float:
+  module = parse(tokenize(source))
+  start = time.perf_counter()
+  interperet_module(module)
+  return time.perf_counter() - start
+
+def main() -> None:
+  n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+  print(f'{n} iterations')
+  for name, program in programs.items():
+    source = program.format(n=n)
+    tree = timed(source, False)
+    closures = timed(source, True)
+    frames = timed_module(source)
+    print(f'{name:>6}: tree {tree:6.2f} s, closures {closures:6.2f} s, {tree / closures:5.1f}x, frames {frames:6.2f} s')
+  print(f'   fib: fib(30) {timed_module(fib.format(n=30)):6.2f} s')
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,39 @@
+# Run times of a short and a long program in the frame interpreter,
+# in the tiered runner and as a native executable, including the time
+# to compile it.
+# Run with: poetry run python benchmarks/jit_bench.py
+import io
+import subprocess
+import sys
+import tempfile
+import time
+from compiler.__main__ import compile_to_assembly
+from compiler.assembler import assemble
+from compiler.interpreter import interperet_module
+from compiler.jit import run_tiered
+from compiler.parser import parse
+from compiler.tokenizer import tokenize, tokenize_compact
+
+fib = 'fun fib(n: Int): Int {{ if n < 2 then {{ return n; }} return fib(n - 1) + fib(n - 2); }} print_int(fib({n}));'
+programs = {'short': fib.format(n=10), 'long': fib.format(n=30)}
+
+def main() -> None:
+  with tempfile.TemporaryDirectory() as workdir:
+    for name, source in programs.items():
+      print(f'{name}:')
+      start = time.perf_counter()
+      interperet_module(parse(tokenize(source)), stdout=io.StringIO())
+      print(f'  {"interpreter":12} {time.perf_counter() - start:7.3f} s')
+
+      start = time.perf_counter()
+      run_tiered(parse(tokenize(source)), stdout=io.StringIO(), log=sys.stdout)
+      print(f'  {"tiered":12} {time.perf_counter() - start:7.3f} s')
+
+      start = time.perf_counter()
+      executable = f'{workdir}/{name}'
+      assemble(compile_to_assembly(tokenize_compact(source)), executable)
+      subprocess.run([executable], check=True, stdout=subprocess.DEVNULL)
+      print(f'  {"native":12} {time.perf_counter() - start:7.3f} s')
+
+if __name__ == '__main__':
+  main()
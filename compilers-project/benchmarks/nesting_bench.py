@@ -0,0 +1,59 @@
+# Grows the nesting depth of generated programs until a pass fails.
+# Run with: poetry run python benchmarks/nesting_bench.py [max depth]
+import sys
+import time
+from typing import Callable
+from compiler.interpreter import interperet
+from compiler.ir_generator import generate_ir
+from compiler.parser import parse
+from compiler.root_types import root_types
+from compiler.symtab import TopTab
+from compiler.tokenizer import tokenize
+from compiler.type_checker import typecheck
+from compiler.types import TypeTab
+
+shapes: dict[str, Callable[[int], str]] = {
+  'blocks': lambda n: '{ ' * n + '1' + ' }' * n,
+  'parentheses': lambda n: '(' * n + '1' + ')' * n,
+  'left chain': lambda n: ' + '.join(['1'] * n),
+  'assignments': lambda n: '{ var x = 0; ' + 'x = ' * n + '1 }',
+  'unary': lambda n: '-' * n + '1',
+  'if': lambda n: 'if true then ' * n + '1',
+  'while': lambda n: '{ var x = 0; ' + 'while x < 1 do ' * n + '{ x = x + 1 } }',
+}
+
+def compile_and_run(source: str) -> dict[str, float]:
+  times = {}
+  start = time.perf_counter()
+  module = parse(tokenize(source))
+  times['parse'] = time.perf_counter() - start
+
+  start = time.perf_counter()
+  typecheck(module, TypeTab)
+  times['typecheck'] = time.perf_counter() - start
+
+  start = time.perf_counter()
+  generate_ir(root_types, module)
+  times['ir'] = time.perf_counter() - start
+
+  start = time.perf_counter()
+  interperet(module.body, TopTab)
+  times['interpret'] = time.perf_counter() - start
+  return times
+
+def main() -> None:
+  max_depth = int(sys.argv[1]) if len(sys.argv) > 1 else 256_000
+  for name, shape in shapes.items():
+    depth = 1000
+    while depth <= max_depth:
+      try:
+        times = compile_and_run(shape(depth))
+      except RecursionError as e:
+        print(f'{name:>12} {depth:8}: RecursionError')
+        break
+      columns = '  '.join(f'{k} {v * 1000:7.1f} ms' for k, v in times.items())
+      print(f'{name:>12} {depth:8}: {columns}')
+      depth *= 4
+
+if __name__ == '__main__':
+  main()
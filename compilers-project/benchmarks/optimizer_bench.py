@@ -0,0 +1,66 @@
+# Size and run time of the generated code without optimizations, with
+# folding and simplifying only, and with the passes in SSA form.
+# Run with: poetry run python benchmarks/optimizer_bench.py
+import subprocess
+import tempfile
+import time
+from compiler import ir
+from compiler.__main__ import compile_to_ir
+from compiler.assembler import assemble
+from compiler.assembly_generator import generate_assembly
+from compiler.optimizer import optimize
+from compiler.tokenizer import tokenize_compact
+
+programs = {
+  'count': 'var a = 1; while a < 30000000 do a = a + 1; a',
+  'squares': '''
+  var s = 0; var i = 0;
+  while i < 10000000 do {
+    var x = i % 1000;
+    if x * x > 250000 then { s = s + x * x; } else { s = s - x * x + i; }
+    i = i + 1;
+  }
+  s
+  ''',
+  'flags': '''
+  var debug = false; var step = 2; var s = 0; var i = 0;
+  while i < 20000000 do {
+    if debug then print_int(i);
+    s = s + step * 3;
+    step = 4 - step / 2 * 2 + step - 2;
+    i = i + 1;
+  }
+  s
+  ''',
+  'fib': 'fun fib(n: Int): Int { if n < 2 then { return n; } return fib(n - 1) + fib(n - 2); } fib(32)',
+}
+
+def count(functions: dict[tuple, list[ir.Instruction]]) -> int:
+  return sum(len(instructions) for instructions in functions.values())
+
+def main() -> None:
+  with tempfile.TemporaryDirectory() as workdir:
+    for name, source in programs.items():
+      print(f'{name}:')
+      outputs = set()
+      for mode in ['none', 'fold', 'ssa']:
+        functions = compile_to_ir(tokenize_compact(source))
+        start = time.perf_counter()
+        if mode != 'none':
+          functions = optimize(functions, ssa=mode == 'ssa')
+        optimized = time.perf_counter() - start
+        assembly = generate_assembly(functions)
+        executable = f'{workdir}/{name}_{mode}'
+        assemble(assembly, executable)
+        start = time.perf_counter()
+        result = subprocess.run([executable], capture_output=True, text=True, check=True)
+        elapsed = time.perf_counter() - start
+        outputs.add(result.stdout)
+        print(
+          f'  {mode:5} {count(functions):4} instructions {len(assembly.splitlines()):5} lines of assembly'
+          f'  optimized in {optimized:.3f} s  ran in {elapsed:.3f} s'
+        )
+      assert len(outputs) == 1, outputs
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,27 @@
+# Time to compile a module with many functions to assembly in one
+# process, and with the function bodies spread over a process pool.
+# Run with: poetry run python benchmarks/parallel_bench.py [number of functions]
+import sys
+import time
+from compiler.__main__ import compile_to_assembly
+from compiler.parallel import compile_parallel
+from compiler.tokenizer import tokenize_compact
+from incremental_bench import generate
+
+def main() -> None:
+  functions = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+  source = generate(functions)
+
+  start = time.perf_counter()
+  serial = compile_to_assembly(tokenize_compact(source))
+  print(f'serial:  {(time.perf_counter() - start) * 1000:7.1f} ms')
+
+  for jobs in [1, 2, 4, 8]:
+    start = time.perf_counter()
+    _, assembly = compile_parallel(source, jobs)
+    elapsed = time.perf_counter() - start
+    assert assembly == serial
+    print(f'{jobs} jobs:  {elapsed * 1000:7.1f} ms')
+
+if __name__ == '__main__':
+  main()
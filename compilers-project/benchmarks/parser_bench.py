@@ -0,0 +1,39 @@
+# Parse time of operator heavy expressions.
+# Run with: poetry run python benchmarks/parser_bench.py
+import time
+from compiler.parser import parse
+from compiler.tokenizer import tokenize
+
+def operator_chain(n: int) -> str:
+  '''A long flat expression mixing every binary operator level.'''
+  terms = []
+  for i in range(n):
+    terms.append(f'a{i % 7} * {i} + b - c / 3 % 2 < d and e >= {i} or not f == g')
+  return 'x = ' + ' or '.join(terms)
+
+def nested_parentheses(depth: int, width: int) -> str:
+  '''Expressions nested in parentheses, each level using a few operators.'''
+  expr = 'x'
+  for i in range(depth):
+    expr = f'(a + {i} * ({expr}) - b % 3 <= c)'
+  return ' or '.join([expr] * width)
+
+def measure(source: str) -> tuple[int, float]:
+  tokens = tokenize(source)
+  best = float('inf')
+  for _ in range(5):
+    start = time.perf_counter()
+    parse(tokens)
+    best = min(best, time.perf_counter() - start)
+  return len(tokens), best
+
+def main() -> None:
+  for name, source in [
+    ('operator chain', operator_chain(5000)),
+    ('nested parentheses', nested_parentheses(25, 500)),
+  ]:
+    count, seconds = measure(source)
+    print(f'{name:>20}: {count:7} tokens {seconds * 1000:8.1f} ms {count / seconds / 1000:7.1f} ktokens/s')
+
+if __name__ == '__main__':
+  main()
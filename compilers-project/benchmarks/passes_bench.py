@@ -0,0 +1,57 @@
+# Time of the type checker, IR generator and interpreter on a large program.
+# Run with: poetry run python benchmarks/passes_bench.py [number of statements]
+import sys
+import time
+from typing import Callable
+from compiler import ast
+from compiler.interpreter import interperet
+from compiler.ir_generator import generate_ir
+from compiler.parser import parse
+from compiler.root_types import root_types
+from compiler.symtab import SymTab, TopTab
+from compiler.tokenizer import tokenize_compact
+from compiler.type_checker import typecheck
+from compiler.types import TypeTab
+
+statement = '''var x{i} = (x{j} * 3 + {i}) % 1000;
+if x{i} > 500 and not (x{i} == 700) then {{ y = y + x{i} }} else y = y - 1;
+var z{i} = 0;
+while z{i} < 3 do z{i} = z{i} + 1;
+y = -y + z{i};
+'''
+
+def generate(statements: int) -> str:
+  parts = ['{ var y = 0;\nvar x0 = 1;\n']
+  for i in range(1, statements + 1):
+    parts.append(statement.format(i=i, j=i - 1))
+  parts.append('y }\n')
+  return ''.join(parts)
+
+def best_of(repeat: int, run: Callable[[], object]) -> float:
+  best = float('inf')
+  for _ in range(repeat):
+    start = time.perf_counter()
+    run()
+    best = min(best, time.perf_counter() - start)
+  return best
+
+def main() -> None:
+  statements = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+  source = generate(statements)
+  module = parse(tokenize_compact(source))
+  print(f'{statements} statements')
+
+  def check() -> None:
+    # The type checker declares variables into the table it is given
+    typecheck(module, SymTab({}, TypeTab))
+  check()
+
+  def interpret() -> None:
+    interperet(module.body, SymTab({}, TopTab))
+
+  print(f'   typecheck: {best_of(5, check) * 1000:8.1f} ms')
+  print(f' generate_ir: {best_of(5, lambda: generate_ir(root_types, module)) * 1000:8.1f} ms')
+  print(f'  interperet: {best_of(5, interpret) * 1000:8.1f} ms')
+
+if __name__ == '__main__':
+  main()
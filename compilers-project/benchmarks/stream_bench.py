@@ -0,0 +1,34 @@
+# Peak memory of tokenizing a file as a stream versus reading it whole.
+# Run with: poetry run python benchmarks/stream_bench.py
+import tempfile
+import tracemalloc
+from pathlib import Path
+from compiler.tokenizer import tokenize, tokenize_file
+from tokenizer_bench import generate
+
+def peak(f: object) -> int:
+  assert callable(f)
+  tracemalloc.start()
+  f()
+  _, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  return peak
+
+def main() -> None:
+  with tempfile.TemporaryDirectory() as workdir:
+    path = Path(workdir) / 'source'
+    for megabytes in [1, 2, 4]:
+      path.write_text(generate(megabytes * 1_000_000))
+
+      def whole() -> None:
+        tokenize(path.read_text())
+
+      def stream() -> None:
+        with open(path, 'rb') as f:
+          for _ in tokenize_file(f):
+            pass
+
+      print(f'{megabytes} MB: whole {peak(whole) / 1e6:8.1f} MB peak, stream {peak(stream) / 1e6:6.2f} MB peak')
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,27 @@
+# Time of symbol table lookups in small and large scopes, which should
+# be about the same as every scope is searched with one hash lookup.
+# Run with: poetry run python benchmarks/symtab_bench.py
+import time
+from compiler.symtab import SymTab
+
+def lookup_time(tab: SymTab[int], names: list[str]) -> float:
+  best = float('inf')
+  for _ in range(5):
+    start = time.perf_counter()
+    for name in names:
+      tab.require(name)
+    best = min(best, time.perf_counter() - start)
+  return best
+
+def scope(functions: int, locals: int) -> SymTab[int]:
+  root = SymTab[int]({f'f{i}': i for i in range(functions)})
+  return SymTab[int]({f'x{i}': i for i in range(locals)}, root)
+
+def main() -> None:
+  names = ['f0', 'x0', 'f9', 'x9'] * 50000
+  for size in [10, 1000, 5000, 50000]:
+    elapsed = lookup_time(scope(size, size), names)
+    print(f'{size:6} names per scope: {elapsed * 1e9 / len(names):6.1f} ns per lookup')
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,26 @@
+# Throughput of compilations to assembly running in a pool of threads.
+# Only scales with the number of threads on a free-threaded Python build.
+# Run with: poetry run python benchmarks/threads_bench.py [largest number of threads]
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from compiler.__main__ import compile_to_assembly
+from compiler.tokenizer import tokenize_compact
+from passes_bench import generate
+
+def main() -> None:
+  max_threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+  gil = getattr(sys, '_is_gil_enabled', lambda: True)()
+  print(f'GIL {"enabled" if gil else "disabled"}')
+  sources = [generate(200) for _ in range(32)]
+  threads = 1
+  while threads <= max_threads:
+    with ThreadPoolExecutor(threads) as pool:
+      start = time.perf_counter()
+      list(pool.map(lambda source: compile_to_assembly(tokenize_compact(source)), sources))
+      elapsed = time.perf_counter() - start
+    print(f'{threads:3} threads: {len(sources) / elapsed:6.1f} compilations/s')
+    threads *= 2
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,33 @@
+# Memory held by a list of Token objects versus a TokenStream.
+# Run with: poetry run python benchmarks/token_memory_bench.py [size in MB]
+import sys
+import tracemalloc
+from typing import Callable
+from compiler.parser import parse
+from compiler.tokenizer import tokenize, tokenize_compact
+from tokenizer_bench import generate
+
+def retained_and_peak(f: Callable[[], object]) -> tuple[int, int]:
+  tracemalloc.start()
+  result = f()
+  retained, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  del result
+  return retained, peak
+
+def main() -> None:
+  megabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 2
+  source = generate(int(megabytes * 1_000_000))
+  count = len(tokenize_compact(source))
+  print(f'{count} tokens')
+  for name, f in [
+    ('tokenize', lambda: tokenize(source)),
+    ('tokenize_compact', lambda: tokenize_compact(source)),
+    ('parse(tokenize)', lambda: parse(tokenize(source))),
+    ('parse(tokenize_compact)', lambda: parse(tokenize_compact(source))),
+  ]:
+    retained, peak = retained_and_peak(f)
+    print(f'{name:>24}: {retained / 1e6:7.1f} MB retained, {peak / 1e6:7.1f} MB peak, {retained / count:6.1f} B/token')
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,99 @@
+# Tokenizer throughput benchmark.
+# Run with: poetry run python benchmarks/tokenizer_bench.py [size in MB]
+import re
+import sys
+import time
+from compiler.location import Location
+from compiler.token import Token
+from compiler.tokenizer import tokenize
+
+def legacy_tokenize(source_code: str) -> list[Token]:
+  '''The original six-regex tokenizer, kept as the reference point.'''
+  re_identifier = re.compile(r'[a-zA-Z_][0-9a-zA-Z_]*')
+  re_int_lit = re.compile(r'[0-9]+')
+  re_whitespace = re.compile(r'[ \n]+')
+  re_operator = re.compile(r'==|!=|<=|>=|\+|-|\*|/|=|<|>|%')
+  re_punctuation = re.compile(r'\(|\)|\{|\}|,|;|:')
+  re_comment = re.compile(r'(//|#).*|/\*(\n|.)*?\*/')
+  i = 0
+  tokens: list[Token] = []
+  line = 1
+  col = 1
+  types = [
+    (re_comment, 'comment'),
+    (re_whitespace, 'whitespace'),
+    (re_int_lit, 'int_literal'),
+    (re_identifier, 'identifier'),
+    (re_operator, 'operator'),
+    (re_punctuation, 'punctuation'),
+  ]
+  while i < len(source_code):
+    for regex, type in types:
+      match = regex.match(source_code, i)
+      if match:
+        break
+    else:
+      raise Exception(f'Syntax Error, tokens:{tokens}')
+    i = match.end()
+    match_lines = 0
+    match_cols = 0
+    for char in match.group():
+      if char == '\n':
+        match_lines += 1
+        match_cols = 0
+        col = 1
+      else:
+        match_cols += 1
+    if type != 'whitespace' and type != 'comment':
+      tokens.append(Token(match[0], type, Location('file', line, col)))
+    line += match_lines
+    col += match_cols
+  return tokens
+
+function = '''
+/* Generated function number {n}.
+ * Block comments like this one used to backtrack per character.
+ */
+fun f{n}(a: Int, b: Int): Int {{
+    var x = a * {n} + b % 7;   # trailing comment
+    var y = x - 1;
+    while x > 0 and not (y == 0) do {{
+        if x >= b then x = x - 1 else x = x / 2;
+        y = y + x;          // another comment
+    }}
+    return x + y;
+}}
+'''
+
+def generate(size: int) -> str:
+  parts = []
+  total = 0
+  n = 0
+  while total < size:
+    part = function.format(n=n)
+    parts.append(part)
+    total += len(part)
+    n += 1
+  parts.append('f0(1, 2)\n')
+  return ''.join(parts)
+
+def measure(f: object, source: str) -> float:
+  assert callable(f)
+  best = float('inf')
+  for _ in range(3):
+    start = time.perf_counter()
+    f(source)
+    best = min(best, time.perf_counter() - start)
+  return best
+
+def main() -> None:
+  megabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 2
+  source = generate(int(megabytes * 1_000_000))
+  assert tokenize(source) == legacy_tokenize(source)
+  mb = len(source) / 1_000_000
+  for name, f in [('legacy', legacy_tokenize), ('tokenize', tokenize)]:
+    seconds = measure(f, source)
+    print(f'{name:>10}: {seconds:7.3f} s  {mb / seconds:6.2f} MB/s')
+
+if __name__ == '__main__':
+  main()
@@ -2,17 +2,35 @@ from base64 import b64encode
 import json
 import re
 import sys
-from socketserver import ForkingTCPServer, StreamRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+from socket import socket
+from socketserver import BaseRequestHandler, ForkingTCPServer, StreamRequestHandler, TCPServer
 from traceback import format_exception
-from typing import Any
+from typing import Any, Iterable, Iterator, TextIO
 from compiler.types import TypeTab
 from compiler.root_types import root_types
-from compiler.tokenizer import tokenize
+from compiler.token import Token
+from compiler.tokenizer import tokenize_compact, tokenize_file, tokenize_stream
 from compiler.parser import parse
+from compiler.binder import bind
 from compiler.type_checker import typecheck
+from compiler.ir import Instruction
 from compiler.ir_generator import generate_ir
+from compiler.optimizer import optimize
 from compiler.assembly_generator import generate_assembly
 from compiler.assembler import assemble_and_get_executable
+from compiler.bytecode import dump, execute, load, lower, magic
+from compiler.interpreter import interperet_module
+from compiler.jit import run_tiered
+from compiler.profiler import Profiler
+from compiler.incremental import CompilationCache
+from compiler.parallel import compile_parallel
+
+# Shared by the requests of the server, which often compile
+# the same functions again. Only the threads of 'serve --threads=N'
+# share it: a forked process fills its own copy, which is lost when
+# the request is done.
+compilation_cache = CompilationCache()
 
 
 def call_compiler(source_code: str, input_file_name: str) -> bytes:
@@ -23,17 +41,37 @@ def call_compiler(source_code: str, input_file_name: str) -> bytes:
     # The input file name is informational only: you can optionally include in your source locations and error messages,
     # or you can ignore it.
     # *** TODO ***
-    tokens = tokenize(source_code)
-    parsed = parse(tokens)
-    checked = typecheck(parsed, TypeTab)
-    ir = generate_ir(root_types, parsed)
-    assembly = generate_assembly(ir)
-    executable = assemble_and_get_executable(assembly)
-    return executable
+    assembly = compilation_cache.compile_to_assembly(source_code)
+    return assemble_and_get_executable(assembly)
     
     raise NotImplementedError("Compiler not implemented")
 
 
+def compile_tokens(tokens: Iterable[Token], optimized: bool = False, log: TextIO | None = None) -> bytes:
+    assembly = compile_to_assembly(tokens, optimized, log)
+    executable = assemble_and_get_executable(assembly)
+    return executable
+
+
+def compile_to_assembly(tokens: Iterable[Token], optimized: bool = False, log: TextIO | None = None) -> str:
+    return generate_assembly(compile_to_ir(tokens, optimized, log))
+
+
+def compile_to_ir(
+    tokens: Iterable[Token],
+    optimized: bool = False,
+    # The instructions the optimizer saves are reported here
+    log: TextIO | None = None
+) -> dict[tuple, list[Instruction]]:
+    # Only reads the shared built-in tables, so compilations
+    # can run in parallel threads
+    parsed = parse(tokens)
+    bind(parsed, TypeTab.locals)
+    checked = typecheck(parsed, TypeTab)
+    functions = generate_ir(root_types, parsed)
+    return optimize(functions, log) if optimized else functions
+
+
 def main() -> int:
     # === Option parsing ===
     command: str | None = None
@@ -41,6 +79,13 @@ def main() -> int:
     output_file: str | None = None
     host = "127.0.0.1"
     port = 3000
+    threads: int | None = None
+    jobs: int | None = None
+    bytecode = False
+    interpret = False
+    profile_file: str | None = None
+    tiered = False
+    optimized = False
     for arg in sys.argv[1:]:
         if (m := re.fullmatch(r'--output=(.+)', arg)) is not None:
             output_file = m[1]
@@ -48,6 +93,22 @@ def main() -> int:
             host = m[1]
         elif (m := re.fullmatch(r'--port=(.+)', arg)) is not None:
             port = int(m[1])
+        elif (m := re.fullmatch(r'--threads=(.+)', arg)) is not None:
+            threads = int(m[1])
+        elif (m := re.fullmatch(r'--jobs=(.+)', arg)) is not None:
+            jobs = int(m[1])
+        elif arg == '--bytecode':
+            bytecode = True
+        elif arg == '--interpret':
+            interpret = True
+        elif arg == '--tiered':
+            tiered = True
+        elif arg == '--optimize':
+            optimized = True
+        elif (m := re.fullmatch(r'--profile=(.+)', arg)) is not None:
+            # Profiled runs use the interpreter
+            interpret = True
+            profile_file = m[1]
         elif arg.startswith('-'):
             raise Exception(f"Unknown argument: {arg}")
         elif command is None:
@@ -61,25 +122,73 @@ def main() -> int:
         print(f"Error: command argument missing", file=sys.stderr)
         return 1
 
-    def read_source_code() -> str:
+    def read_source_code() -> Iterator[Token]:
+        # The source is tokenized lazily while the parser consumes it
         if input_file is not None:
-            with open(input_file) as f:
-                return f.read()
+            with open(input_file, 'rb') as f:
+                yield from tokenize_file(f)
         else:
-            return sys.stdin.read()
+            yield from tokenize_stream(sys.stdin)
 
     # === Command implementations ===
 
     if command == 'compile':
-        source_code = read_source_code()
         if output_file is None:
             raise Exception("Output file flag --output=... required")
-        executable = call_compiler(source_code, input_file or '(source code)')
+        if bytecode:
+            executable = dump(lower(compile_to_ir(read_source_code(), optimized, sys.stderr)))
+        elif jobs is None:
+            executable = compile_tokens(read_source_code(), optimized, sys.stderr)
+        else:
+            # The workers are given the whole source
+            if input_file is not None:
+                with open(input_file) as source_file:
+                    source_code = source_file.read()
+            else:
+                source_code = sys.stdin.read()
+            _, assembly = compile_parallel(source_code, jobs, optimized=optimized, log=sys.stderr)
+            executable = assemble_and_get_executable(assembly)
         with open(output_file, 'wb') as f:
             f.write(executable)
+    elif command == 'run':
+        # Runs a program in the bytecode VM, without 'as' and 'ld'
+        if input_file is not None:
+            with open(input_file, 'rb') as program_file:
+                contents = program_file.read()
+        else:
+            contents = sys.stdin.buffer.read()
+        if contents.startswith(magic):
+            execute(load(contents))
+        elif interpret or tiered:
+            # Runs the tree in the frame interpreter instead
+            module = parse(tokenize_compact(contents.decode()))
+            profiler = None if profile_file is None else Profiler()
+            if tiered and profiler is not None:
+                raise Exception("--profile cannot be used with --tiered")
+            if tiered:
+                # Hot functions are compiled to native code as the program runs
+                value = run_tiered(module, log=sys.stderr)
+            else:
+                # The interpreter runs any bound tree, so the program is
+                # checked first like it is when compiled
+                bind(module, TypeTab.locals)
+                typecheck(module, TypeTab)
+                value = interperet_module(module, profiler=profiler)
+            if profiler is not None and profile_file is not None:
+                # The hot spots go to stderr, to keep them apart from the
+                # output of the program, and the stacks to the file
+                profiler.report(sys.stderr)
+                with open(profile_file, 'w') as stacks_file:
+                    profiler.write_collapsed(stacks_file)
+            if isinstance(value, bool):
+                print('true' if value else 'false')
+            elif isinstance(value, int):
+                print(value)
+        else:
+            execute(lower(compile_to_ir(tokenize_compact(contents.decode()), optimized, sys.stderr)))
     elif command == 'serve':
         try:
-            run_server(host, port)
+            run_server(host, port, threads)
         except KeyboardInterrupt:
             pass
     else:
@@ -88,33 +197,69 @@ def main() -> int:
     return 0
 
 
-def run_server(host: str, port: int) -> None:
+class ThreadPoolServer(TCPServer):
+    """Handles requests in a fixed pool of threads."""
+    allow_reuse_address = True
+    request_queue_size = 32
+
+    def __init__(self, address: tuple[str, int], handler: type[BaseRequestHandler], threads: int) -> None:
+        super().__init__(address, handler)
+        self.pool = ThreadPoolExecutor(threads, thread_name_prefix='compiler')
+
+    def process_request(self, request: Any, client_address: Any) -> None:
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request: socket, client_address: Any) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.pool.shutdown()
+
+
+class Handler(StreamRequestHandler):
+    def handle(self) -> None:
+        result: dict[str, Any] = {}
+        try:
+            input_str = self.rfile.read().decode()
+            input = json.loads(input_str)
+            if input["command"] == "compile":
+                source_code = input["code"]
+                executable = call_compiler(source_code, "(source code)")
+                result["program"] = b64encode(executable).decode()
+            elif input["command"] == "ping":
+                pass
+            else:
+                result["error"] = "Unknown command: " + input['command']
+        except Exception as e:
+            result["error"] = "".join(format_exception(e))
+        result_str = json.dumps(result)
+        self.request.sendall(str.encode(result_str))
+
+
+def run_server(host: str, port: int, threads: int | None = None) -> None:
     class Server(ForkingTCPServer):
         allow_reuse_address = True
         request_queue_size = 32
 
-    class Handler(StreamRequestHandler):
-        def handle(self) -> None:
-            result: dict[str, Any] = {}
-            try:
-                input_str = self.rfile.read().decode()
-                input = json.loads(input_str)
-                if input["command"] == "compile":
-                    source_code = input["code"]
-                    executable = call_compiler(source_code, "(source code)")
-                    result["program"] = b64encode(executable).decode()
-                elif input["command"] == "ping":
-                    pass
-                else:
-                    result["error"] = "Unknown command: " + input['command']
-            except Exception as e:
-                result["error"] = "".join(format_exception(e))
-            result_str = json.dumps(result)
-            self.request.sendall(str.encode(result_str))
-
     print(f"Starting TCP server at {host}:{port}")
-    with Server((host, port), Handler) as server:
-        server.serve_forever()
+    if threads is not None:
+        # The compiler only shares the built-in tables and the
+        # compilation cache, which is only locked to look up and store
+        # functions, so requests can share one process. On a
+        # free-threaded Python they also run in parallel.
+        with ThreadPoolServer((host, port), Handler, threads) as thread_server:
+            thread_server.serve_forever()
+    else:
+        # Each request is compiled in a child process, so functions
+        # cached by one request aren't reused by the next
+        with Server((host, port), Handler) as server:
+            server.serve_forever()
 
 
 if __name__ == '__main__':
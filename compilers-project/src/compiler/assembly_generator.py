@@ -2,6 +2,7 @@ from compiler import ir
 from compiler.intrinsics import all_intrinsics, IntrinsicArgs
 import dataclasses
 import re
+from typing import Callable
 
 class Locals:
     """Knows the memory location of every local variable."""
@@ -46,92 +47,109 @@ def get_all_ir_variables(instructions: list[ir.Instruction]) -> list[ir.IRVar]:
                         add(v)
     return result_list
 
-def generate_assembly(functions: dict[tuple, list[ir.Instruction]]) -> str:
+def generate_function_assembly(function: tuple, instructions: list[ir.Instruction]) -> list[str]:
+    """Returns the lines of assembly of one function.
+    They only depend on the function's own instructions."""
     registers = ['rdi','rsi','rdx','rcx','r8','r9']
-    lines = []
+    name = function[0]
+    arguments = function[1]
+    lines: list[str] = []
     def emit(line: str) -> None: lines.append(line)
-    emit('.extern print_int')
-    emit('.extern print_bool')
-    emit('.extern read_int')
-    emit('.section .text')
+    emit(f'.global {name}')
+    emit(f'.type {name}, @function')
+    emit(f'{name}:')
 
-    for function, instructions in functions.items():
-        name = function[0]
-        arguments = function[1]
-        emit(f'.global {name}')
-        emit(f'.type {name}, @function')
-        emit(f'{name}:')
+    variables = get_all_ir_variables(instructions)
+    # The parameters are stored even when the optimizer
+    # has removed every use of them
+    variables += [a for a in arguments if a not in variables]
+    locals = Locals(
+        variables=variables
+    )
 
-        locals = Locals(
-            variables=get_all_ir_variables(instructions)
-        )
+    for key, val in locals._var_to_location.items():
+        emit(f'# {key} in {val}')
+    emit('pushq %rbp')
+    emit('movq %rsp, %rbp')
+    loc = 0
+    for i in range(len(arguments)):
+        emit(f'movq %{registers[i]}, {locals.get_ref(arguments[i])}')
+    emit(f'subq ${locals.stack_used()}, %rsp')
 
-        for key, val in locals._var_to_location.items():
-            emit(f'# {key} in {val}')
-        emit('pushq %rbp')
-        emit('movq %rsp, %rbp')
-        loc = 0
-        for i in range(len(arguments)):
-            emit(f'movq %{registers[i]}, {locals.get_ref(arguments[i])}')
-        emit(f'subq ${locals.stack_used()}, %rsp')
-
-        for insn in instructions:
-            emit('# ' + str(insn))
-            match insn:
-                case ir.Label():
-                    emit("")
-                    # ".L" prefix marks the symbol as "private".
-                    # This makes GDB backtraces look nicer too:
-                    # https://stackoverflow.com/a/26065570/965979
-                    emit(f'.L{insn.name}:')
-                case ir.LoadIntConst():
-                    if -2**31 <= insn.value < 2**31:
-                        emit(f'movq ${insn.value}, {locals.get_ref(insn.dest)}')
-                    else:
-                        # Due to a quirk of x86-64, we must use
-                        # a different instruction for large integers.
-                        # It can only write to a register,
-                        # not a memory location, so we use %rax
-                        # as a temporary.
-                        emit(f'movabsq ${insn.value}, %rax')
-                        emit(f'movq %rax, {locals.get_ref(insn.dest)}')
-                        
-                case ir.Jump():
-                    emit(f'jmp .L{insn.label.name}')
-                    
-                case ir.LoadBoolConst():
-                    emit(f'movq ${int(insn.value)}, {locals.get_ref(insn.dest)}')
-                
-                case ir.Copy():
-                    emit(f'movq {locals.get_ref(insn.source)}, %rax')
+    for insn in instructions:
+        emit('# ' + str(insn))
+        match insn:
+            case ir.Label():
+                emit("")
+                # ".L" prefix marks the symbol as "private".
+                # This makes GDB backtraces look nicer too:
+                # https://stackoverflow.com/a/26065570/965979
+                emit(f'.L{insn.name}:')
+            case ir.LoadIntConst():
+                if -2**31 <= insn.value < 2**31:
+                    emit(f'movq ${insn.value}, {locals.get_ref(insn.dest)}')
+                else:
+                    # Due to a quirk of x86-64, we must use
+                    # a different instruction for large integers.
+                    # It can only write to a register,
+                    # not a memory location, so we use %rax
+                    # as a temporary.
+                    emit(f'movabsq ${insn.value}, %rax')
                     emit(f'movq %rax, {locals.get_ref(insn.dest)}')
                     
-                case ir.CondJump():
-                    emit(f'cmpq $0, {locals.get_ref(insn.cond)}')
-                    emit(f'jne .L{insn.then_label.name}')
-                    emit(f'jmp .L{insn.else_label.name}')
+            case ir.Jump():
+                emit(f'jmp .L{insn.label.name}')
                 
-                case ir.Call():
-                    f = insn.fun
-                    if f.name in all_intrinsics.keys():
-                        all_intrinsics[f.name](IntrinsicArgs(
-                            arg_refs=[locals.get_ref(a) for a in insn.args],
-                            result_register='%rax',
-                            emit = emit
-                        ))
-                    else:
-                        for i in range(len(insn.args)):
-                            emit(f'movq {locals.get_ref(insn.args[i])}, %{registers[i]}')
-                        emit(f'callq {f.name}')
-                    emit(f'movq %rax, {locals.get_ref(insn.dest)}')
+            case ir.LoadBoolConst():
+                emit(f'movq ${int(insn.value)}, {locals.get_ref(insn.dest)}')
+            
+            case ir.Copy():
+                emit(f'movq {locals.get_ref(insn.source)}, %rax')
+                emit(f'movq %rax, {locals.get_ref(insn.dest)}')
                 
-                case ir.Return():
-                    emit(f'movq {locals.get_ref(insn.source)}, %rax')
-                    emit(f'movq %rbp, %rsp')
-                    emit(f'popq %rbp')
-                    emit(f'ret')
-                    emit(f'')
-            emit('')
+            case ir.CondJump():
+                emit(f'cmpq $0, {locals.get_ref(insn.cond)}')
+                emit(f'jne .L{insn.then_label.name}')
+                emit(f'jmp .L{insn.else_label.name}')
+            
+            case ir.Call():
+                f = insn.fun
+                if f.name in all_intrinsics.keys():
+                    all_intrinsics[f.name](IntrinsicArgs(
+                        arg_refs=[locals.get_ref(a) for a in insn.args],
+                        result_register='%rax',
+                        emit = emit
+                    ))
+                else:
+                    for i in range(len(insn.args)):
+                        emit(f'movq {locals.get_ref(insn.args[i])}, %{registers[i]}')
+                    emit(f'callq {f.name}')
+                emit(f'movq %rax, {locals.get_ref(insn.dest)}')
+            
+            case ir.Return():
+                emit(f'movq {locals.get_ref(insn.source)}, %rax')
+                emit(f'movq %rbp, %rsp')
+                emit(f'popq %rbp')
+                emit(f'ret')
+                emit(f'')
+        emit('')
+    return lines
+
+def generate_assembly(
+    functions: dict[tuple, list[ir.Instruction]],
+    # Can be replaced to reuse the assembly of functions
+    # that have been generated before
+    function_assembly: Callable[[tuple, list[ir.Instruction]], list[str]] = generate_function_assembly
+) -> str:
+    lines = []
+    def emit(line: str) -> None: lines.append(line)
+    emit('.extern print_int')
+    emit('.extern print_bool')
+    emit('.extern read_int')
+    emit('.section .text')
+
+    for function, instructions in functions.items():
+        lines.extend(function_assembly(function, instructions))
         #emit(f'addq ${locals.stack_used()}, %rsp')
     if instructions[-1] is not ir.Return:
         emit(f'movq $0, %rax')
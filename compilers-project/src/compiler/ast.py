@@ -2,46 +2,51 @@ from compiler.types import Unit, Type
 from dataclasses import dataclass, field
 from compiler.location import Location
 
-@dataclass
+@dataclass(slots=True)
 class Expression:
   '''Base class for AST nodes'''
   location: Location
   type: Type = field(kw_only=True, default=Unit)
   
-@dataclass
+@dataclass(slots=True)
 class Literal(Expression):
   value: int | bool | None
 
-@dataclass
+@dataclass(slots=True)
 class Identifier(Expression):
   name: str
+  # Set by compiler.binder: the variable is slot 'slot' of the frame at 'depth'
+  depth: int = field(default=-1, kw_only=True, compare=False, repr=False)
+  slot: int = field(default=-1, kw_only=True, compare=False, repr=False)
   
-@dataclass
+@dataclass(slots=True)
 class BinaryOp(Expression):
   left: Expression
   op: str
   right: Expression
 
-@dataclass
+@dataclass(slots=True)
 class Condition(Expression):
   con: Expression
   then: Expression
   el: Expression | None
   
-@dataclass
+@dataclass(slots=True)
 class FunctionCall(Expression):
   name: Identifier
   params: list[Expression]
   
-@dataclass
+@dataclass(slots=True)
 class Unary(Expression):
   op: str
   val: Expression
   
-@dataclass
+@dataclass(slots=True)
 class Block(Expression):
   content: list[Expression]
   val: Expression
+  # Set by compiler.binder: number of variables declared directly in the block
+  frame_size: int = field(default=0, kw_only=True, compare=False, repr=False)
 
   def __str__(self) -> str:
     rows = ['CONTENT:']
@@ -51,30 +56,36 @@ class Block(Expression):
     rows.append(str(self.val))
     return '\n'.join(rows)
   
-@dataclass
+@dataclass(slots=True)
 class Declaration(Expression):
   name: Identifier
   val: Expression
   declared_type: Type | None = None
   
-@dataclass
+@dataclass(slots=True)
 class Loop(Expression):
   condition: Expression
   do: Expression
 
-@dataclass
+@dataclass(slots=True)
 class Return(Expression):
   val: Expression
 
-@dataclass
+@dataclass(slots=True)
 class FunctionDefinition:
   name: Identifier
   type: Type
   params: list[Identifier]
   body: Expression
+  # Set by compiler.binder: size of the frame of the parameters
+  frame_size: int = field(default=0, kw_only=True, compare=False, repr=False)
   
-@dataclass
+@dataclass(slots=True)
 class Module:
   funcs: list[FunctionDefinition]
   body: Expression
+  # Set by compiler.binder: names of the slots of the global frame, and
+  # the number of variables declared at the top level outside any block
+  globals: list[str] | None = field(default=None, kw_only=True, compare=False, repr=False)
+  frame_size: int = field(default=0, kw_only=True, compare=False, repr=False)
   
@@ -0,0 +1,178 @@
+from typing import Any, Iterable
+from compiler import ast
+from compiler.trampoline import Step, run
+from compiler.visitor import Visitor, visits
+
+# Frames of a bound module, by depth:
+#   0  the globals: built-in names followed by the functions of the module
+#   1  the parameters of a function, or the top level of the module body
+#   2  the outermost block, and so on
+global_depth = 0
+top_depth = 1
+
+# The values of the slots of the frames that are currently live
+type Frames = list[list[Any]]
+
+def bind(
+  module: ast.Module,
+  builtins: Iterable[str],
+  functions: Iterable[ast.FunctionDefinition] | None = None
+) -> dict[str, set[str]]:
+  '''Resolves every identifier of the module to a slot of a frame.
+
+  Stores the depth and slot of each identifier, the frame size of each
+  block and function, and the names of the global slots on the module.
+  All undefined names and duplicate declarations are reported together.
+
+  If 'functions' is given, only the bodies of those functions are bound,
+  and the others are expected to be bound already. Returns the names of
+  the globals that each bound function refers to.'''
+  return Binder(builtins).bind(module, functions)
+
+def bind_functions(
+  globals: Iterable[str],
+  functions: Iterable[ast.FunctionDefinition]
+) -> dict[str, set[str]]:
+  '''Binds the bodies of functions of a module that has already been
+  bound, given the names of its global slots. The functions don't need
+  to be the ones that were bound, for example they can be parsed again
+  in another process.'''
+  binder = Binder(globals)
+  used = binder.bind_functions(functions)
+  binder.check()
+  return used
+
+class Binder(Visitor[None, None]):
+  def __init__(self, builtins: Iterable[str]) -> None:
+    self.globals = list(builtins)
+    # The slots a name currently refers to, innermost last
+    self.visible: dict[str, list[tuple[int, int]]] = {
+      name: [(global_depth, slot)] for slot, name in enumerate(self.globals)
+    }
+    # Names declared in the innermost scope and their slots
+    self.scope: dict[str, int] = {}
+    self.depth = global_depth
+    self.errors: list[str] = []
+    # Globals referred to in the function being bound
+    self.used: set[str] = set()
+
+  def bind(self, module: ast.Module, bodies: Iterable[ast.FunctionDefinition] | None) -> dict[str, set[str]]:
+    functions: set[str] = set()
+    for f in module.funcs:
+      name = f.name.name
+      if name in functions:
+        self.errors.append(f"{f.name.location}: '{name}' is already declared")
+      functions.add(name)
+      f.name.depth = global_depth
+      f.name.slot = len(self.globals)
+      self.globals.append(name)
+      self.visible.setdefault(name, []).append((global_depth, f.name.slot))
+
+    used = self.bind_functions(module.funcs if bodies is None else bodies)
+
+    outer = self.enter()
+    run(self.visit(module.body, None))
+    module.frame_size = self.leave(outer)
+    module.globals = self.globals
+
+    self.check()
+    return used
+
+  def bind_functions(self, functions: Iterable[ast.FunctionDefinition]) -> dict[str, set[str]]:
+    used = {}
+    for f in functions:
+      self.used = set()
+      outer = self.enter()
+      for param in f.params:
+        self.declare(param)
+      run(self.visit(f.body, None))
+      f.frame_size = self.leave(outer)
+      used[f.name.name] = self.used
+    return used
+
+  def check(self) -> None:
+    if self.errors:
+      raise Exception('\n'.join(self.errors))
+
+  def enter(self) -> dict[str, int]:
+    outer = self.scope
+    self.scope = {}
+    self.depth += 1
+    return outer
+
+  def leave(self, outer: dict[str, int]) -> int:
+    for name in self.scope:
+      self.visible[name].pop()
+    size = len(self.scope)
+    self.scope = outer
+    self.depth -= 1
+    return size
+
+  def declare(self, name: ast.Identifier) -> None:
+    if name.name in self.scope:
+      self.errors.append(f"{name.location}: '{name.name}' is already declared in this scope")
+      name.depth, name.slot = self.depth, self.scope[name.name]
+      return
+    name.depth = self.depth
+    name.slot = self.scope[name.name] = len(self.scope)
+    self.visible.setdefault(name.name, []).append((name.depth, name.slot))
+
+  @visits(ast.Identifier)
+  def identifier(self, node: ast.Identifier, context: None) -> None:
+    slots = self.visible.get(node.name)
+    if not slots:
+      self.errors.append(f"{node.location}: '{node.name}' is not defined")
+      return
+    node.depth, node.slot = slots[-1]
+    if node.depth == global_depth:
+      self.used.add(node.name)
+
+  @visits(ast.Literal)
+  def literal(self, node: ast.Literal, context: None) -> None:
+    pass
+
+  @visits(ast.Declaration)
+  def declaration(self, node: ast.Declaration, context: None) -> Step[None]:
+    # The value is bound before the name, so it can refer to an outer variable
+    # with the same name
+    yield self.visit(node.val, context)
+    self.declare(node.name)
+
+  @visits(ast.Block)
+  def block(self, node: ast.Block, context: None) -> Step[None]:
+    outer = self.enter()
+    for expr in node.content:
+      yield self.visit(expr, context)
+    yield self.visit(node.val, context)
+    node.frame_size = self.leave(outer)
+
+  @visits(ast.BinaryOp)
+  def binary_op(self, node: ast.BinaryOp, context: None) -> Step[None]:
+    yield self.visit(node.left, context)
+    yield self.visit(node.right, context)
+
+  @visits(ast.Condition)
+  def condition(self, node: ast.Condition, context: None) -> Step[None]:
+    yield self.visit(node.con, context)
+    yield self.visit(node.then, context)
+    if node.el is not None:
+      yield self.visit(node.el, context)
+
+  @visits(ast.FunctionCall)
+  def function_call(self, node: ast.FunctionCall, context: None) -> Step[None]:
+    yield self.visit(node.name, context)
+    for param in node.params:
+      yield self.visit(param, context)
+
+  @visits(ast.Unary)
+  def unary(self, node: ast.Unary, context: None) -> Step[None]:
+    yield self.visit(node.val, context)
+
+  @visits(ast.Loop)
+  def loop(self, node: ast.Loop, context: None) -> Step[None]:
+    yield self.visit(node.condition, context)
+    yield self.visit(node.do, context)
+
+  @visits(ast.Return)
+  def return_(self, node: ast.Return, context: None) -> Step[None]:
+    yield self.visit(node.val, context)
@@ -0,0 +1,334 @@
+import struct
+import sys
+from array import array
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import TextIO
+from compiler import ir
+
+class Op(IntEnum):
+  '''The opcodes of the VM. Every instruction is four words:
+  the opcode and the operands a, b and c. Operands are registers
+  unless noted otherwise.'''
+  COPY = 0          # a = b
+  LOAD = 1          # a = the constant b
+  JUMP = 2          # continue from the instruction a
+  COND_JUMP = 3     # continue from b if a is true, else from c
+  ADD = 4           # a = b + c, and the other binary operators
+  SUB = 5
+  MUL = 6
+  DIV = 7
+  MOD = 8
+  EQ = 9
+  NE = 10
+  LT = 11
+  LE = 12
+  GT = 13
+  GE = 14
+  NEG = 15          # a = -b
+  NOT = 16          # a = not b
+  CALL = 17         # a = the function b, called with the arguments from c in 'args'
+  RETURN = 18       # returns a
+  PRINT_INT = 19    # a = b, printed
+  PRINT_BOOL = 20
+  READ_INT = 21     # a = an integer read from the input
+
+binary_ops = {
+  '+': Op.ADD, '-': Op.SUB, '*': Op.MUL, '/': Op.DIV, '%': Op.MOD,
+  '==': Op.EQ, '!=': Op.NE, '<': Op.LT, '<=': Op.LE, '>': Op.GT, '>=': Op.GE,
+}
+unary_ops = {'unary_-': Op.NEG, 'unary_not': Op.NOT}
+builtin_ops = {'print_int': Op.PRINT_INT, 'print_bool': Op.PRINT_BOOL, 'read_int': Op.READ_INT}
+
+# Integers are 64-bit and wrap around like in the native code
+min_int = -2**63
+max_int = 2**63 - 1
+
+def wrap(x: int) -> int:
+  return (x - min_int) % 2**64 + min_int
+
+def divide(x: int, y: int) -> int:
+  '''Division that rounds towards zero, like idivq. Raises an
+  ArithmeticError where idivq stops the program: when dividing by zero,
+  and when the quotient doesn't fit in 64 bits.'''
+  if y == 0:
+    raise ZeroDivisionError('Division by zero')
+  if x == min_int and y == -1:
+    raise OverflowError('Division overflow')
+  q = abs(x) // abs(y)
+  return wrap(-q if (x < 0) != (y < 0) else q)
+
+def remainder(x: int, y: int) -> int:
+  '''The remainder of divide, with the sign of x.'''
+  return x - y * divide(x, y)
+
+@dataclass
+class Function:
+  name: str
+  params: int
+  registers: int
+  # Four words per instruction
+  code: array
+  # The argument registers of the calls
+  args: array
+  # Registers that are set before the function starts,
+  # as pairs of a register and its value
+  constants: array
+
+@dataclass
+class Program:
+  functions: list[Function]
+  main: int
+
+def lower(functions: dict[tuple, list[ir.Instruction]]) -> Program:
+  '''Lowers the output of generate_ir into bytecode.'''
+  indices = {name: i for i, (name, _) in enumerate(functions)}
+  program = Program([], indices['main'])
+  for (name, params), instructions in functions.items():
+    program.functions.append(lower_function(name, params, instructions, indices))
+  return program
+
+def lower_function(
+  name: str,
+  params: tuple[ir.IRVar, ...],
+  instructions: list[ir.Instruction],
+  functions: dict[str, int]
+) -> Function:
+  # The parameters are the first registers
+  registers: dict[ir.IRVar, int] = {p: i for i, p in enumerate(params)}
+
+  # Every literal is loaded into a variable of its own. A variable that
+  # is only ever written by one load is set when the frame is created,
+  # so the load doesn't need to run.
+  writes: dict[ir.IRVar, int] = {}
+  for insn in instructions:
+    dest = getattr(insn, 'dest', None)
+    if dest is not None:
+      writes[dest] = writes.get(dest, 0) + 1
+  constants = array('q')
+
+  def reg(var: ir.IRVar) -> int:
+    r = registers.get(var)
+    if r is None:
+      r = registers[var] = len(registers)
+    return r
+
+  code = array('q')
+  args = array('i')
+  # Jumps are patched once the positions of all labels are known
+  labels: dict[str, int] = {}
+  jumps: list[tuple[int, ir.Label]] = []
+
+  def emit(op: Op, a: int = 0, b: int = 0, c: int = 0) -> None:
+    code.extend((op, a, b, c))
+
+  def target(position: int, label: ir.Label) -> int:
+    jumps.append((position, label))
+    return 0
+
+  for insn in instructions:
+    match insn:
+      case ir.Label():
+        labels[insn.name] = len(code) // 4
+      case ir.LoadIntConst() | ir.LoadBoolConst():
+        value = wrap(int(insn.value))
+        if writes[insn.dest] == 1 and insn.dest not in params:
+          constants.extend((reg(insn.dest), value))
+        else:
+          emit(Op.LOAD, reg(insn.dest), value)
+      case ir.Copy():
+        emit(Op.COPY, reg(insn.dest), reg(insn.source))
+      case ir.Jump():
+        emit(Op.JUMP, target(len(code) + 1, insn.label))
+      case ir.CondJump():
+        at = len(code)
+        emit(Op.COND_JUMP, reg(insn.cond), target(at + 2, insn.then_label), target(at + 3, insn.else_label))
+      case ir.Return():
+        emit(Op.RETURN, reg(insn.source))
+      case ir.Call():
+        f = insn.fun.name
+        dest = reg(insn.dest)
+        if f in binary_ops:
+          emit(binary_ops[f], dest, reg(insn.args[0]), reg(insn.args[1]))
+        elif f in unary_ops or f in builtin_ops:
+          op = unary_ops.get(f) or builtin_ops[f]
+          emit(op, dest, reg(insn.args[0]) if insn.args else 0)
+        elif f in functions:
+          emit(Op.CALL, dest, functions[f], len(args))
+          args.extend(reg(arg) for arg in insn.args)
+        else:
+          raise Exception(f'{insn.location}: Cannot call {f}')
+
+  # Running past the end returns 0, like the end of main in the
+  # native code. The extra register is never written.
+  zero = len(registers)
+  emit(Op.RETURN, zero)
+
+  for position, label in jumps:
+    code[position] = labels[label.name]
+  return Function(name, len(params), zero + 1, code, args, constants)
+
+def execute(program: Program, stdin: TextIO = sys.stdin, stdout: TextIO = sys.stdout) -> None:
+  '''Runs the program. User functions are called with a stack of frames
+  kept in a list, so recursion is not limited by the Python stack.'''
+  # Executed from lists of tuples, which are faster to index than arrays
+  codes = [list(zip(*[iter(f.code)] * 4)) for f in program.functions]
+  args = [f.args.tolist() for f in program.functions]
+  params = [f.params for f in program.functions]
+  # Copied for every call
+  frames = []
+  for function in program.functions:
+    frame = [0] * function.registers
+    for i in range(0, len(function.constants), 2):
+      frame[function.constants[i]] = function.constants[i + 1]
+    frames.append(frame)
+  write = stdout.write
+
+  # Opcodes as local variables, which are faster to look up
+  (COPY, LOAD, JUMP, COND_JUMP, ADD, SUB, MUL, DIV, MOD, EQ, NE, LT, LE, GT, GE,
+   NEG, NOT, CALL, RETURN, PRINT_INT, PRINT_BOOL, READ_INT) = (int(op) for op in Op)
+
+  f = program.main
+  code = codes[f]
+  regs = frames[f].copy()
+  pc = 0
+  calls: list[tuple[list, list, int, int, int]] = []
+  while True:
+    op, a, b, c = code[pc]
+    pc += 1
+    # The most common instructions first
+    if op == COPY:
+      regs[a] = regs[b]
+    elif op == LOAD:
+      regs[a] = b
+    elif op == JUMP:
+      pc = a
+    elif op == COND_JUMP:
+      pc = b if regs[a] else c
+    elif op == ADD:
+      x = regs[b] + regs[c]
+      regs[a] = x if min_int <= x <= max_int else wrap(x)
+    elif op == SUB:
+      x = regs[b] - regs[c]
+      regs[a] = x if min_int <= x <= max_int else wrap(x)
+    elif op == LT:
+      regs[a] = regs[b] < regs[c]
+    elif op == MUL:
+      x = regs[b] * regs[c]
+      regs[a] = x if min_int <= x <= max_int else wrap(x)
+    elif op == EQ:
+      regs[a] = regs[b] == regs[c]
+    elif op == LE:
+      regs[a] = regs[b] <= regs[c]
+    elif op == GT:
+      regs[a] = regs[b] > regs[c]
+    elif op == GE:
+      regs[a] = regs[b] >= regs[c]
+    elif op == NE:
+      regs[a] = regs[b] != regs[c]
+    elif op == CALL:
+      frame = frames[b].copy()
+      for i, arg in enumerate(args[f][c:c + params[b]]):
+        frame[i] = regs[arg]
+      calls.append((code, regs, pc, a, f))
+      f = b
+      code = codes[f]
+      regs = frame
+      pc = 0
+    elif op == RETURN:
+      value = regs[a]
+      if not calls:
+        return
+      code, regs, pc, dest, f = calls.pop()
+      regs[dest] = value
+    elif op == DIV:
+      regs[a] = divide(regs[b], regs[c])
+    elif op == MOD:
+      regs[a] = remainder(regs[b], regs[c])
+    elif op == NEG:
+      regs[a] = wrap(-regs[b])
+    elif op == NOT:
+      regs[a] = not regs[b]
+    elif op == PRINT_INT:
+      write(f'{regs[b]}\n')
+      regs[a] = regs[b]
+    elif op == PRINT_BOOL:
+      write('true\n' if regs[b] else 'false\n')
+      regs[a] = regs[b]
+    elif op == READ_INT:
+      regs[a] = read_int(stdin)
+    else:
+      raise Exception(f'Unknown opcode {op}')
+
+def read_int(stdin: TextIO) -> int:
+  '''Reads a line like the native read_int: characters other than
+  digits and minus signs are skipped.'''
+  line = stdin.readline()
+  if not line:
+    raise Exception('Error: read_int() failed to read input')
+  negative = False
+  value = 0
+  for char in line.rstrip('\n'):
+    if char == '-':
+      negative = not negative
+    elif '0' <= char <= '9':
+      value = wrap(value * 10 + ord(char) - ord('0'))
+  return wrap(-value) if negative else value
+
+# Serialized programs start with this, followed by a version number
+magic = b'CBC\0'
+version = 1
+
+def dump(program: Program) -> bytes:
+  '''Serializes the program. Numbers are stored little-endian.'''
+  out = [magic, struct.pack('<III', version, len(program.functions), program.main)]
+  for f in program.functions:
+    name = f.name.encode()
+    out.append(struct.pack('<I', len(name)))
+    out.append(name)
+    out.append(struct.pack('<IIIII', f.params, f.registers, len(f.code), len(f.args), len(f.constants)))
+    out.append(little_endian(f.code).tobytes())
+    out.append(little_endian(f.args).tobytes())
+    out.append(little_endian(f.constants).tobytes())
+  return b''.join(out)
+
+def load(data: bytes) -> Program:
+  if not data.startswith(magic):
+    raise Exception('Not a bytecode file')
+  offset = len(magic)
+
+  def read(format: str) -> tuple:
+    nonlocal offset
+    values = struct.unpack_from(format, data, offset)
+    offset += struct.calcsize(format)
+    return values
+
+  def read_array(typecode: str, length: int) -> array:
+    nonlocal offset
+    values = array(typecode)
+    size = values.itemsize * length
+    values.frombytes(data[offset:offset + size])
+    offset += size
+    return little_endian(values)
+
+  file_version, count, main = read('<III')
+  if file_version != version:
+    raise Exception(f'Unsupported bytecode version {file_version}')
+  program = Program([], main)
+  for _ in range(count):
+    (length,) = read('<I')
+    name = data[offset:offset + length].decode()
+    offset += length
+    params, registers, code_length, args_length, constants_length = read('<IIIII')
+    code = read_array('q', code_length)
+    args = read_array('i', args_length)
+    constants = read_array('q', constants_length)
+    program.functions.append(Function(name, params, registers, code, args, constants))
+  return program
+
+def little_endian(values: array) -> array:
+  '''Converts between native and little-endian byte order.'''
+  if sys.byteorder == 'big':
+    values = array(values.typecode, values)
+    values.byteswap()
+  return values
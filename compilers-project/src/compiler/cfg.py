@@ -0,0 +1,325 @@
+from dataclasses import dataclass, field
+from compiler import ir
+from compiler.location import L
+
+# The instructions that end a block
+terminators = (ir.Jump, ir.CondJump, ir.Return)
+
+@dataclass(eq=False)
+class Block:
+  '''A basic block: instructions that run one after another. Blocks are
+  compared and hashed by identity.'''
+  # The label the block starts with, if it has one
+  label: ir.Label | None
+  # The instructions after the label. Only the last one can be a
+  # Jump, CondJump or Return. A block that doesn't end in one falls
+  # through to its only successor.
+  instructions: list[ir.Instruction]
+  successors: list['Block'] = field(default_factory=list, repr=False)
+  predecessors: list['Block'] = field(default_factory=list, repr=False)
+  # The position of the block in CFG.blocks
+  index: int = -1
+
+  @property
+  def terminator(self) -> ir.Instruction | None:
+    if self.instructions and isinstance(self.instructions[-1], terminators):
+      return self.instructions[-1]
+    return None
+
+  def __str__(self) -> str:
+    name = self.label.name if self.label is not None else f'block {self.index}'
+    return f'{name} -> {", ".join(str(b.index) for b in self.successors) or "exit"}'
+
+class CFG:
+  '''The control-flow graph of a function. The blocks are kept in the
+  order of the instructions, and the first one is the entry.
+
+  The dominator trees are computed when first used. Passes that change
+  the blocks or edges call changed() afterwards.'''
+  def __init__(self, name: str, blocks: list[Block]) -> None:
+    # The name of the function, used in the names of new labels
+    self.name = name
+    self.blocks = blocks
+    self.label_num = 0
+    self.changed()
+
+  @property
+  def entry(self) -> Block:
+    return self.blocks[0]
+
+  def changed(self) -> None:
+    for i, block in enumerate(self.blocks):
+      block.index = i
+    self._order: list[Block] | None = None
+    self._dominators: DominatorTree | None = None
+    self._post_dominators: DominatorTree | None = None
+
+  def reverse_postorder(self) -> list[Block]:
+    '''Returns the blocks reachable from the entry, each before its
+    successors except along back edges.'''
+    if self._order is None:
+      order = postorder(len(self.blocks), self.entry.index, [[s.index for s in b.successors] for b in self.blocks])
+      order.reverse()
+      self._order = [self.blocks[i] for i in order]
+    return self._order
+
+  @property
+  def dominators(self) -> 'DominatorTree':
+    if self._dominators is None:
+      self._dominators = DominatorTree(
+        self.blocks,
+        self.entry.index,
+        [[p.index for p in b.predecessors] for b in self.blocks],
+        [[s.index for s in b.successors] for b in self.blocks],
+      )
+    return self._dominators
+
+  @property
+  def post_dominators(self) -> 'DominatorTree':
+    '''The dominators of the reversed graph. The blocks that leave the
+    function are joined by a virtual exit, which is the root. Blocks
+    that never reach the exit have no post-dominators.'''
+    if self._post_dominators is None:
+      exit = len(self.blocks)
+      exits = [b.index for b in self.blocks if not b.successors]
+      successors: list[list[int]] = [[p.index for p in b.predecessors] for b in self.blocks]
+      successors.append(exits)
+      predecessors: list[list[int]] = [[s.index for s in b.successors] for b in self.blocks]
+      for i in exits:
+        predecessors[i].append(exit)
+      predecessors.append([])
+      self._post_dominators = DominatorTree(self.blocks, exit, predecessors, successors)
+    return self._post_dominators
+
+  def remove_unreachable(self) -> None:
+    '''Removes the blocks that can't be reached from the entry.'''
+    reachable = set(self.reverse_postorder())
+    if len(reachable) == len(self.blocks):
+      return
+    for block in self.blocks:
+      if block not in reachable:
+        set_successors(block, [])
+    self.blocks = [b for b in self.blocks if b in reachable]
+    self.changed()
+
+  def label(self, block: Block) -> ir.Label:
+    '''Returns the label of the block, adding one if it has none.'''
+    if block.label is None:
+      self.label_num += 1
+      block.label = ir.Label(L, f'{self.name}_B{self.label_num}')
+    return block.label
+
+  def instructions(self) -> list[ir.Instruction]:
+    '''Returns the instructions of the blocks in order. A Jump is added
+    where a block falls through to a block that no longer follows it,
+    or falls off the end of the function but is no longer last.'''
+    result: list[ir.Instruction] = []
+    end: ir.Label | None = None
+    for i, block in enumerate(self.blocks):
+      if block.label is not None:
+        result.append(block.label)
+      result.extend(block.instructions)
+      if block.terminator is not None:
+        continue
+      following = self.blocks[i + 1] if i + 1 < len(self.blocks) else None
+      location = block.instructions[-1].location if block.instructions else L
+      if block.successors and block.successors[0] is not following:
+        result.append(ir.Jump(location, self.label(block.successors[0])))
+      elif not block.successors and following is not None:
+        if end is None:
+          self.label_num += 1
+          end = ir.Label(L, f'{self.name}_B{self.label_num}')
+        result.append(ir.Jump(location, end))
+    if end is not None:
+      result.append(end)
+    return result
+
+def set_successors(block: Block, successors: list[Block]) -> None:
+  '''Replaces the successors of the block, updating their predecessors.
+  The instructions are not changed.'''
+  for successor in block.successors:
+    if successor not in successors:
+      successor.predecessors.remove(block)
+  for successor in successors:
+    if successor not in block.successors:
+      successor.predecessors.append(block)
+  block.successors = successors
+
+def build(name: str, instructions: list[ir.Instruction]) -> CFG:
+  '''Splits the instructions of a function into basic blocks.'''
+  blocks: list[Block] = []
+  by_label: dict[str, Block] = {}
+  current: Block | None = None
+  for insn in instructions:
+    if isinstance(insn, ir.Label):
+      current = Block(insn, [])
+      blocks.append(current)
+      by_label[insn.name] = current
+    else:
+      if current is None or current.terminator is not None:
+        current = Block(None, [])
+        blocks.append(current)
+      current.instructions.append(insn)
+  if not blocks:
+    blocks.append(Block(None, []))
+
+  def target(label: ir.Label) -> Block:
+    block = by_label.get(label.name)
+    if block is None:
+      raise Exception(f'{label.location}: Undefined label {label.name}')
+    return block
+
+  for i, block in enumerate(blocks):
+    match block.terminator:
+      case ir.Jump() as jump:
+        successors = [target(jump.label)]
+      case ir.CondJump() as jump:
+        successors = [target(jump.then_label), target(jump.else_label)]
+      case ir.Return():
+        successors = []
+      case _:
+        # Falling off the end returns from the function
+        successors = [blocks[i + 1]] if i + 1 < len(blocks) else []
+    for successor in successors:
+      if successor not in block.successors:
+        block.successors.append(successor)
+        successor.predecessors.append(block)
+  return CFG(name, blocks)
+
+def build_all(functions: dict[tuple, list[ir.Instruction]]) -> dict[tuple, CFG]:
+  '''Builds the graphs of all the functions of the output of generate_ir.'''
+  return {key: build(key[0], ins) for key, ins in functions.items()}
+
+def postorder(count: int, root: int, successors: list[list[int]]) -> list[int]:
+  '''Returns the nodes reachable from the root in postorder.
+  Runs on an explicit stack, so any depth of graph is fine.'''
+  visited = [False] * count
+  visited[root] = True
+  order = []
+  stack = [(root, iter(successors[root]))]
+  while stack:
+    node, children = stack[-1]
+    for child in children:
+      if not visited[child]:
+        visited[child] = True
+        stack.append((child, iter(successors[child])))
+        break
+    else:
+      stack.pop()
+      order.append(node)
+  return order
+
+class DominatorTree:
+  '''The immediate dominators of the blocks of a graph, found with the
+  algorithm of Cooper, Harvey and Kennedy, which is close to linear on
+  the graphs of structured code.
+
+  Nodes are the indices of the blocks. The root can be a virtual node
+  after the blocks, like the exit of the post-dominator tree.'''
+  def __init__(
+    self,
+    blocks: list[Block],
+    root: int,
+    predecessors: list[list[int]],
+    successors: list[list[int]]
+  ) -> None:
+    self.blocks = blocks
+    self.root = root
+    self.predecessors = predecessors
+    count = len(predecessors)
+    order = postorder(count, root, successors)
+    order.reverse()
+    # Position in reverse postorder, -1 for unreachable nodes
+    position = [-1] * count
+    for i, node in enumerate(order):
+      position[node] = i
+
+    idom = [-1] * count
+    idom[root] = root
+    changed = True
+    while changed:
+      changed = False
+      for node in order[1:]:
+        new = -1
+        for p in predecessors[node]:
+          if idom[p] == -1:
+            continue
+          if new == -1:
+            new = p
+            continue
+          # The closest common dominator of p and new
+          a, b = p, new
+          while a != b:
+            while position[a] > position[b]:
+              a = idom[a]
+            while position[b] > position[a]:
+              b = idom[b]
+          new = a
+        if idom[node] != new:
+          idom[node] = new
+          changed = True
+    self.idoms = idom
+
+    # Numbered in a preorder walk of the tree, so that a node dominates
+    # the nodes numbered from its number to its last descendant's
+    children: list[list[int]] = [[] for _ in range(count)]
+    for node in order[1:]:
+      children[idom[node]].append(node)
+    self.tree = children
+    self.first = [-1] * count
+    self.last = [-1] * count
+    number = 0
+    stack = [(root, False)]
+    while stack:
+      node, done = stack.pop()
+      if done:
+        self.last[node] = number - 1
+        continue
+      self.first[node] = number
+      number += 1
+      stack.append((node, True))
+      stack.extend((child, False) for child in reversed(children[node]))
+    self._frontiers: list[list[int]] | None = None
+
+  def block(self, node: int) -> Block | None:
+    return self.blocks[node] if node < len(self.blocks) else None
+
+  def idom(self, block: Block) -> Block | None:
+    '''Returns the immediate dominator of the block, or None for the
+    root, unreachable blocks and blocks dominated only by a virtual root.'''
+    node = self.idoms[block.index]
+    if node == -1 or block.index == self.root:
+      return None
+    return self.block(node)
+
+  def children(self, block: Block) -> list[Block]:
+    return [self.blocks[node] for node in self.tree[block.index]]
+
+  def reachable(self, block: Block) -> bool:
+    return self.idoms[block.index] != -1
+
+  def dominates(self, a: Block, b: Block) -> bool:
+    '''Whether every path from the root to b goes through a.
+    Every block dominates itself.'''
+    first = self.first[a.index]
+    return first != -1 and first <= self.first[b.index] <= self.last[a.index]
+
+  def frontier(self, block: Block) -> list[Block]:
+    '''The blocks where the dominance of the block ends: those it
+    doesn't strictly dominate, but dominates a predecessor of.'''
+    if self._frontiers is None:
+      frontiers: list[list[int]] = [[] for _ in self.idoms]
+      idom = self.idoms
+      for node, predecessors in enumerate(self.predecessors):
+        if len(predecessors) < 2 or idom[node] == -1:
+          continue
+        for p in predecessors:
+          runner = p
+          while runner != idom[node] and idom[runner] != -1:
+            if not frontiers[runner] or frontiers[runner][-1] != node:
+              frontiers[runner].append(node)
+            if runner == self.root:
+              break
+            runner = idom[runner]
+      self._frontiers = frontiers
+    return [b for node in self._frontiers[block.index] if (b := self.block(node)) is not None]
@@ -0,0 +1,395 @@
+import heapq
+from abc import ABC, abstractmethod
+from typing import Iterable
+from compiler import ir
+from compiler.cfg import CFG, Block
+from compiler.location import L
+
+# The built-ins that only compute a value from their arguments
+pure_operators = frozenset(
+  ir.IRVar(op) for op in ['+', '-', '*', '/', '%', '<', '<=', '>', '>=', '==', '!=', 'unary_-', 'unary_not']
+)
+
+def uses(insn: ir.Instruction) -> list[ir.IRVar]:
+  '''The variables an instruction reads. The function of a Call is
+  a name, not a variable.'''
+  match insn:
+    case ir.Copy():
+      return [insn.source]
+    case ir.Call():
+      return insn.args
+    case ir.CondJump():
+      return [insn.cond]
+    case ir.Return():
+      return [insn.source]
+    case ir.Phi():
+      return insn.sources
+  return []
+
+def definition(insn: ir.Instruction) -> ir.IRVar | None:
+  '''The variable an instruction writes, if any.'''
+  match insn:
+    case ir.LoadIntConst() | ir.LoadBoolConst() | ir.Copy() | ir.Call() | ir.Phi():
+      return insn.dest
+  return None
+
+class Numbering:
+  '''Gives numbers to the variables of a function, which are their
+  bits in the sets of the analyses.
+
+  The variables read in some block before it writes them come first.
+  They are the only ones that can carry a value from one block to
+  another, so the sets at the ends of blocks only use the first
+  'globals' bits and stay small.'''
+  def __init__(self, cfg: CFG) -> None:
+    self.numbers: dict[ir.IRVar, int] = {}
+    self.vars: list[ir.IRVar] = []
+    local: dict[ir.IRVar, None] = {}
+    for block in cfg.blocks:
+      defined = set()
+      for insn in block.instructions:
+        for var in uses(insn):
+          if var not in defined:
+            self.number(var)
+        dest = definition(insn)
+        if dest is not None:
+          defined.add(dest)
+          local[dest] = None
+    self.globals = len(self.vars)
+    for var in local:
+      self.number(var)
+
+  def number(self, var: ir.IRVar) -> int:
+    n = self.numbers.get(var)
+    if n is None:
+      n = self.numbers[var] = len(self.vars)
+      self.vars.append(var)
+    return n
+
+  def bits(self, vars: list[ir.IRVar]) -> int:
+    result = 0
+    for var in vars:
+      result |= 1 << self.numbers[var]
+    return result
+
+  def members(self, bits: int) -> set[ir.IRVar]:
+    return {self.vars[n] for n in ones(bits)}
+
+def ones(bits: int) -> list[int]:
+  '''The numbers of the set bits, in order.'''
+  digits = bin(bits)[:1:-1]
+  return [n for n, digit in enumerate(digits) if digit == '1']
+
+class Analysis(ABC):
+  '''A dataflow problem over sets of bits. Subclasses give the direction,
+  the meet and the transfer function of each instruction.
+
+  The transfer functions of blocks are made of a set of bits the block
+  generates and a set it kills, found once by transfer_block.'''
+  forward = True
+  # The meet is the union of the sets if true, else the intersection
+  union = True
+
+  def __init__(self, cfg: CFG, size: int) -> None:
+    self.cfg = cfg
+    # The number of bits
+    self.size = size
+    self.full = (1 << size) - 1
+
+  def boundary(self) -> int:
+    '''The set at the entry of a forward problem or the exits of a
+    backward one.'''
+    return 0
+
+  @abstractmethod
+  def transfer(self, insn: ir.Instruction, bits: int) -> int:
+    '''The set after the instruction in the direction of the analysis,
+    given the set before it.'''
+
+  def transfer_block(self, block: Block) -> tuple[int, int]:
+    '''The bits the block generates and kills, in the direction of the
+    analysis. The default runs transfer on every instruction.'''
+    instructions = block.instructions if self.forward else reversed(block.instructions)
+    # Running the instructions on the empty set gives the generated
+    # bits, and on the full set the bits that aren't killed
+    gen, keep = 0, self.full
+    for insn in instructions:
+      gen = self.transfer(insn, gen)
+      keep = self.transfer(insn, keep)
+    return gen, self.full & ~keep
+
+  def solve(self) -> 'Solution':
+    return solve(self)
+
+class Solution:
+  '''The sets at the start and end of every block, in the order of the
+  instructions whatever the direction of the analysis.'''
+  def __init__(self, analysis: Analysis, before: list[int], after: list[int], rounds: int) -> None:
+    self.analysis = analysis
+    self.before = before
+    self.after = after
+    # The number of blocks the solver visited
+    self.rounds = rounds
+
+  def instructions(self, block: Block) -> list[int]:
+    '''The sets before each instruction of the block for forward
+    problems, and after each one for backward problems.'''
+    analysis = self.analysis
+    if analysis.forward:
+      bits = self.before[block.index]
+      result = []
+      for insn in block.instructions:
+        result.append(bits)
+        bits = analysis.transfer(insn, bits)
+      return result
+    bits = self.after[block.index]
+    result = []
+    for insn in reversed(block.instructions):
+      result.append(bits)
+      bits = analysis.transfer(insn, bits)
+    result.reverse()
+    return result
+
+def solve(analysis: Analysis) -> Solution:
+  '''Finds the fixed point of the analysis with a worklist. Blocks are
+  taken in reverse postorder for forward problems and in postorder for
+  backward ones, so most of them are visited once or twice.'''
+  cfg = analysis.cfg
+  blocks = cfg.blocks
+  count = len(blocks)
+  order = [b.index for b in cfg.reverse_postorder()]
+  if len(order) < count:
+    # Unreachable blocks still get sets
+    seen = set(order)
+    order += [i for i in range(count) if i not in seen]
+  if not analysis.forward:
+    order.reverse()
+  position = [0] * count
+  for i, node in enumerate(order):
+    position[node] = i
+
+  if analysis.forward:
+    sources = [[p.index for p in b.predecessors] for b in blocks]
+    targets = [[s.index for s in b.successors] for b in blocks]
+    boundary = {cfg.entry.index}
+  else:
+    sources = [[s.index for s in b.successors] for b in blocks]
+    targets = [[p.index for p in b.predecessors] for b in blocks]
+    boundary = {b.index for b in blocks if not b.successors}
+  transfers = [analysis.transfer_block(b) for b in blocks]
+
+  union = analysis.union
+  top = 0 if union else analysis.full
+  boundary_bits = analysis.boundary()
+  # The sets where the flow enters and leaves each block
+  entering = [top] * count
+  leaving = [top] * count
+  worklist = list(range(count))
+  queued = [True] * count
+  rounds = 0
+  while worklist:
+    i = order[heapq.heappop(worklist)]
+    queued[i] = False
+    rounds += 1
+    if i in boundary:
+      bits = boundary_bits
+    elif sources[i]:
+      bits = top
+    else:
+      # Unreachable in the direction of the analysis
+      bits = boundary_bits if union else top
+    if union:
+      for j in sources[i]:
+        bits |= leaving[j]
+    else:
+      for j in sources[i]:
+        bits &= leaving[j]
+    entering[i] = bits
+    gen, kill = transfers[i]
+    bits = gen | (bits & ~kill)
+    if bits != leaving[i]:
+      leaving[i] = bits
+      for j in targets[i]:
+        if not queued[j]:
+          queued[j] = True
+          heapq.heappush(worklist, position[j])
+
+  if analysis.forward:
+    return Solution(analysis, entering, leaving, rounds)
+  return Solution(analysis, leaving, entering, rounds)
+
+class Liveness(Analysis):
+  '''The variables whose values may be read later. The bits are the
+  numbers of the variables in the Numbering.'''
+  forward = False
+
+  def __init__(self, cfg: CFG, numbering: Numbering | None = None) -> None:
+    self.numbering = numbering or Numbering(cfg)
+    super().__init__(cfg, self.numbering.globals)
+
+  def transfer(self, insn: ir.Instruction, bits: int) -> int:
+    numbering = self.numbering
+    dest = definition(insn)
+    if dest is not None:
+      bits &= ~(1 << numbering.numbers[dest])
+    return bits | numbering.bits(uses(insn))
+
+  def transfer_block(self, block: Block) -> tuple[int, int]:
+    numbers = self.numbering.numbers
+    size = self.size
+    gen: set[int] = set()
+    kill: set[int] = set()
+    for insn in reversed(block.instructions):
+      dest = definition(insn)
+      if dest is not None:
+        n = numbers[dest]
+        gen.discard(n)
+        if n < size:
+          kill.add(n)
+      gen.update(numbers[var] for var in uses(insn))
+    return bitset(gen), bitset(kill)
+
+class ReachingDefinitions(Analysis):
+  '''The definitions that may reach each point. The bits are the
+  numbers of the instructions in 'definitions'.
+
+  The definitions of variables that are only read after being written
+  in the same block can't reach a read in another block, so they are
+  left out of the sets at the ends of blocks.
+
+  The variables in 'entry', like the parameters, have a value when the
+  function starts. Each gets a definition that reaches from the entry,
+  a copy of the variable to itself that isn't in the graph.'''
+  def __init__(
+    self,
+    cfg: CFG,
+    numbering: Numbering | None = None,
+    entry: Iterable[ir.IRVar] = ()
+  ) -> None:
+    numbering = numbering or Numbering(cfg)
+    globals = numbering.globals
+    numbers = numbering.numbers
+    # Only the variables read before they are written can need them
+    self.entry = [ir.Copy(L, var, var) for var in dict.fromkeys(entry) if numbers.get(var, globals) < globals]
+    found: list[tuple[ir.Instruction, ir.IRVar]] = [(insn, insn.dest) for insn in self.entry]
+    for block in cfg.blocks:
+      for insn in block.instructions:
+        dest = definition(insn)
+        if dest is not None:
+          found.append((insn, dest))
+    # The definitions of the variables that can be read in another
+    # block come first
+    found.sort(key=lambda d: numbers[d[1]] >= globals)
+    size = sum(1 for _, dest in found if numbers[dest] < globals)
+    super().__init__(cfg, size)
+    self.definitions = [insn for insn, _ in found]
+    self.numbers: dict[int, int] = {}
+    self.by_var: dict[ir.IRVar, list[int]] = {}
+    for n, (insn, dest) in enumerate(found):
+      self.numbers[id(insn)] = n
+      self.by_var.setdefault(dest, []).append(n)
+    # The definitions of the variables that can be read in another block
+    self.of_var = {var: bitset(numbers) for var, numbers in self.by_var.items() if numbers[0] < size}
+
+  def boundary(self) -> int:
+    return bitset([self.numbers[id(insn)] for insn in self.entry])
+
+  def transfer(self, insn: ir.Instruction, bits: int) -> int:
+    dest = definition(insn)
+    if dest is None:
+      return bits
+    killed = self.of_var.get(dest)
+    if killed is None:
+      killed = bitset(self.by_var[dest])
+    return (bits & ~killed) | 1 << self.numbers[id(insn)]
+
+  def transfer_block(self, block: Block) -> tuple[int, int]:
+    # The last definition of each variable is generated
+    last: dict[ir.IRVar, ir.Instruction] = {}
+    for insn in block.instructions:
+      dest = definition(insn)
+      if dest is not None and dest in self.of_var:
+        last[dest] = insn
+    gen = bitset([self.numbers[id(insn)] for insn in last.values()])
+    kill = 0
+    for var in last:
+      kill |= self.of_var[var]
+    return gen, kill
+
+  def members(self, bits: int) -> list[ir.Instruction]:
+    return [self.definitions[n] for n in ones(bits)]
+
+# An operator and its arguments
+Expression = tuple[ir.IRVar, tuple[ir.IRVar, ...]]
+
+class AvailableExpressions(Analysis):
+  '''The calls of pure operators that have been computed on every path
+  to a point, with none of their arguments changed since. The bits are
+  the numbers of the expressions in 'expressions'.
+
+  An expression with an argument that is written before it is read in
+  every block can't be available when a block starts, so it is left
+  out of the sets at the ends of blocks.'''
+  union = False
+
+  def __init__(self, cfg: CFG, numbering: Numbering | None = None) -> None:
+    numbering = numbering or Numbering(cfg)
+    globals = numbering.globals
+    numbers = numbering.numbers
+    found: dict[Expression, bool] = {}
+    for block in cfg.blocks:
+      for insn in block.instructions:
+        expression = self.expression(insn)
+        if expression is not None:
+          found[expression] = all(numbers[var] < globals for var in expression[1])
+    self.expressions = [e for e, crossing in found.items() if crossing]
+    size = len(self.expressions)
+    self.expressions += [e for e, crossing in found.items() if not crossing]
+    super().__init__(cfg, size)
+    self.numbers = {e: n for n, e in enumerate(self.expressions)}
+    # The expressions that use each variable
+    self.users: dict[ir.IRVar, list[int]] = {}
+    for n, (_, args) in enumerate(self.expressions):
+      for var in set(args):
+        self.users.setdefault(var, []).append(n)
+    self.of_var = {var: bitset([n for n in users if n < size]) for var, users in self.users.items()}
+
+  @staticmethod
+  def expression(insn: ir.Instruction) -> Expression | None:
+    if isinstance(insn, ir.Call) and insn.fun in pure_operators:
+      return (insn.fun, tuple(insn.args))
+    return None
+
+  def transfer(self, insn: ir.Instruction, bits: int) -> int:
+    expression = self.expression(insn)
+    if expression is not None:
+      bits |= 1 << self.numbers[expression]
+    dest = definition(insn)
+    if dest is not None and dest in self.users:
+      bits &= ~bitset(self.users[dest])
+    return bits
+
+  def transfer_block(self, block: Block) -> tuple[int, int]:
+    size = self.size
+    gen = kill = 0
+    for insn in block.instructions:
+      expression = self.expression(insn)
+      if expression is not None and self.numbers[expression] < size:
+        gen |= 1 << self.numbers[expression]
+      dest = definition(insn)
+      if dest is not None and dest in self.of_var:
+        gen &= ~self.of_var[dest]
+        kill |= self.of_var[dest]
+    return gen, kill
+
+  def members(self, bits: int) -> list[Expression]:
+    return [self.expressions[n] for n in ones(bits)]
+
+def bitset(numbers: set[int] | list[int]) -> int:
+  '''The set with the given bits.'''
+  if not numbers:
+    return 0
+  data = bytearray(max(numbers) // 8 + 1)
+  for n in numbers:
+    data[n >> 3] |= 1 << (n & 7)
+  return int.from_bytes(data, 'little')
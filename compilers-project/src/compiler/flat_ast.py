@@ -0,0 +1,278 @@
+from array import array
+from enum import IntEnum
+from typing import Iterable
+from compiler import ast
+from compiler.location import Location
+from compiler.parser import Parser
+from compiler.token import Token
+from compiler.trampoline import Step, run
+from compiler.types import Type, Unit
+
+class NodeKind(IntEnum):
+  LITERAL = 0
+  IDENTIFIER = 1
+  BINARY_OP = 2
+  CONDITION = 3
+  FUNCTION_CALL = 4
+  UNARY = 5
+  BLOCK = 6
+  DECLARATION = 7
+  LOOP = 8
+  RETURN = 9
+  FUNCTION_DEFINITION = 10
+
+class FlatModule:
+  '''A module stored as arrays indexed by node id, instead of as a tree
+  of node objects.
+
+  Every node has a kind, a location, a type, and three operands a, b
+  and c, whose meaning depends on the kind:
+
+    LITERAL              a: index in 'constants'
+    IDENTIFIER           a: index of the name in 'strings'
+    BINARY_OP            a: left, b: index of the operator in 'strings', c: right
+    CONDITION            a: con, b: then, c: el or -1
+    FUNCTION_CALL        a: name, b, c: start and length of the params in 'children'
+    UNARY                a: index of the operator in 'strings', b: val
+    BLOCK                a, b: start and length of the content in 'children', c: val
+    DECLARATION          a: name, b: val, c: declared type in 'type_table' or -1
+    LOOP                 a: condition, b: do
+    RETURN               a: val
+    FUNCTION_DEFINITION  a: name, b, c: start and length of the params in
+                         'children', followed by the body
+
+  Child nodes always have smaller ids than their parents, so the nodes
+  can be visited bottom up with a plain loop over the ids.'''
+  def __init__(self) -> None:
+    self.kinds = array('B')
+    self.files = array('i')
+    self.lines = array('i')
+    self.columns = array('i')
+    self.types = array('i')
+    self.a = array('i')
+    self.b = array('i')
+    self.c = array('i')
+    self.children = array('i')
+    self.strings: list[str] = []
+    self.constants: list[int | bool | None] = []
+    self.type_table: list[Type] = []
+    self.funcs = array('i')
+    self.body = -1
+
+  def __len__(self) -> int:
+    return len(self.kinds)
+
+  def location(self, node: int) -> Location:
+    return Location(self.strings[self.files[node]], self.lines[node], self.columns[node])
+
+
+class FlatBuilder:
+  '''Builds a FlatModule. Can be passed to compiler.parser.Parser
+  to parse straight into the flat form.'''
+  def __init__(self) -> None:
+    self.flat = FlatModule()
+    self.string_ids: dict[str, int] = {}
+    # Types are mostly the same few objects, so they are looked up by identity
+    self.type_ids: dict[int, int] = {}
+
+  def string(self, text: str) -> int:
+    index = self.string_ids.get(text)
+    if index is None:
+      index = self.string_ids[text] = len(self.flat.strings)
+      self.flat.strings.append(text)
+    return index
+
+  def type(self, type: Type) -> int:
+    index = self.type_ids.get(id(type))
+    if index is None:
+      index = self.type_ids[id(type)] = len(self.flat.type_table)
+      self.flat.type_table.append(type)
+    return index
+
+  def children(self, nodes: list[int]) -> int:
+    start = len(self.flat.children)
+    self.flat.children.extend(nodes)
+    return start
+
+  def add(self, kind: NodeKind, loc: Location, a: int = -1, b: int = -1, c: int = -1, type: Type = Unit) -> int:
+    flat = self.flat
+    node = len(flat.kinds)
+    flat.kinds.append(kind)
+    flat.files.append(self.string(loc.file))
+    flat.lines.append(loc.line)
+    flat.columns.append(loc.column)
+    flat.types.append(self.type(type))
+    flat.a.append(a)
+    flat.b.append(b)
+    flat.c.append(c)
+    return node
+
+  def literal(self, loc: Location, value: int | bool | None, type: Type = Unit) -> int:
+    self.flat.constants.append(value)
+    return self.add(NodeKind.LITERAL, loc, len(self.flat.constants) - 1, type=type)
+
+  def identifier(self, loc: Location, name: str, type: Type = Unit) -> int:
+    return self.add(NodeKind.IDENTIFIER, loc, self.string(name), type=type)
+
+  def parameter(self, loc: Location, name: str, type: Type) -> int:
+    return self.identifier(loc, name, type)
+
+  def binary_op(self, loc: Location, left: int, op: str, right: int, type: Type = Unit) -> int:
+    return self.add(NodeKind.BINARY_OP, loc, left, self.string(op), right, type)
+
+  def condition(self, loc: Location, con: int, then: int, el: int | None, type: Type = Unit) -> int:
+    return self.add(NodeKind.CONDITION, loc, con, then, -1 if el is None else el, type)
+
+  def function_call(self, loc: Location, name: int, params: list[int], type: Type = Unit) -> int:
+    return self.add(NodeKind.FUNCTION_CALL, loc, name, self.children(params), len(params), type)
+
+  def unary(self, loc: Location, op: str, val: int, type: Type = Unit) -> int:
+    return self.add(NodeKind.UNARY, loc, self.string(op), val, type=type)
+
+  def block(self, loc: Location, content: list[int], val: int, type: Type = Unit) -> int:
+    return self.add(NodeKind.BLOCK, loc, self.children(content), len(content), val, type)
+
+  def declaration(self, loc: Location, name: int, val: int, declared_type: Type | None, type: Type = Unit) -> int:
+    declared = -1 if declared_type is None else self.type(declared_type)
+    return self.add(NodeKind.DECLARATION, loc, name, val, declared, type)
+
+  def loop(self, loc: Location, condition: int, do: int, type: Type = Unit) -> int:
+    return self.add(NodeKind.LOOP, loc, condition, do, type=type)
+
+  def return_(self, loc: Location, val: int, type: Type = Unit) -> int:
+    return self.add(NodeKind.RETURN, loc, val, type=type)
+
+  def function_definition(self, name: int, type: Type, params: list[int], body: int) -> int:
+    start = self.children(params + [body])
+    return self.add(NodeKind.FUNCTION_DEFINITION, self.location(name), name, start, len(params), type)
+
+  def module(self, funcs: list[int], body: int) -> FlatModule:
+    self.flat.funcs.extend(funcs)
+    self.flat.body = body
+    return self.flat
+
+  def location(self, node: int) -> Location:
+    return self.flat.location(node)
+
+
+def parse_flat(tokens: Iterable[Token]) -> FlatModule:
+  '''Parses tokens directly into a FlatModule.'''
+  return run(Parser(tokens, FlatBuilder()).parse_module())
+
+def from_module(module: ast.Module) -> FlatModule:
+  '''Converts a compiler.ast tree into a FlatModule, keeping the types
+  that have been stored on the nodes.'''
+  build = FlatBuilder()
+
+  def flatten(node: ast.Expression) -> Step[int]:
+    loc = node.location
+    t = node.type
+    match node:
+      case ast.Literal():
+        return build.literal(loc, node.value, t)
+      case ast.Identifier():
+        return build.identifier(loc, node.name, t)
+      case ast.BinaryOp():
+        left = yield flatten(node.left)
+        right = yield flatten(node.right)
+        return build.binary_op(loc, left, node.op, right, t)
+      case ast.Condition():
+        con = yield flatten(node.con)
+        then = yield flatten(node.then)
+        el = None if node.el is None else (yield flatten(node.el))
+        return build.condition(loc, con, then, el, t)
+      case ast.FunctionCall():
+        name = yield flatten(node.name)
+        params = []
+        for param in node.params:
+          params.append((yield flatten(param)))
+        return build.function_call(loc, name, params, t)
+      case ast.Unary():
+        val = yield flatten(node.val)
+        return build.unary(loc, node.op, val, t)
+      case ast.Block():
+        content = []
+        for expr in node.content:
+          content.append((yield flatten(expr)))
+        val = yield flatten(node.val)
+        return build.block(loc, content, val, t)
+      case ast.Declaration():
+        name = yield flatten(node.name)
+        val = yield flatten(node.val)
+        return build.declaration(loc, name, val, node.declared_type, t)
+      case ast.Loop():
+        condition = yield flatten(node.condition)
+        do = yield flatten(node.do)
+        return build.loop(loc, condition, do, t)
+      case ast.Return():
+        val = yield flatten(node.val)
+        return build.return_(loc, val, t)
+    raise Exception(f'{loc}: Unknown node {type(node).__name__}')
+
+  def flatten_module() -> Step[FlatModule]:
+    funcs = []
+    for func in module.funcs:
+      name = yield flatten(func.name)
+      params = []
+      for param in func.params:
+        params.append((yield flatten(param)))
+      body = yield flatten(func.body)
+      funcs.append(build.function_definition(name, func.type, params, body))
+    body = yield flatten(module.body)
+    return build.module(funcs, body)
+
+  return run(flatten_module())
+
+def to_module(flat: FlatModule) -> ast.Module:
+  '''Converts a FlatModule into a compiler.ast tree.'''
+  # The children of a node are always created before the node itself
+  nodes: list[ast.Expression] = []
+  functions: dict[int, ast.FunctionDefinition] = {}
+  kinds, a, b, c = flat.kinds, flat.a, flat.b, flat.c
+  strings, type_table = flat.strings, flat.type_table
+
+  def children(start: int, length: int) -> list[ast.Expression]:
+    return [nodes[child] for child in flat.children[start:start + length]]
+
+  for i in range(len(flat)):
+    kind = kinds[i]
+    loc = flat.location(i)
+    t = type_table[flat.types[i]]
+    node: ast.Expression
+    if kind == NodeKind.LITERAL:
+      node = ast.Literal(loc, flat.constants[a[i]], type=t)
+    elif kind == NodeKind.IDENTIFIER:
+      node = ast.Identifier(loc, strings[a[i]], type=t)
+    elif kind == NodeKind.BINARY_OP:
+      node = ast.BinaryOp(loc, nodes[a[i]], strings[b[i]], nodes[c[i]], type=t)
+    elif kind == NodeKind.CONDITION:
+      node = ast.Condition(loc, nodes[a[i]], nodes[b[i]], None if c[i] < 0 else nodes[c[i]], type=t)
+    elif kind == NodeKind.FUNCTION_CALL:
+      name = nodes[a[i]]
+      assert isinstance(name, ast.Identifier)
+      node = ast.FunctionCall(loc, name, children(b[i], c[i]), type=t)
+    elif kind == NodeKind.UNARY:
+      node = ast.Unary(loc, strings[a[i]], nodes[b[i]], type=t)
+    elif kind == NodeKind.BLOCK:
+      node = ast.Block(loc, children(a[i], b[i]), nodes[c[i]], type=t)
+    elif kind == NodeKind.DECLARATION:
+      name = nodes[a[i]]
+      assert isinstance(name, ast.Identifier)
+      declared_type = None if c[i] < 0 else type_table[c[i]]
+      node = ast.Declaration(loc, name, nodes[b[i]], declared_type, type=t)
+    elif kind == NodeKind.LOOP:
+      node = ast.Loop(loc, nodes[a[i]], nodes[b[i]], type=t)
+    elif kind == NodeKind.RETURN:
+      node = ast.Return(loc, nodes[a[i]], type=t)
+    else:
+      name = nodes[a[i]]
+      params = children(b[i], c[i])
+      assert isinstance(name, ast.Identifier)
+      assert all(isinstance(param, ast.Identifier) for param in params)
+      body = nodes[flat.children[b[i] + c[i]]]
+      functions[i] = ast.FunctionDefinition(name, t, params, body) # type: ignore[arg-type]
+      # Function definitions are never children of expressions
+      node = body
+    nodes.append(node)
+
+  return ast.Module([functions[i] for i in flat.funcs], nodes[flat.body])
@@ -0,0 +1,182 @@
+from dataclasses import dataclass
+from hashlib import sha256
+from threading import Lock
+from compiler import ast, ir
+from compiler.assembly_generator import generate_assembly, generate_function_assembly
+from compiler.binder import bind
+from compiler.ir_generator import generate_ir
+from compiler.location import Location
+from compiler.parser import Parser, TreeBuilder, function_spans, parse, parse_function
+from compiler.root_types import root_types
+from compiler.token import TokenStream
+from compiler.tokenizer import tokenize_compact
+from compiler.trampoline import run
+from compiler.type_checker import typecheck
+from compiler.types import FunType, Type, TypeTab
+
+@dataclass
+class CachedFunction:
+  # The bound and typed definition
+  definition: ast.FunctionDefinition
+  # The key of the function in the output of generate_ir, and its IR
+  key: tuple
+  ins: list[ir.Instruction]
+  # The globals the body refers to, with the slots and types they had
+  # when the function was compiled
+  dependencies: dict[str, tuple[int, Type | FunType]]
+  # Generated when the function is first compiled to assembly
+  assembly: list[str] | None = None
+
+class CompilationCache:
+  '''Compiles modules, reusing the results for functions that have
+  already been compiled.
+
+  Functions are looked up by a hash of their source text. A cached
+  function is only reused if the globals it refers to still have the
+  same types, so changing the signature of a function recompiles the
+  functions that call it. If only the slots of the globals have moved,
+  the body is bound again but not type checked or generated. The
+  locations in the reused IR are from where the function was when it
+  was compiled.
+
+  Only successful compilations are stored. Compilations that share a
+  cache can run in parallel threads: only the lookups and the updates
+  of the cache hold its lock. The cache is kept in memory, so processes
+  forked to compile don't share what they add to it.'''
+  def __init__(self, max_functions: int = 10000) -> None:
+    self.max_functions = max_functions
+    # By the hash of the source, least recently used first
+    self.functions: dict[bytes, CachedFunction] = {}
+    self.hits = 0
+    self.misses = 0
+    self.lock = Lock()
+
+  def compile_to_assembly(self, source_code: str) -> str:
+    entries, main = self.compile_functions(tokenize_compact(source_code))
+    by_key = {entry.key: entry for entry in entries}
+
+    def function_assembly(key: tuple, ins: list[ir.Instruction]) -> list[str]:
+      entry = by_key.get(key)
+      if entry is None:
+        return generate_function_assembly(key, ins)
+      if entry.assembly is None:
+        # Another compilation can generate the same lines at the same time
+        entry.assembly = generate_function_assembly(key, ins)
+      return entry.assembly
+
+    return generate_assembly(ir_of(entries, main), function_assembly)
+
+  def compile_ir(self, source_code: str) -> dict[tuple, list[ir.Instruction]]:
+    return ir_of(*self.compile_functions(tokenize_compact(source_code)))
+
+  def compile_functions(self, tokens: TokenStream) -> tuple[list[CachedFunction], list[ir.Instruction]]:
+    '''Returns the cache entries of the functions of the module,
+    and the IR of the body.
+
+    The entries in the cache are never changed, as other compilations
+    can be reading them: the ones that were reused are replaced with
+    new ones at the end.'''
+    spans, body_start = function_spans(tokens)
+    if not spans:
+      # Nothing to reuse
+      return [], generate_ir(root_types, checked(parse(tokens)))[('main', ())]
+
+    source = tokens.source
+    hashes = []
+    for first, last in spans:
+      end = tokens.starts[last - 1] + tokens.lengths[last - 1]
+      hashes.append(sha256(source[tokens.starts[first]:end].encode()).digest())
+    with self.lock:
+      entries = [self.functions.get(digest) for digest in hashes]
+
+    funcs = []
+    for (first, last), entry in zip(spans, entries):
+      if entry is None:
+        funcs.append(parse_function(tokens, (first, last)))
+      else:
+        # The same source can be at a different place in the module
+        cached = entry.definition
+        name = tokens[first + 1]
+        funcs.append(ast.FunctionDefinition(
+          ast.Identifier(name.loc, name.text),
+          cached.type,
+          cached.params,
+          cached.body,
+          frame_size=cached.frame_size
+        ))
+
+    if body_start < len(tokens):
+      body = run(Parser(tokens.tokens(body_start, len(tokens)), TreeBuilder()).parse_module()).body
+    else:
+      # Same as the body of a module with only functions
+      body = ast.Literal(Location('f',-1,-1), None)
+
+    # The slots and types the globals will have in this module
+    builtins = list(TypeTab.locals)
+    slots: dict[str, int] = {}
+    types: dict[str, Type | FunType] = dict(TypeTab.locals)
+    for slot, name in enumerate(builtins):
+      slots[name] = slot
+    for slot, f in enumerate(funcs, len(builtins)):
+      slots[f.name.name] = slot
+      types[f.name.name] = FunType(tuple(p.type for p in f.params), f.type)
+
+    changed = []
+    rebound = []
+    for i, (f, entry) in enumerate(zip(funcs, entries)):
+      if entry is None:
+        changed.append(f)
+        continue
+      # Binding and type checking change the tree, which other
+      # compilations can be reading, so it is parsed again
+      dependencies = entry.dependencies.items()
+      if any(types.get(name) != t for name, (_, t) in dependencies):
+        funcs[i] = parse_function(tokens, spans[i])
+        changed.append(funcs[i])
+        entries[i] = None
+      elif any(slots[name] != slot for name, (slot, _) in dependencies):
+        funcs[i] = parse_function(tokens, spans[i])
+        rebound.append(funcs[i])
+
+    module = ast.Module(funcs, body)
+    used = bind(module, builtins, changed + rebound)
+    typecheck(module, TypeTab, changed)
+    output = generate_ir(root_types, module, changed)
+
+    # The results are stored only now that the whole module has compiled
+    generated = iter(output.items())
+    compiled = []
+    for f, entry in zip(funcs, entries):
+      if entry is None:
+        key, ins = next(generated)
+        new = CachedFunction(f, key, ins, {})
+      else:
+        new = CachedFunction(f, entry.key, entry.ins, entry.dependencies, entry.assembly)
+      if f.name.name in used:
+        new.dependencies = {
+          name: (slots[name], types[name]) for name in used[f.name.name]
+        }
+      compiled.append(new)
+
+    with self.lock:
+      for digest, entry, new in zip(hashes, entries, compiled):
+        if entry is None:
+          self.misses += 1
+        else:
+          self.hits += 1
+        # Moved to the end as the most recently used
+        self.functions.pop(digest, None)
+        self.functions[digest] = new
+      while len(self.functions) > self.max_functions:
+        del self.functions[next(iter(self.functions))]
+    return compiled, output[('main', ())]
+
+def ir_of(entries: list[CachedFunction], main: list[ir.Instruction]) -> dict[tuple, list[ir.Instruction]]:
+  result = {entry.key: entry.ins for entry in entries}
+  result[('main', ())] = main
+  return result
+
+def checked(module: ast.Module) -> ast.Module:
+  bind(module, TypeTab.locals)
+  typecheck(module, TypeTab)
+  return module
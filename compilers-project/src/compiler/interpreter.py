@@ -1,87 +1,712 @@
-from typing import Any, Callable
+import operator
+import sys
+from typing import Any, Callable, TextIO
 from compiler import ast
-from compiler.symtab import SymTab
+from compiler.symtab import SymTab, TopTab
+from compiler.binder import Frames, bind, global_depth
+from compiler.bytecode import divide, read_int, remainder
+from compiler.profiler import Profiler
+from compiler.trampoline import Step, run
+from compiler.visitor import Visitor, visits
 
 type Value = int | bool | None | Callable
 
-def interperet(node: ast.Expression, symtab: SymTab) -> Value:
-  match node:
-    case ast.Literal():
-      return node.value
-    
-    case ast.BinaryOp():
-      tab = symtab
-
-      if node.op == '=':
-        identifier: Any = node.left
-
-        while identifier.name not in tab.locals.keys():
-          if tab.parent:
-            tab = tab.parent
-          else:
-            raise Exception(f'Cannot assign value to undeclared variable {identifier.name}')
-
-        tab.locals[identifier.name] = interperet(node.right, symtab)
-        return tab.locals[identifier.name]
-
-      a: Any = interperet(node.left, symtab)
-      if node.op == 'or' and a:
-        return True
-
-      if node.op == 'and' and not a:
-        return False
-      
-      b: Any = interperet(node.right,symtab)
-      while node.op not in tab.locals.keys():
-        if tab.parent:
-          tab = tab.parent
-        else:
-          raise NotImplemented
-      return tab.locals[node.op](a, b)
-      
-    case ast.Condition():
-      if interperet(node.con, symtab):
-        return interperet(node.then, symtab)
-      else:
-        if node.el is not None:
-          return interperet(node.el,symtab)
-        return None
-      
-    case ast.Declaration():
-      symtab.locals[node.name.name] = interperet(node.val, symtab)
+# A compiled expression: evaluates it in the given frames
+type Closure = Callable[[Frames], Value]
+
+# The same operations as the operators of TopTab, as functions
+# that are faster to call
+python_operators: dict[str, Callable] = {
+  '+': operator.add, '-': operator.sub, '*': operator.mul,
+  '/': operator.truediv, '%': operator.mod,
+  '==': operator.eq, '!=': operator.ne,
+  '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge,
+  'unary_-': operator.neg, 'unary_not': operator.not_,
+}
+fast_operators: dict[Any, Callable] = {
+  TopTab.require(name): f for name, f in python_operators.items()
+}
+
+# A compiled expression of a module: evaluates it in the frame of the
+# function call it runs in
+type Frame = list[Value]
+type FrameClosure = Callable[[Frame], Value]
+
+# Slot 0 of a frame tells whether a break, continue or return is
+# leaving the expressions that enclose it
+running = 0
+breaking = 1
+continuing = 2
+returning = 3
+
+# Deeper subtrees are run by the tree interpreter, because running
+# nested closures uses the Python stack
+max_closure_depth = 200
+
+def interperet(node: ast.Expression, symtab: SymTab, compile: bool = False) -> Value:
+  '''Evaluates the expression. If 'compile' is set, it is first
+  compiled into closures, which is faster for anything with loops.'''
+  names = symtab.flatten()
+  module = ast.Module([], node)
+  bind(module, names)
+  assert module.globals is not None
+  global_frame = [names[name] for name in module.globals]
+  frames = [global_frame, [None] * module.frame_size]
+  if compile:
+    return run(ClosureCompiler(names).visit(node, 0))(frames)
+  return run(Interpreter(names).visit(node, frames))
+
+def interperet_module(
+  module: ast.Module,
+  stdin: TextIO = sys.stdin,
+  stdout: TextIO = sys.stdout,
+  profiler: Profiler | None = None
+) -> Value:
+  '''Runs a module and returns the value of its body. Division and
+  the built-in functions work like in the compiled program, but
+  integers don't wrap around.
+
+  If a 'profiler' is given, the run times of the nodes are recorded in
+  it. Otherwise the module runs without any profiling code.'''
+  names = module_names(stdin, stdout)
+  if module.globals is None:
+    bind(module, names)
+  assert module.globals is not None
+  if profiler is None:
+    compiler = FrameCompiler(names, module.globals)
+  else:
+    compiler = ProfilingCompiler(names, module.globals, profiler)
+  return compiler.run_module(module)
+
+def module_names(stdin: TextIO, stdout: TextIO) -> dict[str, Value]:
+  def print_int(value: int) -> None:
+    stdout.write(f'{value}\n')
+
+  def print_bool(value: bool) -> None:
+    stdout.write('true\n' if value else 'false\n')
+
+  names: dict[str, Value] = dict(TopTab.locals)
+  names.update({
+    '/': divide,
+    '%': remainder,
+    'print_int': print_int,
+    'print_bool': print_bool,
+    'read_int': lambda: read_int(stdin),
+    # Compiled into jumps
+    'break': None,
+    'continue': None,
+  })
+  return names
+
+class Interpreter(Visitor[Frames, Value]):
+  '''Evaluates bound expressions. The values of the variables are kept
+  in frames indexed by the slots given by compiler.binder.'''
+  def __init__(self, names: dict[str, Value]) -> None:
+    # Operators are not bound, so they are still looked up by name
+    self.operators = names
+
+  def operator(self, node: ast.Expression, op: str) -> Any:
+    if op not in self.operators:
+      raise Exception(f'{node.location}: {op} not defined')
+    return self.operators[op]
+  @visits(ast.Literal)
+  def literal(self, node: ast.Literal, frames: Frames) -> Value:
+    return node.value
+
+  @visits(ast.BinaryOp)
+  def binary_op(self, node: ast.BinaryOp, frames: Frames) -> Step[Value]:
+    if node.op == '=':
+      identifier = node.left
+      if not isinstance(identifier, ast.Identifier):
+        raise Exception(f'{node.location}: Cannot assign value to {identifier}')
+
+      value = yield self.visit(node.right, frames)
+      frames[identifier.depth][identifier.slot] = value
+      return value # type: ignore[no-any-return]
+
+    a: Any = yield self.visit(node.left, frames)
+    if node.op == 'or' and a:
+      return True
+
+    if node.op == 'and' and not a:
+      return False
+
+    b: Any = yield self.visit(node.right, frames)
+    return self.operator(node, node.op)(a, b) # type: ignore[no-any-return]
+
+  @visits(ast.Condition)
+  def condition(self, node: ast.Condition, frames: Frames) -> Step[Value]:
+    if (yield self.visit(node.con, frames)):
+      return (yield self.visit(node.then, frames))
+    else:
+      if node.el is not None:
+        return (yield self.visit(node.el, frames))
       return None
 
-    case ast.Block():
-      local_sym = SymTab['str']({}, symtab)
-      for expr in node.content:
-        interperet(expr, local_sym)
-      return interperet(node.val, local_sym)
-        
-    case ast.Identifier():
-      tab = symtab
-      while node.name not in tab.locals.keys():
-        if tab.parent:
-          tab = tab.parent
-        else:
-          raise Exception(f'{node.location}: {node.name} not defined')
-      return symtab.locals[node.name]
-    
-    case ast.Unary():
-      tab = symtab
-      a = interperet(node.val, symtab)
-      while node.op not in tab.locals.keys():
-        if tab.parent:
-          tab = tab.parent
-        else:
-          raise NotImplemented
-      return tab.locals[f'unary_{node.op}'](a)
-    
-    case ast.Loop():
-      while interperet(node.condition, symtab):
-        result = interperet(node.do, symtab)
+  @visits(ast.Declaration)
+  def declaration(self, node: ast.Declaration, frames: Frames) -> Step[Value]:
+    frames[node.name.depth][node.name.slot] = yield self.visit(node.val, frames)
+    return None
+
+  @visits(ast.Block)
+  def block(self, node: ast.Block, frames: Frames) -> Step[Value]:
+    frames.append([None] * node.frame_size)
+    for expr in node.content:
+      yield self.visit(expr, frames)
+    value = yield self.visit(node.val, frames)
+    frames.pop()
+    return value # type: ignore[no-any-return]
+
+  @visits(ast.Identifier)
+  def identifier(self, node: ast.Identifier, frames: Frames) -> Value:
+    return frames[node.depth][node.slot] # type: ignore[no-any-return]
+
+  @visits(ast.Unary)
+  def unary(self, node: ast.Unary, frames: Frames) -> Step[Value]:
+    a = yield self.visit(node.val, frames)
+    return self.operator(node, f'unary_{node.op}')(a) # type: ignore[no-any-return]
+
+  @visits(ast.Loop)
+  def loop(self, node: ast.Loop, frames: Frames) -> Step[Value]:
+    result = None
+    while (yield self.visit(node.condition, frames)):
+      result = yield self.visit(node.do, frames)
 
+    return result
+
+
+class ClosureCompiler(Visitor[int, Closure]):
+  '''Compiles bound expressions into closures that evaluate them in
+  the frames used by Interpreter. The slots and operators are resolved
+  once, when compiling, instead of on every evaluation.
+
+  The context is the depth of the node in the tree.'''
+  def __init__(self, names: dict[str, Value]) -> None:
+    self.operators = names
+    self.interpreter = Interpreter(names)
+
+  def visit(self, node: ast.Expression, depth: int) -> Step[Closure]:
+    if depth > max_closure_depth:
+      interpreter = self.interpreter
+      return lambda frames: run(interpreter.visit(node, frames)) # type: ignore[return-value]
+    return super().visit(node, depth)
+
+  def operator(self, node: ast.Expression, op: str) -> Any:
+    if op not in self.operators:
+      # Undefined operators are reported when evaluated, like in Interpreter
+      def undefined(*args: Value) -> Value:
+        raise Exception(f'{node.location}: {op} not defined')
+      return undefined
+    f = self.operators[op]
+    return fast_operators.get(f, f)
+
+  @visits(ast.Literal)
+  def literal(self, node: ast.Literal, depth: int) -> Closure:
+    value = node.value
+    return lambda frames: value
+
+  @visits(ast.Identifier)
+  def identifier(self, node: ast.Identifier, depth: int) -> Closure:
+    d, slot = node.depth, node.slot
+    return lambda frames: frames[d][slot] # type: ignore[no-any-return]
+
+  @visits(ast.BinaryOp)
+  def binary_op(self, node: ast.BinaryOp, depth: int) -> Step[Closure]:
+    if node.op == '=':
+      identifier = node.left
+      if not isinstance(identifier, ast.Identifier):
+        raise Exception(f'{node.location}: Cannot assign value to {identifier}')
+      d, slot = identifier.depth, identifier.slot
+      right: Closure = yield self.visit(node.right, depth + 1)
+
+      def assign(frames: Frames) -> Value:
+        value = frames[d][slot] = right(frames)
+        return value
+      return assign
+
+    left: Closure = yield self.visit(node.left, depth + 1)
+    right = yield self.visit(node.right, depth + 1)
+    op = self.operator(node, node.op)
+    if node.op == 'or':
+      def or_(frames: Frames) -> Value:
+        a = left(frames)
+        return True if a else op(a, right(frames)) # type: ignore[no-any-return]
+      return or_
+
+    if node.op == 'and':
+      def and_(frames: Frames) -> Value:
+        a = left(frames)
+        return op(a, right(frames)) if a else False # type: ignore[no-any-return]
+      return and_
+
+    # Skips the calls of the operands for the common 'a + 1' and 'a < b'
+    if isinstance(node.right, ast.Literal):
+      constant = node.right.value
+      if isinstance(node.left, ast.Identifier):
+        d, slot = node.left.depth, node.left.slot
+        return lambda frames: op(frames[d][slot], constant) # type: ignore[no-any-return]
+      return lambda frames: op(left(frames), constant) # type: ignore[no-any-return]
+    if isinstance(node.left, ast.Identifier) and isinstance(node.right, ast.Identifier):
+      d1, slot1 = node.left.depth, node.left.slot
+      d2, slot2 = node.right.depth, node.right.slot
+      return lambda frames: op(frames[d1][slot1], frames[d2][slot2]) # type: ignore[no-any-return]
+    return lambda frames: op(left(frames), right(frames)) # type: ignore[no-any-return]
+
+  @visits(ast.Condition)
+  def condition(self, node: ast.Condition, depth: int) -> Step[Closure]:
+    con: Closure = yield self.visit(node.con, depth + 1)
+    then: Closure = yield self.visit(node.then, depth + 1)
+    if node.el is None:
+      return lambda frames: then(frames) if con(frames) else None
+    el: Closure = yield self.visit(node.el, depth + 1)
+    return lambda frames: then(frames) if con(frames) else el(frames)
+
+  @visits(ast.Declaration)
+  def declaration(self, node: ast.Declaration, depth: int) -> Step[Closure]:
+    val: Closure = yield self.visit(node.val, depth + 1)
+    d, slot = node.name.depth, node.name.slot
+
+    def declare(frames: Frames) -> Value:
+      frames[d][slot] = val(frames)
+      return None
+    return declare
+
+  @visits(ast.Block)
+  def block(self, node: ast.Block, depth: int) -> Step[Closure]:
+    content: list[Closure] = []
+    for expr in node.content:
+      content.append((yield self.visit(expr, depth + 1)))
+    val: Closure = yield self.visit(node.val, depth + 1)
+    size = node.frame_size
+
+    def block(frames: Frames) -> Value:
+      frames.append([None] * size)
+      for expr in content:
+        expr(frames)
+      value = val(frames)
+      frames.pop()
+      return value
+    return block
+
+  @visits(ast.Unary)
+  def unary(self, node: ast.Unary, depth: int) -> Step[Closure]:
+    val: Closure = yield self.visit(node.val, depth + 1)
+    op = self.operator(node, f'unary_{node.op}')
+    return lambda frames: op(val(frames)) # type: ignore[no-any-return]
+
+  @visits(ast.Loop)
+  def loop(self, node: ast.Loop, depth: int) -> Step[Closure]:
+    condition: Closure = yield self.visit(node.condition, depth + 1)
+    do: Closure = yield self.visit(node.do, depth + 1)
+
+    def loop(frames: Frames) -> Value:
+      result = None
+      while condition(frames):
+        result = do(frames)
       return result
-      
-      
-    case _:
-      raise NotImplemented
\ No newline at end of file
+    return loop
+
+
+class FrameCompiler(Visitor[None, FrameClosure]):
+  '''Compiles the functions and body of a bound module into closures.
+
+  Every call gets one frame: a list that holds the parameters and all
+  the variables of the blocks of the function, allocated when the
+  function is called. The variables of sibling blocks share slots.
+  The slots of the globals are resolved when compiling.
+
+  A break, continue or return sets slot 0 of the frame and returns.
+  The expressions around it check the slot only if they contain one.'''
+  def __init__(self, names: dict[str, Value], globals: list[str]) -> None:
+    self.operators = names
+    self.global_frame = [names.get(name) for name in globals]
+    # The compiled body of each function of the module and the
+    # unset variables of its frame, by global slot. Filled in
+    # when the function is compiled.
+    self.functions: dict[int, list[Any]] = {}
+    # The first slot of the frame at each depth, in the function
+    # being compiled, and the first slot after the innermost frame
+    self.offsets: list[int] = []
+    self.end = 0
+    # The size of the frame of the function being compiled
+    self.size = 0
+    # The number of loops around the node being compiled, and the
+    # number of breaks, continues and returns compiled
+    self.loops = 0
+    self.jumps = 0
+
+  def run_module(self, module: ast.Module) -> Value:
+    '''Compiles and runs a module bound with the globals given to
+    the compiler.'''
+    for f in module.funcs:
+      self.functions[f.name.slot] = [None, None]
+    for f in module.funcs:
+      self.global_frame[f.name.slot] = self.function(f)
+    body = self.function_body(module.body, module.frame_size)
+    try:
+      return body([running, *[None] * (self.size - 1)])
+    except RecursionError:
+      raise Exception(f'{module.body.location}: Calls or blocks nested too deep') from None
+
+  def function(self, f: ast.FunctionDefinition) -> Callable[..., Value]:
+    body = self.function_body(f.body, f.frame_size)
+    padding = [None] * (self.size - 1 - len(f.params))
+    self.functions[f.name.slot][:] = body, padding
+    return lambda *args: body([running, *args, *padding])
+
+  def function_body(self, node: ast.Expression, frame_size: int) -> FrameClosure:
+    self.offsets = [0, 1]
+    self.end = self.size = 1 + frame_size
+    self.loops = 0
+    return run(self.visit(node, None))
+
+  def operator(self, node: ast.Expression, op: str) -> Any:
+    if op not in self.operators:
+      def undefined(*args: Value) -> Value:
+        raise Exception(f'{node.location}: {op} not defined')
+      return undefined
+    f = self.operators[op]
+    return fast_operators.get(f, f)
+
+  def compile(self, node: ast.Expression) -> Step[tuple[FrameClosure, bool]]:
+    '''Compiles a child node. Also returns whether it can leave the
+    expression being compiled with a break, continue or return.'''
+    jumps = self.jumps
+    closure = yield self.visit(node, None)
+    return closure, self.jumps != jumps
+
+  @visits(ast.Literal)
+  def literal(self, node: ast.Literal, context: None) -> FrameClosure:
+    value = node.value
+    return lambda frame: value
+
+  @visits(ast.Identifier)
+  def identifier(self, node: ast.Identifier, context: None) -> FrameClosure:
+    if node.depth == global_depth:
+      if node.name in ('break', 'continue'):
+        return self.jump(node)
+      global_frame, slot = self.global_frame, node.slot
+      return lambda frame: global_frame[slot]
+    slot = self.offsets[node.depth] + node.slot
+    return lambda frame: frame[slot]
+
+  def jump(self, node: ast.Identifier) -> FrameClosure:
+    if self.loops == 0:
+      raise Exception(f'{node.location}: {node.name} not allowed outside of a loop')
+    self.jumps += 1
+    signal = breaking if node.name == 'break' else continuing
+
+    def jump(frame: Frame) -> Value:
+      frame[0] = signal
+      return None
+    return jump
+
+  def store(self, name: ast.Identifier, value: FrameClosure, checked: bool) -> FrameClosure:
+    '''Returns a closure that sets the variable to the value. If the
+    value is 'checked', the variable is not set when leaving.'''
+    slot = name.slot
+    if name.depth == global_depth:
+      global_frame = self.global_frame
+      def store_global(frame: Frame) -> Value:
+        result = value(frame)
+        if not (checked and frame[0]):
+          global_frame[slot] = result
+        return result
+      return store_global
+
+    slot += self.offsets[name.depth]
+    if checked:
+      def store_checked(frame: Frame) -> Value:
+        result = value(frame)
+        if not frame[0]:
+          frame[slot] = result
+        return result
+      return store_checked
+
+    def store(frame: Frame) -> Value:
+      result = frame[slot] = value(frame)
+      return result
+    return store
+
+  @visits(ast.BinaryOp)
+  def binary_op(self, node: ast.BinaryOp, context: None) -> Step[FrameClosure]:
+    if node.op == '=':
+      identifier = node.left
+      if not isinstance(identifier, ast.Identifier):
+        raise Exception(f'{node.location}: Cannot assign value to {identifier}')
+      right, jumps = yield self.compile(node.right)
+      return self.store(identifier, right, jumps)
+
+    left, left_jumps = yield self.compile(node.left)
+    right, right_jumps = yield self.compile(node.right)
+    op = self.operator(node, node.op)
+    if left_jumps or right_jumps:
+      short_circuit = node.op in ('or', 'and')
+      is_or = node.op == 'or'
+
+      def checked(frame: Frame) -> Value:
+        a = left(frame)
+        if frame[0]:
+          return a
+        if short_circuit and bool(a) == is_or:
+          return is_or
+        b = right(frame)
+        if frame[0]:
+          return b
+        return op(a, b) # type: ignore[no-any-return]
+      return checked
+
+    if node.op == 'or':
+      def or_(frame: Frame) -> Value:
+        a = left(frame)
+        return True if a else op(a, right(frame)) # type: ignore[no-any-return]
+      return or_
+
+    if node.op == 'and':
+      def and_(frame: Frame) -> Value:
+        a = left(frame)
+        return op(a, right(frame)) if a else False # type: ignore[no-any-return]
+      return and_
+
+    # The common 'a + 1' and 'a < b' read the frame directly
+    if isinstance(node.right, ast.Literal):
+      constant = node.right.value
+      if isinstance(node.left, ast.Identifier) and node.left.depth != global_depth:
+        slot = self.offsets[node.left.depth] + node.left.slot
+        return lambda frame: op(frame[slot], constant) # type: ignore[no-any-return]
+      return lambda frame: op(left(frame), constant) # type: ignore[no-any-return]
+    if (isinstance(node.left, ast.Identifier) and isinstance(node.right, ast.Identifier)
+        and node.left.depth != global_depth and node.right.depth != global_depth):
+      slot1 = self.offsets[node.left.depth] + node.left.slot
+      slot2 = self.offsets[node.right.depth] + node.right.slot
+      return lambda frame: op(frame[slot1], frame[slot2]) # type: ignore[no-any-return]
+    return lambda frame: op(left(frame), right(frame)) # type: ignore[no-any-return]
+
+  @visits(ast.Condition)
+  def condition(self, node: ast.Condition, context: None) -> Step[FrameClosure]:
+    con, jumps = yield self.compile(node.con)
+    then: FrameClosure = yield self.visit(node.then, None)
+    el: FrameClosure | None = None
+    if node.el is not None:
+      el = yield self.visit(node.el, None)
+    if jumps:
+      def checked(frame: Frame) -> Value:
+        c = con(frame)
+        if frame[0]:
+          return c
+        if c:
+          return then(frame)
+        return None if el is None else el(frame)
+      return checked
+    if el is None:
+      return lambda frame: then(frame) if con(frame) else None
+    return lambda frame: then(frame) if con(frame) else el(frame)
+
+  @visits(ast.Declaration)
+  def declaration(self, node: ast.Declaration, context: None) -> Step[FrameClosure]:
+    val, jumps = yield self.compile(node.val)
+    store = self.store(node.name, val, jumps)
+    if jumps:
+      def checked(frame: Frame) -> Value:
+        value = store(frame)
+        return value if frame[0] else None
+      return checked
+
+    def declare(frame: Frame) -> Value:
+      store(frame)
+      return None
+    return declare
+
+  @visits(ast.Block)
+  def block(self, node: ast.Block, context: None) -> Step[FrameClosure]:
+    # The variables of the block follow the variables of the frames
+    # around it
+    start = self.end
+    self.offsets.append(start)
+    self.end += node.frame_size
+    self.size = max(self.size, self.end)
+    jumps = self.jumps
+    content: list[FrameClosure] = []
+    for expr in node.content:
+      content.append((yield self.visit(expr, None)))
+    content_jumps = self.jumps != jumps
+    val: FrameClosure = yield self.visit(node.val, None)
+    self.offsets.pop()
+    self.end = start
+
+    if not content:
+      # Nothing to do on entering the block, as its variables
+      # are already in the frame
+      return val
+    if content_jumps:
+      def checked(frame: Frame) -> Value:
+        for expr in content:
+          value = expr(frame)
+          if frame[0]:
+            return value
+        return val(frame)
+      return checked
+
+    def block(frame: Frame) -> Value:
+      for expr in content:
+        expr(frame)
+      return val(frame)
+    return block
+
+  @visits(ast.Unary)
+  def unary(self, node: ast.Unary, context: None) -> Step[FrameClosure]:
+    val, jumps = yield self.compile(node.val)
+    op = self.operator(node, f'unary_{node.op}')
+    if jumps:
+      def checked(frame: Frame) -> Value:
+        a = val(frame)
+        return a if frame[0] else op(a)
+      return checked
+    return lambda frame: op(val(frame)) # type: ignore[no-any-return]
+
+  @visits(ast.Loop)
+  def loop(self, node: ast.Loop, context: None) -> Step[FrameClosure]:
+    condition, condition_jumps = yield self.compile(node.condition)
+    self.loops += 1
+    jumps = self.jumps
+    do: FrameClosure = yield self.visit(node.do, None)
+    self.loops -= 1
+    if condition_jumps or self.jumps != jumps:
+      def checked(frame: Frame) -> Value:
+        result = None
+        while True:
+          c = condition(frame)
+          if frame[0]:
+            return c
+          if not c:
+            return result
+          result = do(frame)
+          signal = frame[0]
+          if signal:
+            if signal == returning:
+              return result
+            frame[0] = running
+            if signal == breaking:
+              return None
+      return checked
+
+    def loop(frame: Frame) -> Value:
+      result = None
+      while condition(frame):
+        result = do(frame)
+      return result
+    return loop
+
+  @visits(ast.Return)
+  def return_(self, node: ast.Return, context: None) -> Step[FrameClosure]:
+    val: FrameClosure = yield self.visit(node.val, None)
+    self.jumps += 1
+
+    def return_(frame: Frame) -> Value:
+      value = val(frame)
+      frame[0] = returning
+      return value
+    return return_
+
+  @visits(ast.FunctionCall)
+  def function_call(self, node: ast.FunctionCall, context: None) -> Step[FrameClosure]:
+    name = node.name
+    f: FrameClosure = yield self.visit(name, None)
+    args: list[FrameClosure] = []
+    jumps = self.jumps
+    for param in node.params:
+      args.append((yield self.visit(param, None)))
+
+    if self.jumps != jumps:
+      def checked(frame: Frame) -> Value:
+        values = []
+        for arg in args:
+          value = arg(frame)
+          if frame[0]:
+            return value
+          values.append(value)
+        return f(frame)(*values) # type: ignore[operator, misc]
+      return checked
+
+    # Functions of the module are looked up when called, so they can be
+    # compiled in any order. Their bodies are run directly in a new
+    # frame, as every Python call adds to the time of a call.
+    function = self.functions.get(name.slot) if name.depth == global_depth else None
+    if function is not None:
+      if len(args) == 1:
+        (arg,) = args
+        return lambda frame: function[0]([running, arg(frame), *function[1]]) # type: ignore[no-any-return]
+      if len(args) == 2:
+        arg1, arg2 = args
+        return lambda frame: function[0]([running, arg1(frame), arg2(frame), *function[1]]) # type: ignore[no-any-return]
+      return lambda frame: function[0]([running, *[arg(frame) for arg in args], *function[1]]) # type: ignore[no-any-return]
+    return lambda frame: f(frame)(*[arg(frame) for arg in args]) # type: ignore[operator, misc]
+
+
+def describe(node: ast.Expression) -> str:
+  match node:
+    case ast.BinaryOp() | ast.Unary():
+      return f'{type(node).__name__} {node.op}'
+    case ast.Identifier():
+      return f'Identifier {node.name}'
+    case ast.FunctionCall():
+      return f'FunctionCall {node.name.name}'
+    case ast.Literal():
+      return f'Literal {node.value}'
+  return type(node).__name__
+
+class ProfilingCompiler(FrameCompiler):
+  '''A FrameCompiler whose closures record how many times each node
+  runs and how long it takes, and how long each stack of function
+  calls takes.'''
+  def __init__(self, names: dict[str, Value], globals: list[str], profiler: Profiler) -> None:
+    super().__init__(names, globals)
+    self.profiler = profiler
+    # The function being compiled
+    self.function_name = 'main'
+
+  def visit(self, node: ast.Expression, context: None) -> Step[FrameClosure]:
+    closure: FrameClosure = yield super().visit(node, context)
+    profiler = self.profiler
+    clock = profiler.clock
+    stats = profiler.stats(node.location, describe(node))
+
+    def profiled(frame: Frame) -> Value:
+      stats.count += 1
+      outer = profiler.children
+      profiler.children = 0.0
+      start = clock()
+      value = closure(frame)
+      elapsed = clock() - start
+      stats.total += elapsed
+      stats.own += elapsed - profiler.children
+      profiler.children = outer + elapsed
+      return value
+    return profiled
+
+  def function(self, f: ast.FunctionDefinition) -> Callable[..., Value]:
+    self.function_name = f.name.name
+    function = super().function(f)
+    self.function_name = 'main'
+    return function
+
+  def function_body(self, node: ast.Expression, frame_size: int) -> FrameClosure:
+    body = super().function_body(node, frame_size)
+    profiler = self.profiler
+    clock = profiler.clock
+    stacks = profiler.stacks
+    name = self.function_name
+
+    def profiled(frame: Frame) -> Value:
+      outer_stack = profiler.stack
+      outer_callees = profiler.callees
+      stack = profiler.stack = f'{outer_stack};{name}' if outer_stack else name
+      profiler.callees = 0.0
+      start = clock()
+      value = body(frame)
+      elapsed = clock() - start
+      stacks[stack] = stacks.get(stack, 0.0) + elapsed - profiler.callees
+      profiler.stack = outer_stack
+      profiler.callees = outer_callees + elapsed
+      return value
+    return profiled
@@ -76,4 +76,12 @@ class CondJump(Instruction):
 @dataclass(frozen=True)
 class Return(Instruction):
     """Returns a value."""
-    source: IRVar
\ No newline at end of file
+    source: IRVar
+
+@dataclass(frozen=True)
+class Phi(Instruction):
+    """Copies the source from the predecessor the block was entered from
+    to `dest`. The sources are in the order of the predecessors.
+    Only used in SSA form, at the start of basic blocks."""
+    sources: list[IRVar]
+    dest: IRVar
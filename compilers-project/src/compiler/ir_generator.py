@@ -1,245 +1,63 @@
 # src/compiler/ir_generator.py
 
+from typing import Iterable, Mapping
 from compiler import ast, ir
 from compiler.symtab import SymTab
+from compiler.binder import Frames, bind
 from compiler.types import Bool, Int, Type, Unit
 from compiler.location import Location, L
+from compiler.trampoline import Step, run
+from compiler.visitor import Visitor, visits
 
 def generate_ir(
     # 'root_types' parameter should map all global names
     # like 'print_int' and '+' to their types.
-    root_types: dict[ir.IRVar, Type],
-    root_module: ast.Module
+    root_types: Mapping[ir.IRVar, Type],
+    root_module: ast.Module,
+    # Only these functions are generated, if given.
+    # The body of the module is always generated.
+    functions: Iterable[ast.FunctionDefinition] | None = None
 ) -> dict[tuple, list[ir.Instruction]]:
-    var_types: dict[ir.IRVar, Type] = root_types.copy()
+    gen = new_generator(root_types)
+    var_unit = gen.var_unit
 
-    # 'var_unit' is used when an expression's type is 'Unit'.
-    var_unit = ir.IRVar('unit')
-    var_types[var_unit] = Unit
-    
-    unit_label = ir.Label(L, 'UnitLabel')
-    
-    in_loop_start: ir.Label = unit_label
-    in_loop_end: ir.Label = unit_label
-    label_num = 1
-    var_num = 1
+    # Variables are found by the slots given by the binder.
+    # The global frame holds the built-ins and the functions.
+    if root_module.globals is None:
+        bind(root_module, gen.root_symtab.locals)
+    assert root_module.globals is not None
+    global_frame = [ir.IRVar(name) for name in root_module.globals]
 
-    def new_var(t: Type) -> ir.IRVar:
-        nonlocal var_num
-        # Create a new unique IR variable and
-        # add it to var_types
-        var = ir.IRVar(f'x{var_num}')
-        var_num += 1
-        var_types[var] = t
-        return var
+    output = {}
     
-    def new_label(loc: Location) -> ir.Label:
-        nonlocal label_num
-        label = ir.Label(loc, f'L{label_num}')
-        label_num += 1
-        return label
+    for f in root_module.funcs if functions is None else functions:
+        key, ins = gen.function(f, global_frame)
+        output[key] = ins
 
-    # We collect the IR instructions that we generate
-    # into this list.
-    ins: list[ir.Instruction] = []
+    gen.var_num = 1
+    gen.label_num = 1
+    gen.label_prefix = ''
+    ins = gen.ins
+    var_types = gen.var_types
+    # Start visiting the AST from the root.
+    var_final_result = run(gen.visit(root_module.body, [global_frame, [var_unit] * root_module.frame_size]))
+
+    if var_types[var_final_result] == Int:
+        ins.append(ir.Call(
+            root_module.body.location, ir.IRVar('print_int'), [var_final_result], gen.new_var(var_types[var_final_result])
+        ))
+    elif var_types[var_final_result] == Bool:
+        ins.append(ir.Call(
+            root_module.body.location, ir.IRVar('print_bool'), [var_final_result], gen.new_var(var_types[var_final_result])
+        ))
+    if root_module.body.type == Unit:
+        ins.append(ir.Return(root_module.body.location, var_unit))
+    output[('main', ())] = ins
+
+    return output
 
-    # This function visits an AST node,
-    # appends IR instructions to 'ins',
-    # and returns the IR variable where
-    # the emitted IR instructions put the result.
-    #
-    # It uses a symbol table to map local variables
-    # (which may be shadowed) to unique IR variables.
-    # The symbol table will be updated in the same way as
-    # in the interpreter and type checker.
-    def visit(st: SymTab[ir.IRVar], expr: ast.Expression) -> ir.IRVar:
-        loc = expr.location
-        nonlocal in_loop_start
-        nonlocal in_loop_end
-
-        match expr:
-            case ast.Literal():
-                # Create an IR variable to hold the value,
-                # and emit the correct instruction to
-                # load the constant value.
-                match expr.value:
-                    case bool():
-                        var = new_var(Bool)
-                        ins.append(ir.LoadBoolConst(
-                            loc, expr.value, var))
-                    case int():
-                        var = new_var(Int)
-                        ins.append(ir.LoadIntConst(
-                            loc, expr.value, var))
-                    case None:
-                        var = var_unit
-                    case _:
-                        raise Exception(f"{loc}: unsupported literal: {type(expr.value)}")
-
-                # Return the variable that holds
-                # the loaded value.
-                return var
-
-            case ast.Identifier():
-                # Look up the IR variable that corresponds to
-                # the source code variable.
-
-                if expr.name in ('break', 'continue') and in_loop_start.name == 'unit_label':
-                    raise Exception(f"{expr.name} not allowed outside of a loop")
-
-                elif expr.name == 'break':
-                    ins.append(ir.Jump(loc, in_loop_end))
-                
-                elif expr.name == 'continue':
-                    ins.append(ir.Jump(loc, in_loop_start))
-
-                return st.require(expr.name)
-            
-            case ast.BinaryOp():
-                # Recursively emit instructions to calculate the operands.
-                var_left = visit(st, expr.left)
-                if expr.op in ['or', 'and']:
-                    l_right = new_label(loc)
-                    l_skip = new_label(loc)
-                    l_end = new_label(loc)
-                    if expr.op == 'or':
-                        ins.append(ir.CondJump(loc, var_left, l_skip, l_right))
-                    elif expr.op == 'and':
-                        ins.append(ir.CondJump(loc, var_left, l_right, l_skip))
-                    ins.append(l_right)
-                    var_rigth = visit(st, expr.right)
-                    var_result = new_var(expr.right.type)
-                    ins.append(ir.Copy(loc, var_rigth, var_result))
-                    ins.append(ir.Jump(loc, l_end))
-                    ins.append(l_skip)
-                    ins.append(ir.LoadBoolConst(loc, expr.op == 'or', var_result))
-                    ins.append(l_end)
-                    return var_result
-                    
-
-                var_right = visit(st, expr.right)
-                # Generate variable to hold the result.
-                # Emit a Call instruction that writes to that variable.
-                if expr.op == '=':
-                    if not isinstance(expr.left, ast.Identifier):
-                        raise Exception
-                    ins.append(ir.Copy(
-                        loc, var_right, var_left))
-                    return var_right
-
-                var_result = new_var(expr.type)
-                # Ask the symbol table to return the variable that refers
-                # to the operator to call.
-                var_op = st.require(expr.op)
-                ins.append(ir.Call(
-                    loc, var_op, [var_left, var_right], var_result))
-                return var_result
-
-            # Other AST node cases (see below)
-            
-            case ast.Condition():
-                if expr.el is None:
-                    # Create (but don't emit) some jump targets.
-                    l_then = new_label(loc)
-                    l_end = new_label(loc)
-
-                    # Recursively emit instructions for
-                    # evaluating the condition.
-                    var_cond = visit(st, expr.con)
-                    # Emit a conditional jump instruction
-                    # to jump to 'l_then' or 'l_end',
-                    # depending on the content of 'var_cond'.
-                    ins.append(ir.CondJump(loc, var_cond, l_then, l_end))
-
-                    # Emit the label that marks the beginning of
-                    # the "then" branch.
-                    ins.append(l_then)
-                    # Recursively emit instructions for the "then" branch.
-                    visit(st, expr.then)
-
-                    # Emit the label that we jump to
-                    # when we don't want to go to the "then" branch.
-                    ins.append(l_end)
-
-                    # An if-then expression doesn't return anything, so we
-                    # return a special variable "unit".
-                    return var_unit
-                else:
-                    # "if-then-else" case
-                    l_then = new_label(loc)
-                    l_else = new_label(loc)
-                    l_end = new_label(loc)
-                    var_cond = visit(st, expr.con)
-                    var_result = new_var(expr.then.type)
-                    ins.append(ir.CondJump(loc, var_cond, l_then, l_else))
-                    ins.append(l_then)
-                    var_then = visit(st, expr.then)
-                    ins.append(ir.Copy(loc, var_then, var_result))
-                    ins.append(ir.Jump(loc, l_end))
-                    ins.append(l_else)
-                    var_else = visit(st, expr.el)
-                    ins.append(ir.Copy(loc, var_else, var_result))
-                    ins.append(l_end)
-                    return var_result
-            
-            case ast.Block():
-                new_st = SymTab[ir.IRVar](parent = st)
-                for b_expr in expr.content:
-                    visit(new_st, b_expr)
-                return visit(new_st, expr.val)
-            
-            case ast.Declaration():
-                result = visit(st, expr.val)
-                var = new_var(expr.val.type)
-                st.add_local(expr.name.name, var)
-                ins.append(ir.Copy(loc, result, var))
-                
-                return var_unit
-            
-            case ast.FunctionCall():
-                f = st.require(expr.name.name)
-                params = []
-                for p in expr.params:
-                    params.append(visit(st, p))
-                var_result = new_var(expr.type)
-                ins.append(ir.Call(loc, f, params, var_result))
-                return var_result
-            
-            case ast.Unary():
-                var_val = visit(st, expr.val)
-                var_result = new_var(expr.val.type)
-                f = st.require(f'unary_{expr.op}')
-                ins.append(ir.Call(loc, f, [var_val], var_result))
-                return var_result
-            
-            case ast.Loop():
-                prev_start = in_loop_start
-                prev_end = in_loop_end
-                l_start = new_label(loc)
-                l_body = new_label(loc)
-                l_end = new_label(loc)
-                in_loop_start = l_start
-                in_loop_end = l_end
-                
-                ins.append(l_start)
-                var_con = visit(st, expr.condition)
-                ins.append(ir.CondJump(loc, var_con, l_body, l_end))
-                ins.append(l_body)
-                visit(st, expr.do)
-                ins.append(ir.Jump(loc, l_start))
-                ins.append(l_end)
-                in_loop_start = prev_start
-                in_loop_end = prev_end
-                return var_unit
-            
-            case ast.Return():
-                var_result = visit(st, expr.val)
-                ins.append(ir.Return(loc, var_result))
-                return var_result
-    
-            case _:
-                raise Exception(expr)
 
+def new_generator(root_types: Mapping[ir.IRVar, Type]) -> 'IRGenerator':
     # Convert 'root_types' into a SymTab
     # that maps all available global names to
     # IR variables of the same name.
@@ -249,44 +67,279 @@ def generate_ir(
     root_symtab = SymTab[ir.IRVar](parent=None)
     for v in root_types.keys():
         root_symtab.add_local(v.name, v)
+    return IRGenerator(root_types, root_symtab)
 
-    output = {}
-    
-    for f in root_module.funcs:
-        root_symtab.add_local(f.name.name, ir.IRVar(f.name.name))
-    
-    for f in root_module.funcs:
+
+class IRGenerator(Visitor[Frames, ir.IRVar]):
+    def __init__(self, root_types: Mapping[ir.IRVar, Type], root_symtab: SymTab[ir.IRVar]) -> None:
+        # Operators are not bound, so they are looked up by name
+        self.root_symtab = root_symtab
+        self.var_types: dict[ir.IRVar, Type] = dict(root_types)
+
+        # 'var_unit' is used when an expression's type is 'Unit'.
+        self.var_unit = ir.IRVar('unit')
+        self.var_types[self.var_unit] = Unit
+
+        unit_label = ir.Label(L, 'UnitLabel')
+
+        self.in_loop_start: ir.Label = unit_label
+        self.in_loop_end: ir.Label = unit_label
+        self.label_num = 1
+        self.label_prefix = ''
+        self.var_num = 1
+
+        # We collect the IR instructions that we generate
+        # into this list.
+        self.ins: list[ir.Instruction] = []
+
+    def function(self, f: ast.FunctionDefinition, global_frame: list[ir.IRVar]) -> tuple[tuple, list[ir.Instruction]]:
+        """Generates the IR of a function of a bound and typed module.
+        Returns the key of the function in the output of generate_ir
+        and its instructions."""
         parameters = []
-        var_num = 1
-        ins = []
+        # Variables and labels are numbered per function,
+        # so every function can be generated on its own.
+        # Labels are global symbols in the assembly,
+        # so they are prefixed with the function name.
+        self.var_num = 1
+        self.label_num = 1
+        self.label_prefix = f'{f.name.name}_'
+        self.ins = []
         for p in f.params:
             var = ir.IRVar(p.name)
             parameters.append(var)
-            root_symtab.add_local(p.name, var)
-        visit(root_symtab, f.body)
-        
+        var_body = run(self.visit(f.body, [global_frame, parameters]))
+
         if f.type == Unit:
-            ins.append(ir.Return(f.name.location, var_unit))
+            self.ins.append(ir.Return(f.name.location, self.var_unit))
+        else:
+            # A body that doesn't end in 'return' returns its value
+            self.ins.append(ir.Return(f.name.location, var_body))
+
+        ins = self.ins
+        self.ins = []
+        return (f.name.name, tuple(parameters)), ins
 
-        output[(f.name.name, tuple(parameters))] = ins
-        ins = []
+    def new_var(self, t: Type) -> ir.IRVar:
+        # Create a new unique IR variable and
+        # add it to var_types
+        var = ir.IRVar(f'x{self.var_num}')
+        self.var_num += 1
+        self.var_types[var] = t
+        return var
 
+    def new_label(self, loc: Location) -> ir.Label:
+        label = ir.Label(loc, f'{self.label_prefix}L{self.label_num}')
+        self.label_num += 1
+        return label
 
-    var_num = 1
-    label_num = 1
-    # Start visiting the AST from the root.
-    var_final_result = visit(root_symtab, root_module.body)
+    # The methods below visit an AST node,
+    # append IR instructions to 'ins',
+    # and return the IR variable where
+    # the emitted IR instructions put the result.
+    # Nodes with children are visited by steps run with
+    # 'run', which visit child nodes by yielding
+    # instead of calling themselves, so deeply
+    # nested code doesn't hit the recursion limit.
+    #
+    # They use frames to map local variables
+    # (which may be shadowed) to unique IR variables.
+    # The frames will be updated in the same way as
+    # in the interpreter and type checker.
 
-    if var_types[var_final_result] == Int:
-        ins.append(ir.Call(
-            root_module.body.location, ir.IRVar('print_int'), [var_final_result], new_var(var_types[var_final_result])
-        ))
-    elif var_types[var_final_result] == Bool:
+    @visits(ast.Literal)
+    def literal(self, expr: ast.Literal, st: Frames) -> ir.IRVar:
+        loc = expr.location
+        # Create an IR variable to hold the value,
+        # and emit the correct instruction to
+        # load the constant value.
+        match expr.value:
+            case bool():
+                var = self.new_var(Bool)
+                self.ins.append(ir.LoadBoolConst(
+                    loc, expr.value, var))
+            case int():
+                var = self.new_var(Int)
+                self.ins.append(ir.LoadIntConst(
+                    loc, expr.value, var))
+            case None:
+                var = self.var_unit
+            case _:
+                raise Exception(f"{loc}: unsupported literal: {type(expr.value)}")
+
+        # Return the variable that holds
+        # the loaded value.
+        return var
+
+    @visits(ast.Identifier)
+    def identifier(self, expr: ast.Identifier, st: Frames) -> ir.IRVar:
+        loc = expr.location
+        # Look up the IR variable that corresponds to
+        # the source code variable.
+
+        if expr.name in ('break', 'continue') and self.in_loop_start.name == 'unit_label':
+            raise Exception(f"{expr.name} not allowed outside of a loop")
+
+        elif expr.name == 'break':
+            self.ins.append(ir.Jump(loc, self.in_loop_end))
+        
+        elif expr.name == 'continue':
+            self.ins.append(ir.Jump(loc, self.in_loop_start))
+
+        return st[expr.depth][expr.slot] # type: ignore[no-any-return]
+
+    @visits(ast.BinaryOp)
+    def binary_op(self, expr: ast.BinaryOp, st: Frames) -> Step[ir.IRVar]:
+        loc = expr.location
+        ins = self.ins
+        # Recursively emit instructions to calculate the operands.
+        var_left = yield self.visit(expr.left, st)
+        if expr.op in ['or', 'and']:
+            l_right = self.new_label(loc)
+            l_skip = self.new_label(loc)
+            l_end = self.new_label(loc)
+            if expr.op == 'or':
+                ins.append(ir.CondJump(loc, var_left, l_skip, l_right))
+            elif expr.op == 'and':
+                ins.append(ir.CondJump(loc, var_left, l_right, l_skip))
+            ins.append(l_right)
+            var_rigth = yield self.visit(expr.right, st)
+            var_result = self.new_var(expr.right.type)
+            ins.append(ir.Copy(loc, var_rigth, var_result))
+            ins.append(ir.Jump(loc, l_end))
+            ins.append(l_skip)
+            ins.append(ir.LoadBoolConst(loc, expr.op == 'or', var_result))
+            ins.append(l_end)
+            return var_result
+            
+
+        var_right = yield self.visit(expr.right, st)
+        # Generate variable to hold the result.
+        # Emit a Call instruction that writes to that variable.
+        if expr.op == '=':
+            if not isinstance(expr.left, ast.Identifier):
+                raise Exception(f"{loc}: can only assign to a variable")
+            ins.append(ir.Copy(
+                loc, var_right, var_left))
+            return var_right
+
+        var_result = self.new_var(expr.type)
+        # Ask the symbol table to return the variable that refers
+        # to the operator to call.
+        var_op = self.root_symtab.require(expr.op)
         ins.append(ir.Call(
-            root_module.body.location, ir.IRVar('print_bool'), [var_final_result], new_var(var_types[var_final_result])
-        ))
-    if root_module.body.type == Unit:
-        ins.append(ir.Return(root_module.body.location, var_unit))
-    output[('main', ())] = ins
+            loc, var_op, [var_left, var_right], var_result))
+        return var_result
 
-    return output
+    @visits(ast.Condition)
+    def condition(self, expr: ast.Condition, st: Frames) -> Step[ir.IRVar]:
+        loc = expr.location
+        ins = self.ins
+        if expr.el is None:
+            # Create (but don't emit) some jump targets.
+            l_then = self.new_label(loc)
+            l_end = self.new_label(loc)
+
+            # Recursively emit instructions for
+            # evaluating the condition.
+            var_cond = yield self.visit(expr.con, st)
+            # Emit a conditional jump instruction
+            # to jump to 'l_then' or 'l_end',
+            # depending on the content of 'var_cond'.
+            ins.append(ir.CondJump(loc, var_cond, l_then, l_end))
+
+            # Emit the label that marks the beginning of
+            # the "then" branch.
+            ins.append(l_then)
+            # Recursively emit instructions for the "then" branch.
+            yield self.visit(expr.then, st)
+
+            # Emit the label that we jump to
+            # when we don't want to go to the "then" branch.
+            ins.append(l_end)
+
+            # An if-then expression doesn't return anything, so we
+            # return a special variable "unit".
+            return self.var_unit
+        else:
+            # "if-then-else" case
+            l_then = self.new_label(loc)
+            l_else = self.new_label(loc)
+            l_end = self.new_label(loc)
+            var_cond = yield self.visit(expr.con, st)
+            var_result = self.new_var(expr.then.type)
+            ins.append(ir.CondJump(loc, var_cond, l_then, l_else))
+            ins.append(l_then)
+            var_then = yield self.visit(expr.then, st)
+            ins.append(ir.Copy(loc, var_then, var_result))
+            ins.append(ir.Jump(loc, l_end))
+            ins.append(l_else)
+            var_else = yield self.visit(expr.el, st)
+            ins.append(ir.Copy(loc, var_else, var_result))
+            ins.append(l_end)
+            return var_result
+
+    @visits(ast.Block)
+    def block(self, expr: ast.Block, st: Frames) -> Step[ir.IRVar]:
+        st.append([self.var_unit] * expr.frame_size)
+        for b_expr in expr.content:
+            yield self.visit(b_expr, st)
+        var = yield self.visit(expr.val, st)
+        st.pop()
+        return var # type: ignore[no-any-return]
+
+    @visits(ast.Declaration)
+    def declaration(self, expr: ast.Declaration, st: Frames) -> Step[ir.IRVar]:
+        result = yield self.visit(expr.val, st)
+        var = self.new_var(expr.val.type)
+        st[expr.name.depth][expr.name.slot] = var
+        self.ins.append(ir.Copy(expr.location, result, var))
+        
+        return self.var_unit
+
+    @visits(ast.FunctionCall)
+    def function_call(self, expr: ast.FunctionCall, st: Frames) -> Step[ir.IRVar]:
+        f = st[expr.name.depth][expr.name.slot]
+        params = []
+        for p in expr.params:
+            params.append((yield self.visit(p, st)))
+        var_result = self.new_var(expr.type)
+        self.ins.append(ir.Call(expr.location, f, params, var_result))
+        return var_result
+
+    @visits(ast.Unary)
+    def unary(self, expr: ast.Unary, st: Frames) -> Step[ir.IRVar]:
+        var_val = yield self.visit(expr.val, st)
+        var_result = self.new_var(expr.val.type)
+        f = self.root_symtab.require(f'unary_{expr.op}')
+        self.ins.append(ir.Call(expr.location, f, [var_val], var_result))
+        return var_result
+
+    @visits(ast.Loop)
+    def loop(self, expr: ast.Loop, st: Frames) -> Step[ir.IRVar]:
+        loc = expr.location
+        ins = self.ins
+        prev_start = self.in_loop_start
+        prev_end = self.in_loop_end
+        l_start = self.new_label(loc)
+        l_body = self.new_label(loc)
+        l_end = self.new_label(loc)
+        self.in_loop_start = l_start
+        self.in_loop_end = l_end
+        
+        ins.append(l_start)
+        var_con = yield self.visit(expr.condition, st)
+        ins.append(ir.CondJump(loc, var_con, l_body, l_end))
+        ins.append(l_body)
+        yield self.visit(expr.do, st)
+        ins.append(ir.Jump(loc, l_start))
+        ins.append(l_end)
+        self.in_loop_start = prev_start
+        self.in_loop_end = prev_end
+        return self.var_unit
+
+    @visits(ast.Return)
+    def return_(self, expr: ast.Return, st: Frames) -> Step[ir.IRVar]:
+        var_result = yield self.visit(expr.val, st)
+        self.ins.append(ir.Return(expr.location, var_result))
+        return var_result
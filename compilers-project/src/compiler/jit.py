@@ -0,0 +1,314 @@
+import ctypes
+import mmap
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from os import path
+from typing import Callable, TextIO
+from compiler import ast, ir
+from compiler.assembly_generator import generate_assembly
+from compiler.binder import bind
+from compiler.bytecode import read_int
+from compiler.interpreter import Frame, FrameClosure, FrameCompiler, Value, module_names
+from compiler.ir_generator import new_generator
+from compiler.root_types import root_types
+from compiler.trampoline import Step
+from compiler.type_checker import typecheck
+from compiler.types import Bool, TypeTab, Unit
+
+# A function is compiled to native code when its calls and the
+# iterations of its loops add up to this
+default_threshold = 1000
+
+# The arguments of native functions are passed in registers
+max_native_params = 6
+
+def run_tiered(
+  module: ast.Module,
+  stdin: TextIO = sys.stdin,
+  stdout: TextIO = sys.stdout,
+  threshold: int = default_threshold,
+  log: TextIO | None = None
+) -> Value:
+  '''Runs a module in the frame interpreter, and compiles the functions
+  that become hot to native code, which is run in this process. The
+  transitions between the tiers are written to 'log'.
+
+  The native code works like the compiled program: integers wrap
+  around, dividing by zero stops the process, and the program stops
+  when read_int fails.'''
+  used = bind(module, TypeTab.locals)
+  typecheck(module, TypeTab)
+  tiers = Tiers(module, used, stdin, stdout, threshold, log)
+  return tiers.run()
+
+class Tiers:
+  '''The interpreted module and the native code of its hot functions.'''
+  def __init__(
+    self,
+    module: ast.Module,
+    used: dict[str, set[str]],
+    stdin: TextIO,
+    stdout: TextIO,
+    threshold: int,
+    log: TextIO | None
+  ) -> None:
+    self.module = module
+    self.used = used
+    self.threshold = threshold
+    self.log = log
+    self.names = module_names(stdin, stdout)
+    self.compiler = TieredCompiler(self.names, module, self)
+    self.definitions = {f.name.name: f for f in module.funcs}
+    self.runtime = Runtime(stdin, stdout)
+    # Kept alive for as long as the native code can run
+    self.code: list[NativeCode] = []
+
+  def run(self) -> Value:
+    return self.compiler.run_module(self.module)
+
+  def write_log(self, message: str) -> None:
+    if self.log is not None:
+      self.log.write(f'[tiers] {message}\n')
+
+  def promote(self, f: ast.FunctionDefinition, calls: int, iterations: int) -> FrameClosure | None:
+    '''Compiles the function to native code. Returns a closure that runs
+    it in place of the body, or None if it can't be compiled.'''
+    name = f.name.name
+    start = time.perf_counter()
+    try:
+      native = self.compile(f)
+    except Exception as e:
+      self.write_log(f'{name}: stays interpreted: {e}')
+      return None
+    milliseconds = (time.perf_counter() - start) * 1000
+    self.write_log(
+      f'{name}: interpreter -> native after {calls} calls and {iterations} loop iterations, '
+      f'compiled in {milliseconds:.1f} ms'
+    )
+    return native
+
+  def compile(self, f: ast.FunctionDefinition) -> FrameClosure:
+    # The function is compiled with the functions it calls
+    unit = [f]
+    for g in unit:
+      if len(g.params) > max_native_params:
+        raise Exception(f'{g.name.name} has more than {max_native_params} parameters')
+      for name in sorted(self.used.get(g.name.name, ())):
+        callee = self.definitions.get(name)
+        if callee is not None and callee not in unit:
+          unit.append(callee)
+
+    assert self.module.globals is not None
+    gen = new_generator(root_types)
+    ir_frame = [ir.IRVar(name) for name in self.module.globals]
+    functions = dict(gen.function(g, ir_frame) for g in unit)
+    code = NativeCode(self.runtime.assembly(generate_assembly(functions), f.name.name))
+    self.code.append(code)
+
+    native = code.function(len(f.params))
+    params = len(f.params)
+    runtime = self.runtime
+    if f.type is Bool:
+      convert: Callable[[int], Value] = bool
+    elif f.type is Unit:
+      convert = lambda result: None
+    else:
+      convert = int
+
+    def run_native(frame: Frame) -> Value:
+      result = native(*frame[1:1 + params])
+      runtime.check()
+      return convert(result)
+    return run_native
+
+class TieredCompiler(FrameCompiler):
+  '''A FrameCompiler that counts the calls of each function and the
+  iterations of the loops in it. When they reach the threshold, the
+  next call compiles the function to native code. The calls that are
+  running at that point finish in the interpreter.'''
+  def __init__(self, names: dict[str, Value], module: ast.Module, tiers: Tiers) -> None:
+    assert module.globals is not None
+    super().__init__(names, module.globals)
+    self.tiers = tiers
+    # The counts of the function being compiled: calls and iterations
+    self.counts: list[int] | None = None
+    self.loop_bodies: set[int] = set()
+
+  def visit(self, node: ast.Expression, context: None) -> Step[FrameClosure]:
+    counts = self.counts
+    if isinstance(node, ast.Loop) and counts is not None:
+      self.loop_bodies.add(id(node.do))
+    closure: FrameClosure = yield super().visit(node, context)
+    if id(node) not in self.loop_bodies or counts is None:
+      return closure
+
+    def counted(frame: Frame) -> Value:
+      counts[1] += 1
+      return closure(frame)
+    return counted
+
+  def function(self, f: ast.FunctionDefinition) -> Callable[..., Value]:
+    counts = self.counts = [0, 0]
+    function = super().function(f)
+    self.counts = None
+
+    cell = self.functions[f.name.slot]
+    body = cell[0]
+    tiers = self.tiers
+    threshold = tiers.threshold
+
+    def counted(frame: Frame) -> Value:
+      counts[0] += 1
+      if counts[0] + counts[1] < threshold:
+        return body(frame) # type: ignore[no-any-return]
+      native = tiers.promote(f, counts[0], counts[1])
+      # Later calls run the native code, or the body without counting
+      cell[0] = body if native is None else native
+      return cell[0](frame) # type: ignore[no-any-return]
+    cell[0] = counted
+    return function
+
+class Runtime:
+  '''The built-in functions of the native code. They call back into
+  Python, so they write to the same output as the interpreter.'''
+  signature = ctypes.CFUNCTYPE(ctypes.c_int64, ctypes.c_int64)
+
+  def __init__(self, stdin: TextIO, stdout: TextIO) -> None:
+    self.stdin = stdin
+    self.stdout = stdout
+    # An error in a callback, raised when the native code returns
+    self.error: Exception | None = None
+    # Set by a failed callback, after which the native code returns at
+    # once to where it was entered, whose stack pointer is saved here
+    self.failed = ctypes.c_int64(0)
+    self.stack = ctypes.c_int64(0)
+    self.callbacks = {
+      'print_int': self.signature(self.print_int),
+      'print_bool': self.signature(self.print_bool),
+      'read_int': ctypes.CFUNCTYPE(ctypes.c_int64)(self.read_int),
+    }
+
+  def print_int(self, value: int) -> int:
+    self.stdout.write(f'{value}\n')
+    return value
+
+  def print_bool(self, value: int) -> int:
+    self.stdout.write('true\n' if value else 'false\n')
+    return value
+
+  def read_int(self) -> int:
+    try:
+      return read_int(self.stdin)
+    except Exception as e:
+      self.error = self.error or e
+      self.failed.value = 1
+      return 0
+
+  def check(self) -> None:
+    error = self.error
+    if error is not None:
+      self.error = None
+      self.failed.value = 0
+      raise error
+
+  def assembly(self, program: str, function: str) -> str:
+    '''Adds the built-in functions to the assembly of a program, and an
+    entry point at the first byte that calls 'function'. The built-ins
+    call the callbacks with the stack aligned to 16 bytes. If a callback
+    fails, they return from the entry point, like the compiled built-ins
+    stop the program.'''
+    failed = ctypes.addressof(self.failed)
+    stack = ctypes.addressof(self.stack)
+    saved = ['%rbx', '%r12', '%r13', '%r14', '%r15']
+    lines = []
+    for line in program.splitlines():
+      # Without global symbols the assembler resolves every call,
+      # so the code can run at any address
+      if line.startswith('.global'):
+        continue
+      lines.append(line)
+      if line == '.section .text':
+        lines += [
+          'pushq %rbp',
+          'movq %rsp, %rbp',
+          *[f'pushq {register}' for register in saved],
+          # Aligns the stack to 16 bytes for the call
+          'subq $8, %rsp',
+          f'movabsq ${stack}, %rax',
+          'movq %rsp, (%rax)',
+          f'callq {function}',
+          '.Lnative.exit:',
+          'addq $8, %rsp',
+          *[f'popq {register}' for register in reversed(saved)],
+          'popq %rbp',
+          'ret',
+        ]
+    for name, callback in self.callbacks.items():
+      address = ctypes.cast(callback, ctypes.c_void_p).value
+      lines += [
+        f'{name}:',
+        'pushq %rbp',
+        'movq %rsp, %rbp',
+        'andq $-16, %rsp',
+        f'movabsq ${address}, %rax',
+        'callq *%rax',
+        f'movabsq ${failed}, %rcx',
+        'cmpq $0, (%rcx)',
+        f'jne .L{name}.failed',
+        'movq %rbp, %rsp',
+        'popq %rbp',
+        'ret',
+        f'.L{name}.failed:',
+        f'movabsq ${stack}, %rcx',
+        'movq (%rcx), %rsp',
+        'jmp .Lnative.exit',
+      ]
+    return '\n'.join(lines) + '\n'
+
+class NativeCode:
+  '''Machine code assembled with 'as' and loaded into executable memory.
+  The first function of the assembly starts at the first byte.'''
+  def __init__(self, assembly: str) -> None:
+    code = assemble_text(assembly)
+    size = -(-len(code) // mmap.PAGESIZE) * mmap.PAGESIZE
+    # Written first and made executable after, so the memory is
+    # never writable and executable at the same time
+    self.memory = mmap.mmap(-1, size, prot=mmap.PROT_READ | mmap.PROT_WRITE)
+    self.memory.write(code)
+    self.address = ctypes.addressof(ctypes.c_char.from_buffer(self.memory))
+    libc = ctypes.CDLL(None, use_errno=True)
+    libc.mprotect.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int]
+    if libc.mprotect(self.address, size, mmap.PROT_READ | mmap.PROT_EXEC) != 0:
+      raise OSError(ctypes.get_errno(), 'Cannot make the native code executable')
+
+  def function(self, params: int) -> Callable[..., int]:
+    signature = ctypes.CFUNCTYPE(ctypes.c_int64, *[ctypes.c_int64] * params)
+    return signature(self.address) # type: ignore[no-any-return]
+
+def assemble_text(assembly: str) -> bytes:
+  '''Assembles the code and returns its .text section, which must not
+  need relocating.'''
+  with tempfile.TemporaryDirectory(prefix='compiler_') as workdir:
+    object_file = path.join(workdir, 'native.o')
+    subprocess.run(['as', '-o', object_file], input=assembly.encode(), check=True)
+    with open(object_file, 'rb') as f:
+      elf = f.read()
+
+  # The section headers of the 64-bit ELF object
+  (headers,) = struct.unpack_from('<Q', elf, 0x28)
+  size, count, names_index = struct.unpack_from('<HHH', elf, 0x3a)
+  sections = [struct.unpack_from('<IIQQQQ', elf, headers + i * size) for i in range(count)]
+  names_offset = sections[names_index][4]
+
+  def name(section: tuple) -> str:
+    start = names_offset + section[0]
+    return elf[start:elf.index(b'\0', start)].decode()
+
+  by_name = {name(section): section for section in sections}
+  if '.rela.text' in by_name and by_name['.rela.text'][5]:
+    raise Exception('The native code refers to undefined symbols')
+  _, _, _, _, offset, length = by_name['.text']
+  return elf[offset:offset + length]
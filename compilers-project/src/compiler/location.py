@@ -1,6 +1,10 @@
+import re
+from array import array
+from bisect import bisect_right
 from dataclasses import dataclass
+from typing import Any
 
-@dataclass
+@dataclass(slots=True)
 class Location:
   file: str
   line: int
@@ -14,3 +18,74 @@ class Location:
     )
 
 L = Location('L',-1, -1)
+
+class SourceMap:
+  '''Maps character offsets of a source file to lines and columns.
+  
+  The index of line starts is only built when the first offset is resolved.'''
+  def __init__(self, file: str, source: str) -> None:
+    self.file = file
+    self.source = source
+    self._line_starts: array[int] | None = None
+    # The offsets divided by 256, shared by the LazyLocations in place of
+    # an int object of their own for each offset
+    self.blocks = list(range(len(source) // 256 + 1))
+
+  def line_starts(self) -> array[int]:
+    if self._line_starts is None:
+      self._line_starts = array('i', [0])
+      self._line_starts.extend(m.end() for m in re.finditer('\n', self.source))
+    return self._line_starts
+
+  def location(self, offset: int) -> Location:
+    line_starts = self.line_starts()
+    line = bisect_right(line_starts, offset)
+    return Location(self.file, line, offset - line_starts[line - 1] + 1)
+
+# The slots that hold the fields of a Location
+file_slot, line_slot, column_slot = (Location.__dict__[name] for name in ('file', 'line', 'column'))
+
+def resolved_field(slot: Any) -> Any:
+  '''A field of a LazyLocation, which resolves it before the slot of
+  the field is read or written.'''
+  def get(self: 'LazyLocation') -> Any:
+    self.resolve()
+    return slot.__get__(self)
+
+  def set(self: 'LazyLocation', value: Any) -> None:
+    self.resolve()
+    slot.__set__(self, value)
+  return property(get, set)
+
+class LazyLocation(Location):
+  '''A Location that is only resolved from its source offset when
+  one of the fields is first read.
+
+  Until then the file slot holds the source map, and the line and column
+  slots the offset divided by 256 and the remainder. Both are ints that
+  Python shares, so it takes no more memory than a Location.'''
+  __slots__ = ()
+  file = resolved_field(file_slot)
+  line = resolved_field(line_slot)
+  column = resolved_field(column_slot)
+
+  def __init__(self, source_map: SourceMap, offset: int) -> None:
+    block, rest = divmod(offset, 256)
+    file_slot.__set__(self, source_map)
+    line_slot.__set__(self, source_map.blocks[block])
+    column_slot.__set__(self, rest)
+
+  def resolve(self) -> None:
+    source_map = file_slot.__get__(self)
+    if isinstance(source_map, SourceMap):
+      resolved = source_map.location(line_slot.__get__(self) * 256 + column_slot.__get__(self))
+      file_slot.__set__(self, resolved.file)
+      line_slot.__set__(self, resolved.line)
+      column_slot.__set__(self, resolved.column)
+
+  def __repr__(self) -> str:
+    return repr(Location(self.file, self.line, self.column))
+
+  def __reduce__(self) -> tuple:
+    # Copied and pickled as the Location it resolves to
+    return Location, (self.file, self.line, self.column)
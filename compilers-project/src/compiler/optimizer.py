@@ -0,0 +1,529 @@
+import operator
+from typing import Callable, Iterable, TextIO
+from compiler import ir
+from compiler.bytecode import divide, remainder, wrap
+from compiler.cfg import CFG, Block, build, set_successors
+from compiler.dataflow import Numbering, ReachingDefinitions, bitset, definition, pure_operators, solve, uses
+from compiler.location import Location
+from compiler.ssa import from_ssa, phis, remove_edge, rewrite, to_ssa
+
+Constant = int | bool
+
+# The operators that are folded, with the same results as the intrinsics.
+# Divisions that raise ArithmeticError stop the program, so they are left
+# for run time.
+folds: dict[ir.IRVar, Callable[..., Constant]] = {
+  ir.IRVar('+'): lambda x, y: wrap(x + y),
+  ir.IRVar('-'): lambda x, y: wrap(x - y),
+  ir.IRVar('*'): lambda x, y: wrap(x * y),
+  ir.IRVar('/'): divide,
+  ir.IRVar('%'): remainder,
+  ir.IRVar('<'): operator.lt,
+  ir.IRVar('<='): operator.le,
+  ir.IRVar('>'): operator.gt,
+  ir.IRVar('>='): operator.ge,
+  ir.IRVar('=='): operator.eq,
+  ir.IRVar('!='): operator.ne,
+  ir.IRVar('unary_-'): lambda x: wrap(-x),
+  ir.IRVar('unary_not'): operator.not_,
+}
+
+def optimize(
+  functions: dict[tuple, list[ir.Instruction]],
+  log: TextIO | None = None,
+  ssa: bool = True
+) -> dict[tuple, list[ir.Instruction]]:
+  '''Runs the optimization passes on the output of generate_ir. The
+  number of instructions each function had before and after is written
+  to 'log'.
+
+  Without 'ssa', only fold_constants and simplify_cfg are run, which
+  is quicker but finds less.'''
+  result = {}
+  for key, instructions in functions.items():
+    cfg = build(key[0], instructions)
+    if ssa:
+      to_ssa(cfg, key[1])
+      propagate_constants(cfg)
+      number_values(cfg)
+      remove_dead_code(cfg)
+      from_ssa(cfg)
+    else:
+      fold_constants(cfg, key[1])
+    simplify_cfg(cfg)
+    result[key] = cfg.instructions()
+    if log is not None:
+      before, after = len(instructions), len(result[key])
+      log.write(
+        f'[optimize] {key[0]}: {before} -> {after} instructions'
+        f' ({100 * (after - before) / max(before, 1):+.1f}%)\n'
+      )
+  return result
+
+def load_constant(location: Location, value: Constant, dest: ir.IRVar) -> ir.Instruction:
+  if isinstance(value, bool):
+    return ir.LoadBoolConst(location, value, dest)
+  return ir.LoadIntConst(location, value, dest)
+
+def same(a: Constant, b: Constant) -> bool:
+  # True == 1, so the types are compared too
+  return type(a) is type(b) and a == b
+
+def constant(insn: ir.Instruction) -> Constant | None:
+  match insn:
+    case ir.LoadIntConst():
+      return wrap(insn.value)
+    case ir.LoadBoolConst():
+      return insn.value
+  return None
+
+def fold_constants(cfg: CFG, params: Iterable[ir.IRVar] = ()) -> int:
+  '''Replaces the calls of operators on constants and the copies of
+  constants with loads of the results, and conditional jumps on
+  constants with jumps. Returns the number of instructions replaced.
+
+  A variable is a constant where every definition of it that can reach
+  there sets it to the same constant, found with ReachingDefinitions.
+  Definitions in blocks that can't be reached are left out, so removing
+  a branch can make more constants. The parameters and the variables
+  read before they are set can keep the value they had when the
+  function started, which is never a constant. Divisions that would
+  stop the program are not folded.'''
+  params = list(params)
+  folded = 0
+  while True:
+    count = fold_round(cfg, params)
+    folded += count
+    if not count:
+      return folded
+
+def fold_round(cfg: CFG, params: list[ir.IRVar]) -> int:
+  numbering = Numbering(cfg)
+  # The variables that can be read before they are set
+  entry = params + numbering.vars[:numbering.globals]
+  definitions = ReachingDefinitions(cfg, numbering, entry)
+  solution = solve(definitions)
+  # The constant of each definition, or None
+  values = [constant(insn) for insn in definitions.definitions]
+  order = cfg.reverse_postorder()
+  reachable = set(order)
+  # The definitions in reachable blocks
+  reachable_definitions = ~bitset([
+    definitions.numbers[id(insn)]
+    for block in cfg.blocks if block not in reachable
+    for insn in block.instructions if id(insn) in definitions.numbers
+  ])
+  folded = 0
+  edges_changed = False
+
+  for block in order:
+    # The variables set in the block so far
+    known: dict[ir.IRVar, Constant | None] = {}
+    reaching = solution.before[block.index] & reachable_definitions
+
+    def lookup(var: ir.IRVar) -> Constant | None:
+      if var in known:
+        return known[var]
+      found = None
+      # Stops at the first definition that isn't the same constant
+      bits = reaching & definitions.of_var.get(var, 0)
+      while bits:
+        low = bits & -bits
+        bits ^= low
+        value = values[low.bit_length() - 1]
+        if value is None or found is not None and not same(found, value):
+          return None
+        found = value
+      return found
+
+    for i, insn in enumerate(block.instructions):
+      new = fold(insn, lookup)
+      if new is not None:
+        block.instructions[i] = new
+        folded += 1
+        if isinstance(new, ir.Jump):
+          remove_edges(block, new.label)
+          edges_changed = True
+        elif id(insn) in definitions.numbers:
+          values[definitions.numbers[id(insn)]] = constant(new)
+      dest = definition(insn)
+      if dest is not None:
+        known[dest] = constant(block.instructions[i])
+  if edges_changed:
+    cfg.changed()
+  return folded
+
+def fold(insn: ir.Instruction, lookup: Callable[[ir.IRVar], Constant | None]) -> ir.Instruction | None:
+  '''Returns the instruction that replaces the instruction, if any.'''
+  match insn:
+    case ir.Copy():
+      value = lookup(insn.source)
+      if value is not None:
+        return load_constant(insn.location, value, insn.dest)
+    case ir.Call() if insn.fun in folds:
+      args = [lookup(arg) for arg in insn.args]
+      if any(arg is None for arg in args):
+        return None
+      try:
+        value = folds[insn.fun](*args)
+      except ArithmeticError:
+        return None
+      return load_constant(insn.location, value, insn.dest)
+    case ir.CondJump():
+      value = lookup(insn.cond)
+      if value is not None:
+        return ir.Jump(insn.location, insn.then_label if value else insn.else_label)
+  return None
+
+def remove_edges(block: Block, target: ir.Label) -> None:
+  '''Removes the edges of the block except the one to the label.'''
+  for successor in block.successors:
+    if successor.label is None or successor.label.name != target.name:
+      successor.predecessors.remove(block)
+  block.successors = [s for s in block.successors if s.label is not None and s.label.name == target.name]
+
+def simplify_cfg(cfg: CFG) -> None:
+  '''Removes the blocks that can't be reached, makes jumps to blocks
+  that only jump on go straight to the end of the chain, merges blocks
+  that always run one after another, and removes the jumps to the next
+  block and the labels nothing jumps to.'''
+  cfg.remove_unreachable()
+  thread_jumps(cfg)
+  cfg.remove_unreachable()
+  merge_blocks(cfg)
+  blocks = cfg.blocks
+  for i, block in enumerate(blocks):
+    following = blocks[i + 1] if i + 1 < len(blocks) else None
+    if isinstance(block.terminator, ir.Jump) and block.successors[0] is following:
+      block.instructions.pop()
+  referenced = set()
+  for block in blocks:
+    match block.terminator:
+      case ir.Jump() as jump:
+        referenced.add(jump.label.name)
+      case ir.CondJump() as jump:
+        referenced.update([jump.then_label.name, jump.else_label.name])
+  for i, block in enumerate(blocks):
+    if block.label is None or block.label.name in referenced:
+      continue
+    # Without a label, the block can only be reached by falling through
+    # from the block before it
+    if all(i > 0 and p is blocks[i - 1] and p.terminator is None for p in block.predecessors):
+      block.label = None
+
+def forwards_to(block: Block) -> Block | None:
+  '''The block that the block goes to without doing anything, if any.'''
+  if len(block.successors) == 1 and (
+    not block.instructions or len(block.instructions) == 1 and isinstance(block.terminator, ir.Jump)
+  ):
+    return block.successors[0]
+  return None
+
+def thread_jumps(cfg: CFG) -> None:
+  def destination(block: Block) -> Block:
+    # Follows the chain of empty blocks, which can be a loop
+    seen = {block}
+    while (next := forwards_to(block)) is not None and next not in seen:
+      seen.add(next)
+      block = next
+    return block
+
+  for block in cfg.blocks:
+    terminator = block.terminator
+    match terminator:
+      case ir.Jump():
+        target = destination(block.successors[0])
+        if target is not block.successors[0]:
+          block.instructions[-1] = ir.Jump(terminator.location, cfg.label(target))
+          set_successors(block, [target])
+      case ir.CondJump():
+        by_name = {s.label.name: s for s in block.successors if s.label is not None}
+        then = destination(by_name[terminator.then_label.name])
+        else_ = destination(by_name[terminator.else_label.name])
+        if then is else_:
+          block.instructions[-1] = ir.Jump(terminator.location, cfg.label(then))
+          set_successors(block, [then])
+        elif [then, else_] != [by_name[terminator.then_label.name], by_name[terminator.else_label.name]]:
+          block.instructions[-1] = ir.CondJump(terminator.location, terminator.cond, cfg.label(then), cfg.label(else_))
+          set_successors(block, [then, else_])
+      case None if block.successors:
+        # A jump is added if the block no longer falls through
+        set_successors(block, [destination(block.successors[0])])
+  cfg.changed()
+
+def merge_blocks(cfg: CFG) -> None:
+  merged: set[Block] = set()
+  for block in cfg.blocks:
+    if block in merged:
+      continue
+    while (
+      len(block.successors) == 1
+      and (block.terminator is None or isinstance(block.terminator, ir.Jump))
+      and (next := block.successors[0]) is not block
+      and next is not cfg.entry
+      and len(next.predecessors) == 1
+    ):
+      if block.terminator is not None:
+        block.instructions.pop()
+      block.instructions += next.instructions
+      successors = next.successors
+      set_successors(next, [])
+      set_successors(block, successors)
+      merged.add(next)
+  cfg.blocks = [b for b in cfg.blocks if b not in merged]
+  cfg.changed()
+
+class Unknown:
+  '''The value of a variable that propagate_constants hasn't found yet.'''
+
+unknown = Unknown()
+
+def propagate_constants(cfg: CFG) -> int:
+  '''Sparse conditional constant propagation on a graph in SSA form.
+  Variables are taken to be constant and blocks to be unreachable until
+  shown otherwise, so constants that go around loops and branches that
+  are never taken are found together.
+
+  Replaces the definitions of constants with loads and the branches on
+  constants with jumps, and removes the blocks that are never reached.
+  Returns the number of instructions replaced.'''
+  users: dict[ir.IRVar, list[tuple[Block, ir.Instruction]]] = {}
+  defined = set()
+  for block in cfg.blocks:
+    for insn in block.instructions:
+      for var in uses(insn):
+        users.setdefault(var, []).append((block, insn))
+      dest = definition(insn)
+      if dest is not None:
+        defined.add(dest)
+  # A constant, or None for a variable that can have more than one value
+  values: dict[ir.IRVar, Constant | None] = {var: None for var in users if var not in defined}
+  edges: set[tuple[Block, Block]] = set()
+  reached: set[Block] = set()
+  flow: list[tuple[Block | None, Block]] = [(None, cfg.entry)]
+  work: list[tuple[Block, ir.Instruction]] = []
+
+  def get(var: ir.IRVar) -> Constant | None | Unknown:
+    return values.get(var, unknown)
+
+  def evaluate(block: Block, insn: ir.Instruction) -> Constant | None | Unknown:
+    match insn:
+      case ir.LoadIntConst() | ir.LoadBoolConst():
+        return constant(insn)
+      case ir.Copy():
+        return get(insn.source)
+      case ir.Phi():
+        # Only the edges that can be taken count
+        result: Constant | Unknown = unknown
+        for source, predecessor in zip(insn.sources, block.predecessors):
+          value = get(source)
+          if (predecessor, block) not in edges or isinstance(value, Unknown):
+            continue
+          if value is None or not isinstance(result, Unknown) and not same(result, value):
+            return None
+          result = value
+        return result
+      case ir.Call() if insn.fun in folds:
+        args = [get(arg) for arg in insn.args]
+        if any(arg is None for arg in args):
+          return None
+        if any(isinstance(arg, Unknown) for arg in args):
+          return unknown
+        try:
+          return folds[insn.fun](*args)
+        except ArithmeticError:
+          return None
+    return None
+
+  def visit(block: Block, insn: ir.Instruction) -> None:
+    if isinstance(insn, ir.CondJump):
+      cond = get(insn.cond)
+      if isinstance(cond, Unknown):
+        return
+      taken = insn.then_label if cond else insn.else_label
+      for successor in block.successors:
+        if cond is None or successor.label is not None and successor.label.name == taken.name:
+          flow.append((block, successor))
+      return
+    dest = definition(insn)
+    if dest is None:
+      return
+    new = evaluate(block, insn)
+    old = get(dest)
+    if isinstance(new, Unknown) or old is None:
+      return
+    if not isinstance(old, Unknown):
+      if new is not None and same(old, new):
+        return
+      new = None
+    values[dest] = new
+    work.extend(users.get(dest, ()))
+
+  while flow or work:
+    if flow:
+      predecessor, block = flow.pop()
+      if predecessor is not None:
+        if (predecessor, block) in edges:
+          continue
+        edges.add((predecessor, block))
+      if block in reached:
+        # Only the phis depend on the new edge
+        for phi in phis(block):
+          visit(block, phi)
+        continue
+      reached.add(block)
+      for insn in block.instructions:
+        visit(block, insn)
+      if not isinstance(block.terminator, ir.CondJump):
+        flow.extend((block, successor) for successor in block.successors)
+    else:
+      block, insn = work.pop()
+      if block in reached:
+        visit(block, insn)
+
+  replaced = 0
+  for block in cfg.blocks:
+    for successor in list(block.successors):
+      if (block, successor) not in edges:
+        remove_edge(block, successor)
+    if block not in reached:
+      continue
+    # Phis that are constant become loads after the other phis
+    kept_phis: list[ir.Instruction] = []
+    loads: list[ir.Instruction] = []
+    rest: list[ir.Instruction] = []
+    for insn in block.instructions:
+      dest = definition(insn)
+      value = get(dest) if dest is not None else None
+      if dest is not None and constant(insn) is None and value is not None and not isinstance(value, Unknown):
+        (loads if isinstance(insn, ir.Phi) else rest).append(load_constant(insn.location, value, dest))
+        replaced += 1
+      elif isinstance(insn, ir.CondJump) and len(block.successors) == 1:
+        rest.append(ir.Jump(insn.location, cfg.label(block.successors[0])))
+        replaced += 1
+      else:
+        (kept_phis if isinstance(insn, ir.Phi) else rest).append(insn)
+    block.instructions = kept_phis + loads + rest
+  cfg.blocks = [block for block in cfg.blocks if block in reached]
+  cfg.changed()
+  return replaced
+
+# Operators whose arguments can be swapped
+commutative = frozenset(ir.IRVar(op) for op in ['+', '*', '==', '!='])
+
+def number_values(cfg: CFG) -> int:
+  '''Global value numbering on a graph in SSA form. Walks the dominator
+  tree with a table of the expressions computed in the blocks above,
+  and makes the instructions after an expression that is computed
+  again read the variable that has it instead. The same is done for
+  copies and for phis whose sources are all the same.
+
+  The instructions that are no longer read are left for
+  remove_dead_code. Returns the number of expressions found again.'''
+  # The variable that first has the value of each variable
+  leaders: dict[ir.IRVar, ir.IRVar] = {}
+
+  def leader(var: ir.IRVar) -> ir.IRVar:
+    return leaders.get(var, var)
+
+  table: dict[tuple, ir.IRVar] = {}
+  found = 0
+  dominators = cfg.dominators
+  stack: list[tuple[Block, list[tuple] | None]] = [(cfg.entry, None)]
+  while stack:
+    block, added = stack.pop()
+    if added is not None:
+      for entry in added:
+        del table[entry]
+      continue
+    added = []
+    for i, insn in enumerate(block.instructions):
+      key: tuple
+      match insn:
+        case ir.Phi():
+          # The sources from later blocks are renamed at the end
+          sources = {leader(source) for source in insn.sources} - {insn.dest}
+          if len(sources) == 1:
+            leaders[insn.dest] = sources.pop()
+            continue
+          key = ('phi', block.index, tuple(leader(source) for source in insn.sources))
+        case _:
+          insn = block.instructions[i] = rewrite(insn, leader)
+          match insn:
+            case ir.Copy():
+              leaders[insn.dest] = insn.source
+              continue
+            case ir.LoadIntConst() | ir.LoadBoolConst():
+              value = constant(insn)
+              key = ('constant', type(value), value)
+            case ir.Call() if insn.fun in pure_operators:
+              args = insn.args
+              if insn.fun in commutative:
+                args = sorted(args, key=lambda var: var.name)
+              key = (insn.fun, tuple(args))
+            case _:
+              continue
+      dest = definition(insn)
+      assert dest is not None
+      existing = table.get(key)
+      if existing is not None:
+        leaders[dest] = existing
+        found += 1
+      else:
+        table[key] = dest
+        added.append(key)
+    stack.append((block, added))
+    stack.extend((child, None) for child in reversed(dominators.children(block)))
+
+  for block in cfg.blocks:
+    for k, phi in enumerate(phis(block)):
+      block.instructions[k] = rewrite(phi, leader)
+  return found
+
+def remove_dead_code(cfg: CFG) -> int:
+  '''Removes the instructions of a graph in SSA form that only set
+  variables that are never read, including phis and loops of them.
+  Calls of functions and divisions that can stop the program are kept.
+  Returns the number of instructions removed.'''
+  definitions: dict[ir.IRVar, ir.Instruction] = {}
+  constants: dict[ir.IRVar, Constant] = {}
+  for block in cfg.blocks:
+    for insn in block.instructions:
+      dest = definition(insn)
+      if dest is not None:
+        definitions[dest] = insn
+        value = constant(insn)
+        if value is not None:
+          constants[dest] = value
+
+  def needed(insn: ir.Instruction) -> bool:
+    match insn:
+      case ir.Call() if insn.fun in pure_operators:
+        if insn.fun.name in ('/', '%'):
+          divisor = constants.get(insn.args[1])
+          return divisor is None or divisor in (0, -1)
+        return False
+      case ir.LoadIntConst() | ir.LoadBoolConst() | ir.Copy() | ir.Phi():
+        return False
+    return True
+
+  live: set[int] = set()
+  work = []
+  for block in cfg.blocks:
+    for insn in block.instructions:
+      if needed(insn):
+        live.add(id(insn))
+        work.append(insn)
+  while work:
+    for var in uses(work.pop()):
+      source = definitions.get(var)
+      if source is not None and id(source) not in live:
+        live.add(id(source))
+        work.append(source)
+
+  removed = 0
+  for block in cfg.blocks:
+    kept = [insn for insn in block.instructions if id(insn) in live]
+    removed += len(block.instructions) - len(kept)
+    block.instructions = kept
+  return removed
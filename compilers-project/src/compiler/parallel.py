@@ -0,0 +1,108 @@
+import io
+from concurrent.futures import ProcessPoolExecutor
+from typing import TextIO
+from compiler import ir
+from compiler.assembly_generator import generate_assembly, generate_function_assembly
+from compiler.binder import bind, bind_functions
+from compiler.ir_generator import generate_ir, new_generator
+from compiler.optimizer import optimize
+from compiler.parser import function_spans, parse, parse_function
+from compiler.root_types import root_types
+from compiler.token import TokenStream
+from compiler.tokenizer import tokenize_compact
+from compiler.type_checker import TypeChecker, global_types, typecheck
+from compiler.types import FunType, Type, TypeTab
+
+# Functions are sent to the workers in a few chunks per job,
+# so that one slow chunk doesn't keep the others waiting
+chunks_per_job = 4
+
+# The key, the IR if kept, the assembly and the report of the optimizer
+type CompiledFunction = tuple[tuple, list[ir.Instruction] | None, list[str], str]
+
+def compile_parallel(
+  source_code: str,
+  jobs: int,
+  keep_ir: bool = False,
+  optimized: bool = False,
+  log: TextIO | None = None
+) -> tuple[dict[tuple, list[ir.Instruction]] | None, str]:
+  '''Compiles a module, checking and generating the function bodies in
+  a pool of 'jobs' processes. Returns the assembly, which is the same
+  as when compiling in one process, and the IR if 'keep_ir' is set.
+  If 'optimized' is set, the workers also optimize their functions, and
+  the reports of the optimizer are written to 'log' in order.
+
+  The module is parsed and bound here, so all errors before type
+  checking are found as usual. Sending the trees to the workers would
+  cost as much as checking and generating them, so the workers are
+  given the source once, and parse and bind their functions again.'''
+  tokens = tokenize_compact(source_code)
+  module = parse(tokens)
+  bind(module, TypeTab.locals)
+  assert module.globals is not None
+  global_frame = global_types(module, TypeTab)
+
+  spans, _ = function_spans(tokens)
+  size = max(1, -(-len(spans) // (jobs * chunks_per_job)))
+  compiled: list[CompiledFunction] = []
+  if spans:
+    with ProcessPoolExecutor(
+      jobs,
+      initializer=start_worker,
+      initargs=(source_code, module.globals, global_frame)
+    ) as pool:
+      tasks = [
+        pool.submit(compile_functions, spans[i:i + size], keep_ir, optimized)
+        for i in range(0, len(spans), size)
+      ]
+      # Merged in the order of the module. The first failed
+      # task has the error of the earliest function.
+      for task in tasks:
+        compiled.extend(task.result())
+
+  typecheck(module, TypeTab, [])
+  main = generate_ir(root_types, module, [])
+  if log is not None:
+    for _, _, _, report in compiled:
+      log.write(report)
+  if optimized:
+    main = optimize(main, log)
+  output: dict[tuple, list[ir.Instruction]] = {key: ins or [] for key, ins, _, _ in compiled}
+  output.update(main)
+  assembly = {key: lines for key, _, lines, _ in compiled}
+
+  def function_assembly(key: tuple, ins: list[ir.Instruction]) -> list[str]:
+    lines = assembly.get(key)
+    return generate_function_assembly(key, ins) if lines is None else lines
+
+  return output if keep_ir else None, generate_assembly(output, function_assembly)
+
+# The module being compiled, in a worker process
+worker_tokens: TokenStream
+worker_globals: list[str]
+worker_global_frame: list[Type | FunType]
+
+def start_worker(source_code: str, globals: list[str], global_frame: list[Type | FunType]) -> None:
+  global worker_tokens, worker_globals, worker_global_frame
+  worker_tokens = tokenize_compact(source_code)
+  worker_globals = globals
+  worker_global_frame = global_frame
+
+def compile_functions(spans: list[tuple[int, int]], keep_ir: bool, optimized: bool) -> list[CompiledFunction]:
+  funcs = [parse_function(worker_tokens, span) for span in spans]
+  bind_functions(worker_globals, funcs)
+  checker = TypeChecker(TypeTab)
+  for f in funcs:
+    checker.check_function(f, worker_global_frame)
+
+  gen = new_generator(root_types)
+  ir_frame = [ir.IRVar(name) for name in worker_globals]
+  compiled: list[CompiledFunction] = []
+  for f in funcs:
+    key, ins = gen.function(f, ir_frame)
+    report = io.StringIO()
+    if optimized:
+      ins = optimize({key: ins}, report)[key]
+    compiled.append((key, ins if keep_ir else None, generate_function_assembly(key, ins), report.getvalue()))
+  return compiled
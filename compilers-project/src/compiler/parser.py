@@ -1,306 +1,425 @@
+from typing import Any, Callable, Iterable, Protocol, cast
 from compiler.location import Location
-from compiler.token import Token
+from compiler.token import Token, TokenKind as K, TokenStream
 import compiler.ast as ast
 from compiler.types import Int, Unit, Bool, Type
+from compiler.trampoline import Step, run
 
+# Binding powers of the binary operators as (left, right) pairs.
+# An operator takes the expression before it as its left operand if its
+# left power is at least the minimum power of the expression being parsed,
+# and its right operand is parsed with the right power as the minimum.
+# A right associative operator has a lower right power than left power.
+binding_powers: dict[K, tuple[int, int]] = {
+  K.ASSIGN: (2, 1),
+  K.OR: (3, 4),
+  K.AND: (5, 6),
+  K.EQ: (7, 8),
+  K.NE: (7, 8),
+  K.LT: (9, 10),
+  K.LE: (9, 10),
+  K.GT: (9, 10),
+  K.GE: (9, 10),
+  K.PLUS: (11, 12),
+  K.MINUS: (11, 12),
+  K.STAR: (13, 14),
+  K.SLASH: (13, 14),
+  K.PERCENT: (13, 14),
+}
 
-def parse(tokens: list[Token]) -> ast.Module:
-  pos = 0
-  functions = []
-  
-  precedence = [
-    ['='],
-    ['or'],
-    ['and'],
-    ['==', '!='],
-    ['<', '<=', '>', '>='],
-    ['+', '-'],
-    ['*', '/', '%'],
-    ['not'],
-  ]
-  
-  right_associative_operators = [
-    '='
-  ]
-  
-  types = {
-    'Int': Int,
-    'Bool': Bool,
-    'Unit': Unit,
-  }
-
-  def peek() -> Token:
-    if len(tokens) == 0:
-      raise Exception('Tokens empty, nothing to parse')
+# Operand of a unary operator binds tighter than any binary operator
+unary_binding_power = 15
+
+types = {
+  'Int': Int,
+  'Bool': Bool,
+  'Unit': Unit,
+}
+
+statement_ends = {K.SEMICOLON, K.RBRACE}
+declaration_follows = {K.SEMICOLON, K.LBRACE, K.RBRACE}
+
+
+def parse(tokens: Iterable[Token]) -> ast.Module:
+  return run(Parser(tokens, TreeBuilder()).parse_module())
+
+def parse_function(tokens: TokenStream, span: tuple[int, int]) -> ast.FunctionDefinition:
+  '''Parses one of the function definitions found by function_spans.'''
+  return run(Parser(tokens.tokens(*span), TreeBuilder()).parse_function_def())
+
+
+class NodeBuilder[M, F, E](Protocol):
+  '''Creates the nodes of a parsed module. M is the type of the module,
+  F of function definitions and E of expressions.'''
+  def literal(self, loc: Location, value: int | bool | None, /) -> E: ...
+  def identifier(self, loc: Location, name: str, /) -> E: ...
+  def parameter(self, loc: Location, name: str, type: Type, /) -> E: ...
+  def binary_op(self, loc: Location, left: E, op: str, right: E, /) -> E: ...
+  def condition(self, loc: Location, con: E, then: E, el: E | None, /) -> E: ...
+  def function_call(self, loc: Location, name: E, params: list[E], /) -> E: ...
+  def unary(self, loc: Location, op: str, val: E, /) -> E: ...
+  def block(self, loc: Location, content: list[E], val: E, /) -> E: ...
+  def declaration(self, loc: Location, name: E, val: E, declared_type: Type | None, /) -> E: ...
+  def loop(self, loc: Location, condition: E, do: E, /) -> E: ...
+  def return_(self, loc: Location, val: E, /) -> E: ...
+  def function_definition(self, name: E, type: Type, params: list[E], body: E, /) -> F: ...
+  def module(self, funcs: list[F], body: E, /) -> M: ...
+  def location(self, node: E, /) -> Location: ...
+
+
+class TreeBuilder:
+  '''Builds the compiler.ast tree of a module.'''
+  # Node classes whose fields match the arguments are used as is,
+  # to keep the tree parser free of extra calls
+  literal = ast.Literal
+  identifier = ast.Identifier
+  binary_op = ast.BinaryOp
+  condition = ast.Condition
+  unary = ast.Unary
+  block = ast.Block
+  loop = ast.Loop
+  return_ = ast.Return
+  module = ast.Module
+
+  def parameter(self, loc: Location, name: str, type: Type) -> ast.Expression:
+    return ast.Identifier(loc, name, type=type)
+
+  def function_call(self, loc: Location, name: ast.Expression, params: list[ast.Expression]) -> ast.Expression:
+    return ast.FunctionCall(loc, cast(ast.Identifier, name), params)
+
+  def declaration(self, loc: Location, name: ast.Expression, val: ast.Expression, declared_type: Type | None) -> ast.Expression:
+    return ast.Declaration(loc, cast(ast.Identifier, name), val, declared_type)
 
-    if pos < len(tokens):
-      return tokens[pos]
+  def function_definition(self, name: ast.Expression, type: Type, params: list[ast.Expression], body: ast.Expression) -> ast.FunctionDefinition:
+    return ast.FunctionDefinition(cast(ast.Identifier, name), type, cast(list[ast.Identifier], params), body)
 
-    return Token(
-      loc = tokens[-1].loc,
+  def location(self, node: ast.Expression) -> Location:
+    return node.location
+
+
+class Parser[M, F, E]:
+  '''Parses a module from a stream of tokens.
+
+  Tokens are read lazily, so 'tokens' can be a stream that is still
+  being tokenized. Only the next token and the previous one are kept.
+  The nodes are created with 'build', so the same parser can produce
+  different representations of the module.
+
+  The parse methods that can nest are steps run with
+  compiler.trampoline.run, so nesting depth is not limited by the
+  Python recursion limit.'''
+  def __init__(self, tokens: Iterable[Token], build: NodeBuilder[M, F, E]) -> None:
+    self.tokens = iter(tokens)
+    self.build = build
+    self.lookahead: Token | None = None
+    self.previous: Token | None = None
+    self.end: Token | None = None
+
+  def peek(self) -> Token:
+    if self.lookahead is not None:
+      return self.lookahead
+    if self.end is not None:
+      return self.end
+
+    self.lookahead = next(self.tokens, None)
+    if self.lookahead is not None:
+      return self.lookahead
+
+    if self.previous is None:
+      raise Exception('Tokens empty, nothing to parse')
+
+    self.end = Token(
+      loc = self.previous.loc,
       type = 'end',
       text = ''
     )
-    
-  def peek_back() -> Token:
-    if pos == 0:
+    return self.end
+
+  def peek_back(self) -> Token:
+    if self.previous is None:
       return Token(
-      loc = tokens[-1].loc,
+      loc = self.peek().loc,
       type = 'punctuation',
       text = ';'
       )
-    return tokens[pos-1]
+    return self.previous
 
-  def consume(expected: str | list[str] | None = None) -> Token:
-    nonlocal pos
-    token = peek()
+  def consume(self, expected: str | list[str] | None = None) -> Token:
+    token = self.peek()
     if isinstance(expected, str) and token.text != expected:
       raise Exception(f"{token.loc}: expected '{expected}' got '{token.text}'")
     if isinstance(expected, list) and token.text not in expected:
       comma_separated = ", ".join([f"'{e}'" for e in expected])
       raise Exception(f"{token.loc}: expected one of: {comma_separated} got '{token.text}'")
-    pos += 1
+    if token is not self.end:
+      self.previous = token
+      self.lookahead = None
     return token
 
-  def parse_factor() -> ast.Expression: 
-    if peek().text == '(':
-      return parse_parenthesized()
-    
-    if peek().text == '{':
-      return parse_block()
-    
-    if peek().text == 'if':
-      return parse_condition()
-
-    if peek().type == 'int_literal':
-      token = consume()
-      return ast.Literal(token.loc, int(token.text))
-    
-    if peek().text in ['-', 'not']:
-      token = consume()
-      op = token.text
-      expr = parse_expression(7)
-      return ast.Unary(token.loc, op, expr)
-    
-    if peek().text == 'true':
-      token = consume('true')
-      return ast.Literal(token.loc, True)
-    
-    if peek().text == 'false':
-      token = consume('false')
-      return ast.Literal(token.loc, False)
-    
-    if peek().text == 'var':
-      if peek_back().text not in [';', '{','}',]:
-        raise Exception(
-            f'''{peek().loc}: 
-            Cannot declare here. 
-            Declarations are possible directly in blocks and in top-level expressions
-            '''
-          )
-      
-      return parse_declaration()
-    
-    if peek().text == 'while':
-      return parse_loop()
-
-    if peek().text == 'return':
-      return parse_return()
-      
-    if peek().type == 'identifier':
-      token = consume()
-      if peek().text == '(':
-        return parse_function_call(token.loc, ast.Identifier(token.loc, token.text))
-      
-      return ast.Identifier(token.loc, token.text)
-      
-    raise Exception(f'{peek().loc}: Unexpexted token: {peek().text}')
-
-  def parse_expression(level: int = 0) -> ast.Expression:
-    if level == len(precedence)-1:
-      left = parse_factor()
-    else:
-      left = parse_expression(level+1)
-    while get_precedence(peek().text) == level:
-      operator_token = consume()
-      operator = operator_token.text
+  def parse_module(self) -> Step[M]:
+    build = self.build
+    functions = []
+    while self.peek().kind == K.FUN:
+      functions.append((yield self.parse_function_def()))
+
+    # Location of the value of a top-level block that doesn't end in an expression
+    no_value = Location('f',-1,-1)
+    if self.peek().kind == K.END:
+      return build.module(functions, build.literal(no_value, None))
 
-      if operator in right_associative_operators:
-        right = parse_expression()
+    parsed = yield self.parse_expression()
+    content = [parsed]
+    val: E | None = None
+
+    if self.peek().kind != K.END:
+      if self.peek().kind == K.SEMICOLON:
+        self.consume(';')
+      while self.peek().kind != K.END:
+        if val is not None:
+          content.append(val)
+          val = None
+        if self.peek_back().kind in statement_ends:
+          if self.peek().kind == K.SEMICOLON:
+            if self.peek_back().kind == K.SEMICOLON:
+              raise Exception(f"Unexpected token '{self.peek().text}' at {self.peek().loc}")
+            self.consume(';')
+          if self.peek().kind != K.END:
+            expr = yield self.parse_expression()
+            if self.peek().kind == K.SEMICOLON:
+              content.append(expr)
+              self.consume(';')
+            else:
+              val = expr
+        else:
+          raise Exception(f"Unexpected token '{self.peek().text}' at {self.peek().loc}")
+
+      if val is None:
+        val = build.literal(no_value, None)
+      parsed = build.block(build.location(parsed), content, val)
+
+      if self.peek().kind != K.END:
+        raise Exception(f"Unexpected token '{self.peek().text}' at {self.peek().loc}")
+
+    return build.module(functions, parsed)
+
+  def parse_expression(self, min_power: int = 0) -> Step[E]:
+    # Chains of binary operators are parsed without nested steps.
+    # An operator that is still waiting for its right operand is kept
+    # in 'pending' with its left operand and the minimum power that was
+    # in effect before it.
+    build = self.build
+    pending: list[tuple[Token, E, int]] = []
+    while True:
+      token = self.peek()
+      kind = token.kind
+      # Names and literals are parsed here directly, as the most common factors
+      if kind == K.IDENTIFIER:
+        self.consume()
+        if self.peek().kind == K.LPAREN:
+          left = yield self.parse_function_call(token.loc, build.identifier(token.loc, token.text))
+        else:
+          left = build.identifier(token.loc, token.text)
+      elif kind == K.INT_LITERAL:
+        self.consume()
+        left = build.literal(token.loc, int(token.text))
+      elif kind == K.TRUE or kind == K.FALSE:
+        self.consume()
+        left = build.literal(token.loc, kind == K.TRUE)
       else:
-        right = parse_expression(level+1)
+        left = yield self.parse_factor()
 
-      left = ast.BinaryOp(
-        operator_token.loc,
-        left,
-        operator,
-        right
-      )
+      while True:
+        power = binding_powers.get(self.peek().kind)
+        if power is not None and power[0] >= min_power:
+          pending.append((self.consume(), left, min_power))
+          min_power = power[1]
+          break
+        if not pending:
+          return left
+        operator_token, operand, min_power = pending.pop()
+        left = build.binary_op(
+          operator_token.loc,
+          operand,
+          operator_token.text,
+          left
+        )
+
+  def parse_factor(self) -> Step[E]:
+    factor_parser = factor_parsers.get(self.peek().kind)
+    if factor_parser is None:
+      raise Exception(f'{self.peek().loc}: Unexpexted token: {self.peek().text}')
+    return factor_parser(self) # type: ignore[no-any-return]
 
-    return left
-  
-  def parse_return() -> ast.Expression:
-    start_token = consume('return')
-    value = parse_expression()
-    return ast.Return(start_token.loc, value)
-    
-  def parse_function_def() -> ast.FunctionDefinition:
-    start_token = consume('fun')
-    f_name_token = consume()
-    consume('(')
+  def parse_unary(self) -> Step[E]:
+    token = self.consume()
+    expr = yield self.parse_expression(unary_binding_power)
+    return self.build.unary(token.loc, token.text, expr)
+
+  def parse_return(self) -> Step[E]:
+    start_token = self.consume('return')
+    value = yield self.parse_expression()
+    return self.build.return_(start_token.loc, value)
+
+  def parse_function_def(self) -> Step[F]:
+    build = self.build
+    self.consume('fun')
+    f_name_token = self.consume()
+    self.consume('(')
     params = []
-    while peek().text != ')':
-      name_token = consume()
-      consume(':')
-      type_token = consume(['Int', 'Unit', 'Bool'])
-      params.append(ast.Identifier(
-        location = name_token.loc,
-        type = types[type_token.text],
-        name = name_token.text
+    while self.peek().kind != K.RPAREN:
+      name_token = self.consume()
+      self.consume(':')
+      type_token = self.consume(['Int', 'Unit', 'Bool'])
+      params.append(build.parameter(
+        name_token.loc,
+        name_token.text,
+        types[type_token.text]
       ))
-      if peek().text == ',':
-        consume(',')
-
-    consume(')')
-    consume(':')
-    type_token = consume(['Int', 'Unit', 'Bool'])
-    body = parse_block()
-    return ast.FunctionDefinition(
-      ast.Identifier(f_name_token.loc, f_name_token.text),
+      if self.peek().kind == K.COMMA:
+        self.consume(',')
+
+    self.consume(')')
+    self.consume(':')
+    type_token = self.consume(['Int', 'Unit', 'Bool'])
+    name = build.identifier(f_name_token.loc, f_name_token.text)
+    body = yield self.parse_block()
+    return build.function_definition(
+      name,
       types[type_token.text],
       params,
       body
     )
 
-  def parse_loop() -> ast.Expression:
-    start_token = consume('while')
-    condition = parse_expression()
-    consume('do')
-    do = parse_expression()
-    return ast.Loop(start_token.loc, condition, do)
-  
-  def parse_declaration() -> ast.Expression:
+  def parse_loop(self) -> Step[E]:
+    start_token = self.consume('while')
+    condition = yield self.parse_expression()
+    self.consume('do')
+    do = yield self.parse_expression()
+    return self.build.loop(start_token.loc, condition, do)
+
+  def parse_declaration(self) -> Step[E]:
+    if self.peek_back().kind not in declaration_follows:
+      raise Exception(
+        f'{self.peek().loc}: \n'
+        '            Cannot declare here. \n'
+        '            Declarations are possible directly in blocks and in top-level expressions\n'
+        '            '
+      )
+
     declared_type: Type | None = None
-    consume('var')
-    name_token = consume()
-    if peek().text == ':':
-      consume(':')
-      type_token = consume()
+    self.consume('var')
+    name_token = self.consume()
+    if self.peek().kind == K.COLON:
+      self.consume(':')
+      type_token = self.consume()
       declared_type = types[type_token.text]
-      
-    op_token = consume('=')
-    val = parse_expression()
-    return ast.Declaration(
+
+    op_token = self.consume('=')
+    name = self.build.identifier(name_token.loc, name_token.text)
+    val = yield self.parse_expression()
+    return self.build.declaration(
       op_token.loc,
-      name = ast.Identifier(name_token.loc, name_token.text),
-      val = val,
-      declared_type = declared_type
+      name,
+      val,
+      declared_type
       )
-  
-  def parse_block() -> ast.Expression:
-    start_token = consume('{')
+
+  def parse_block(self) -> Step[E]:
+    build = self.build
+    start_token = self.consume('{')
     content = []
-    val: ast.Expression = ast.Literal(start_token.loc, None)
+    # Location of the value if the block doesn't end in an expression
+    val_loc = start_token.loc
 
-    while peek().text != '}':
-      expr = parse_expression()
+    while self.peek().kind != K.RBRACE:
+      expr = yield self.parse_expression()
       content.append(expr)
 
-      if peek().text == '}':
-        consume('}')
-        val = content.pop()
-        return ast.Block(start_token.loc, content, val)
-      
-      elif peek().text == ';':
-        end = consume(';')
-        val = ast.Literal(end.loc, None)
-        
-      elif peek_back().text not in ['}', ';']:
-        consume([';', '}'])
-
-    consume('}')
-    if peek().text == ';':
-      consume(';')
-    
-    return ast.Block(start_token.loc, content, val)
-  
-  def parse_parenthesized() -> ast.Expression:
-    consume('(')
-    expr = parse_expression()
-    consume(')')
+      if self.peek().kind == K.RBRACE:
+        self.consume('}')
+        return build.block(start_token.loc, content[:-1], content[-1])
+
+      elif self.peek().kind == K.SEMICOLON:
+        end = self.consume(';')
+        val_loc = end.loc
+
+      elif self.peek_back().kind not in statement_ends:
+        self.consume([';', '}'])
+
+    self.consume('}')
+    if self.peek().kind == K.SEMICOLON:
+      self.consume(';')
+
+    return build.block(start_token.loc, content, build.literal(val_loc, None))
+
+  def parse_parenthesized(self) -> Step[E]:
+    self.consume('(')
+    expr = yield self.parse_expression()
+    self.consume(')')
     return expr
-  
-  def parse_condition() -> ast.Expression:
-    start_token = consume('if')
-    con = parse_expression()
-    consume('then')
-    then = parse_expression()
-    if peek().text == 'else':
-      consume()
-      el = parse_expression()
+
+  def parse_condition(self) -> Step[E]:
+    start_token = self.consume('if')
+    con = yield self.parse_expression()
+    self.consume('then')
+    then = yield self.parse_expression()
+    if self.peek().kind == K.ELSE:
+      self.consume()
+      el = yield self.parse_expression()
     else:
       el = None
-    return ast.Condition(
+    return self.build.condition(
       start_token.loc,
       con,
       then,
       el
     )
 
-  def parse_function_call(loc: Location, name: ast.Identifier) -> ast.Expression:
-    consume('(')
-    params: list[ast.Expression] = []
-
-    if peek().text != ')':
-      params.append(parse_expression())
-      while peek().text == ',':
-        consume(',')
-        params.append(parse_expression())
-
-    consume(')')
-    return ast.FunctionCall(loc, name, params)
-  
-  def get_precedence(text: str) -> int:
-    for i in range(len(precedence)):
-      if text in precedence[i]:
-        return i
-
-    return len(precedence)
-  
-  while peek().text == 'fun':
-    functions.append(parse_function_def())
-  if peek().type == 'end':
-    return ast.Module(functions, ast.Literal(Location('f',-1,-1), None))
-
-  parsed = parse_expression()
-  content = [parsed]
-  val: ast.Expression = ast.Literal(Location('f',-1,-1), None)
-
-  if peek().type != 'end':
-    if peek().text == ';':
-      consume(';')
-    while peek().type != 'end':
-      if val != ast.Literal(Location('f',-1,-1), None):
-        content.append(val)
-        val = ast.Literal(Location('f',-1,-1), None)
-      if peek_back().text in [';', '}']:
-        if peek().text == ';':
-          if peek_back().text == ';':
-            raise Exception(f"Unexpected token '{peek().text}' at {peek().loc}")
-          consume(';')
-        if peek().type != 'end':
-          expr = parse_expression()
-          if peek().text == ';':
-            content.append(expr)
-            consume(';')
-          else:
-            val = expr
-      else:
-        raise Exception(f"Unexpected token '{peek().text}' at {peek().loc}")
+  def parse_function_call(self, loc: Location, name: E) -> Step[E]:
+    self.consume('(')
+    params: list[E] = []
+
+    if self.peek().kind != K.RPAREN:
+      params.append((yield self.parse_expression()))
+      while self.peek().kind == K.COMMA:
+        self.consume(',')
+        params.append((yield self.parse_expression()))
+
+    self.consume(')')
+    return self.build.function_call(loc, name, params)
+
 
-    parsed = ast.Block(parsed.location, content, val)
-    
-    if peek().type != 'end':
-      raise Exception(f"Unexpected token '{peek().text}' at {peek().loc}")
+# Parsers of the factors that are not parsed directly in parse_expression
+factor_parsers: dict[K, Callable[[Parser[Any, Any, Any]], Step[Any]]] = {
+  K.LPAREN: Parser.parse_parenthesized,
+  K.LBRACE: Parser.parse_block,
+  K.IF: Parser.parse_condition,
+  K.MINUS: Parser.parse_unary,
+  K.NOT: Parser.parse_unary,
+  K.VAR: Parser.parse_declaration,
+  K.WHILE: Parser.parse_loop,
+  K.RETURN: Parser.parse_return,
+}
 
-  return ast.Module(functions, parsed)
\ No newline at end of file
+def function_spans(tokens: TokenStream) -> tuple[list[tuple[int, int]], int]:
+  '''Finds the function definitions at the start of the module.
+  Returns the first and last index of the tokens of each definition,
+  and the index where the body of the module starts.'''
+  kinds = tokens.kinds
+  count = len(kinds)
+  spans = []
+  i = 0
+  while i < count and kinds[i] == K.FUN:
+    first = i
+    depth = 0
+    while i < count:
+      kind = kinds[i]
+      i += 1
+      if kind == K.LBRACE:
+        depth += 1
+      elif kind == K.RBRACE:
+        depth -= 1
+        if depth == 0:
+          break
+    spans.append((first, i))
+  return spans, i
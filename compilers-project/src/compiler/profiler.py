@@ -0,0 +1,65 @@
+from dataclasses import dataclass
+from time import perf_counter
+from typing import TextIO
+from compiler.location import Location
+
+@dataclass(slots=True)
+class NodeStats:
+  location: Location
+  # The kind of node, and the operator or name in it
+  node: str
+  count: int = 0
+  # Seconds spent running the node, and running it but not its children
+  total: float = 0.0
+  own: float = 0.0
+
+class Profiler:
+  '''Collects the run times of the nodes of an interpreted module.
+
+  Nodes are keyed by their location and kind, as a node can start at
+  the same place as its first child. The times include the time taken
+  to measure the nodes inside them.'''
+  clock = staticmethod(perf_counter)
+
+  def __init__(self) -> None:
+    self.nodes: dict[tuple[str, int, int, str], NodeStats] = {}
+    # The time of the calls by the stack of functions they ran in,
+    # not counting the functions they called
+    self.stacks: dict[str, float] = {}
+    # The time the children of the node being run have taken so far,
+    # and the same for the calls of the function being run
+    self.children = 0.0
+    self.callees = 0.0
+    # The functions being run, outermost first, separated by ';'
+    self.stack = ''
+
+  def stats(self, location: Location, node: str) -> NodeStats:
+    key = (location.file, location.line, location.column, node)
+    stats = self.nodes.get(key)
+    if stats is None:
+      stats = self.nodes[key] = NodeStats(location, node)
+    return stats
+
+  def report(self, out: TextIO, limit: int = 20) -> None:
+    '''Writes the nodes that ran with the most time of their own first.'''
+    nodes = sorted(
+      (stats for stats in self.nodes.values() if stats.count),
+      key=lambda stats: stats.own,
+      reverse=True
+    )
+    total = sum(stats.own for stats in nodes) or 1.0
+    out.write(f'{"own s":>9} {"%":>5} {"total s":>9} {"count":>10}  location  node\n')
+    for stats in nodes[:limit]:
+      loc = stats.location
+      out.write(
+        f'{stats.own:9.4f} {100 * stats.own / total:5.1f} {stats.total:9.4f} {stats.count:10}'
+        f'  {loc.file}:{loc.line}:{loc.column}  {stats.node}\n'
+      )
+
+  def write_collapsed(self, out: TextIO) -> None:
+    '''Writes the time of each stack of functions in microseconds, in
+    the collapsed format read by flamegraph.pl and speedscope.'''
+    for stack, seconds in sorted(self.stacks.items()):
+      microseconds = round(seconds * 1e6)
+      if microseconds:
+        out.write(f'{stack} {microseconds}\n')
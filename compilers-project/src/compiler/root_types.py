@@ -1,7 +1,9 @@
+from types import MappingProxyType
 from compiler.ir import IRVar
 from compiler.types import Int, Bool, Unit
 
-root_types = {
+# Read-only, as it is shared by every compilation
+root_types = MappingProxyType({
   IRVar('+'): Int,
   IRVar('-'): Int,
   IRVar('*'): Int,
@@ -22,4 +24,4 @@ root_types = {
   IRVar('read_int'): Int,
   IRVar('break'): Unit,
   IRVar('continue'): Unit,
-}
\ No newline at end of file
+})
@@ -0,0 +1,238 @@
+import dataclasses
+from typing import Any, Callable, Iterable
+from compiler import ir
+from compiler.cfg import CFG, Block, set_successors
+from compiler.dataflow import Liveness, definition, solve
+from compiler.location import L
+
+def rewrite(
+  insn: ir.Instruction,
+  use: Callable[[ir.IRVar], ir.IRVar],
+  dest: ir.IRVar | None = None
+) -> ir.Instruction:
+  '''Returns the instruction with the variables it reads passed
+  through 'use', and writing to 'dest' if given.'''
+  changes: dict[str, Any] = {}
+  match insn:
+    case ir.Copy() | ir.Return():
+      changes['source'] = use(insn.source)
+    case ir.Call():
+      changes['args'] = [use(arg) for arg in insn.args]
+    case ir.CondJump():
+      changes['cond'] = use(insn.cond)
+    case ir.Phi():
+      changes['sources'] = [use(source) for source in insn.sources]
+  if dest is not None:
+    changes['dest'] = dest
+  return dataclasses.replace(insn, **changes) if changes else insn
+
+def phis(block: Block) -> list[ir.Phi]:
+  '''The phis at the start of the block.'''
+  result = []
+  for insn in block.instructions:
+    if not isinstance(insn, ir.Phi):
+      break
+    result.append(insn)
+  return result
+
+def to_ssa(cfg: CFG, params: Iterable[ir.IRVar] = ()) -> None:
+  '''Gives every definition of a variable its own name, and adds phis
+  where the definitions meet, on the iterated dominance frontiers of
+  the blocks that define them. Phis are only added where the variable
+  is live, found with Liveness.
+
+  The parameters are defined when the function starts, and keep their
+  names there. Blocks that can't be reached are removed, and an empty
+  entry block is added if the entry has predecessors.'''
+  cfg.remove_unreachable()
+  if cfg.entry.predecessors:
+    entry = Block(None, [])
+    cfg.blocks.insert(0, entry)
+    set_successors(entry, [cfg.blocks[1]])
+    cfg.changed()
+  entry = cfg.entry
+  params = list(params)
+
+  liveness = Liveness(cfg)
+  live = solve(liveness)
+  numbers = liveness.numbering.numbers
+  defined_in: dict[ir.IRVar, list[Block]] = {param: [entry] for param in params}
+  for block in cfg.blocks:
+    for insn in block.instructions:
+      dest = definition(insn)
+      if dest is not None:
+        blocks = defined_in.setdefault(dest, [])
+        if not blocks or blocks[-1] is not block:
+          blocks.append(block)
+
+  dominators = cfg.dominators
+  # The variables of the phis of each block
+  phi_vars: dict[Block, list[ir.IRVar]] = {}
+  for var, blocks in defined_in.items():
+    n = numbers.get(var)
+    if n is None or n >= liveness.size:
+      # Never live when a block starts
+      continue
+    bit = 1 << n
+    work = list(blocks)
+    seen = set(blocks)
+    frontier = set()
+    while work:
+      for block in dominators.frontier(work.pop()):
+        if block in frontier:
+          continue
+        frontier.add(block)
+        if live.before[block.index] & bit:
+          phi_vars.setdefault(block, []).append(var)
+        if block not in seen:
+          seen.add(block)
+          work.append(block)
+  for block, vars in phi_vars.items():
+    block.instructions[:0] = [ir.Phi(L, [var] * len(block.predecessors), var) for var in vars]
+
+  # Renamed in a walk of the dominator tree, where the name of each
+  # variable is the one of the closest definition above
+  names: dict[ir.IRVar, list[ir.IRVar]] = {param: [param] for param in params}
+  versions: dict[ir.IRVar, int] = {}
+
+  def current(var: ir.IRVar) -> ir.IRVar:
+    stack = names.get(var)
+    # Variables that aren't defined before, like 'unit', keep their names
+    return stack[-1] if stack else var
+
+  stack: list[tuple[Block, list[ir.IRVar] | None]] = [(entry, None)]
+  while stack:
+    block, defined = stack.pop()
+    if defined is not None:
+      for var in defined:
+        names[var].pop()
+      continue
+    defined = []
+    for i, insn in enumerate(block.instructions):
+      dest = definition(insn)
+      if dest is not None:
+        version = versions.get(dest, 0) + 1
+        versions[dest] = version
+        new = ir.IRVar(f'{dest.name}.{version}')
+      if isinstance(insn, ir.Phi):
+        # The sources are set by the predecessors
+        block.instructions[i] = rewrite(insn, lambda var: var, new)
+      else:
+        block.instructions[i] = rewrite(insn, current, new if dest is not None else None)
+      if dest is not None:
+        names.setdefault(dest, []).append(new)
+        defined.append(dest)
+    for successor in block.successors:
+      j = successor.predecessors.index(block)
+      for k, var in enumerate(phi_vars.get(successor, ())):
+        phi = successor.instructions[k]
+        assert isinstance(phi, ir.Phi)
+        sources = list(phi.sources)
+        sources[j] = current(var)
+        successor.instructions[k] = ir.Phi(phi.location, sources, phi.dest)
+    stack.append((block, defined))
+    stack.extend((child, None) for child in reversed(dominators.children(block)))
+
+def remove_edge(block: Block, successor: Block) -> None:
+  '''Removes an edge of a graph in SSA form, and the sources of the
+  phis that came from it. The instructions of the block are not changed.'''
+  j = successor.predecessors.index(block)
+  for k, phi in enumerate(phis(successor)):
+    successor.instructions[k] = ir.Phi(phi.location, phi.sources[:j] + phi.sources[j + 1:], phi.dest)
+  successor.predecessors.pop(j)
+  block.successors.remove(successor)
+
+def from_ssa(cfg: CFG) -> None:
+  '''Replaces the phis with copies at the ends of the predecessors, in
+  an order where none overwrites a variable another one still reads.
+
+  A block that ends in a CondJump makes the copies before it, where
+  they are also made on the way to its other successor, unless that
+  successor can read the variables the copies set. Then the edge gets
+  a block of its own for the copies. The copies of an edge from a block
+  that only jumps are made in the block before it where they fit, so
+  that simplify_cfg can remove the empty block.'''
+  liveness = Liveness(cfg)
+  live = solve(liveness)
+  numbers = liveness.numbering.numbers
+
+  def live_into(block: Block, var: ir.IRVar) -> bool:
+    n = numbers.get(var)
+    return n is not None and n < liveness.size and bool(live.before[block.index] >> n & 1)
+
+  def fits(block: Block, successor: Block, dests: list[ir.IRVar]) -> bool:
+    # Whether the copies of the edge can be made at the end of the block
+    jump = block.terminator
+    return not isinstance(jump, ir.CondJump) or not any(
+      dest == jump.cond or any(live_into(other, dest) for other in block.successors if other is not successor)
+      for dest in dests
+    )
+
+  for block in list(cfg.blocks):
+    block_phis = phis(block)
+    if not block_phis:
+      continue
+    del block.instructions[:len(block_phis)]
+    for j, predecessor in enumerate(list(block.predecessors)):
+      copies = parallel_copies([(phi.dest, phi.sources[j]) for phi in block_phis])
+      if not copies:
+        continue
+      dests = [dest for dest, _ in copies]
+      earlier = predecessor.predecessors[0] if len(predecessor.predecessors) == 1 else None
+      if (
+        earlier is not None
+        and all(isinstance(insn, ir.Jump) for insn in predecessor.instructions)
+        # The copies of the other edges to the block could be made there too
+        and not any(
+          other is block or block in other.successors
+          for other in earlier.successors if other is not predecessor
+        )
+        and fits(earlier, predecessor, dests)
+      ):
+        predecessor = earlier
+      elif not fits(predecessor, block, dests):
+        predecessor = split_edge(cfg, predecessor, block, j)
+      at = len(predecessor.instructions) - (predecessor.terminator is not None)
+      predecessor.instructions[at:at] = [ir.Copy(L, source, dest) for dest, source in copies]
+  cfg.changed()
+
+def split_edge(cfg: CFG, block: Block, successor: Block, j: int) -> Block:
+  '''Adds a block between a block that ends in a CondJump and its
+  successor, which is the j:th predecessor of the successor.'''
+  label = cfg.label(successor)
+  middle = Block(None, [ir.Jump(L, label)])
+  middle_label = cfg.label(middle)
+  jump = block.terminator
+  assert isinstance(jump, ir.CondJump)
+  block.instructions[-1] = ir.CondJump(
+    jump.location,
+    jump.cond,
+    middle_label if jump.then_label.name == label.name else jump.then_label,
+    middle_label if jump.else_label.name == label.name else jump.else_label,
+  )
+  block.successors[block.successors.index(successor)] = middle
+  successor.predecessors[j] = middle
+  middle.predecessors.append(block)
+  middle.successors.append(successor)
+  cfg.blocks.append(middle)
+  return middle
+
+def parallel_copies(copies: list[tuple[ir.IRVar, ir.IRVar]]) -> list[tuple[ir.IRVar, ir.IRVar]]:
+  '''Orders copies (dest, source) that happen at the same time into
+  copies that happen one after another. Where they form a cycle, the
+  old value of a destination is saved in a temporary.'''
+  pending = [(dest, source) for dest, source in copies if dest != source]
+  result = []
+  while pending:
+    sources = {source for _, source in pending}
+    for i, (dest, source) in enumerate(pending):
+      if dest not in sources:
+        result.append((dest, source))
+        del pending[i]
+        break
+    else:
+      dest = pending[0][0]
+      saved = ir.IRVar(f'{dest.name}.old')
+      result.append((saved, dest))
+      pending = [(d, saved if s == dest else s) for d, s in pending]
+  return result
@@ -1,24 +1,59 @@
 from dataclasses import dataclass, field
-from typing import Any, Type
+from types import MappingProxyType
+from typing import Any, Mapping, Type
 from compiler.ir import IRVar
 
 @dataclass
 class SymTab[T]:
-  locals: dict[Any, T] = field(default_factory=dict)
+  '''A scope of names. Names are stored under their canonical form,
+  str(key), so that every scope is looked up with a single hash lookup.
+
+  The tables of built-ins are read-only and shared by every compilation.
+  A compilation adds its own names to an overlay on top of them.'''
+  locals: Mapping[Any, T] = field(default_factory=dict)
   parent: Any = None
-  
+
+  def __post_init__(self) -> None:
+    if not all(type(key) is str for key in self.locals):
+      canonical = {str(key): v for key, v in self.locals.items()}
+      self.locals = canonical if isinstance(self.locals, dict) else MappingProxyType(canonical)
+
   def require(self, name: str) -> T:
-    for key in self.locals.keys():
-      if str(key) == name:
-        return self.locals[key]
-    if self.parent:
-      return self.parent.require(name)
+    tab: SymTab[T] | None = self
+    while tab is not None:
+      locals = tab.locals
+      if name in locals:
+        return locals[name]
+      tab = tab.parent
     raise Exception(f'{name} is not defined')
   
   def add_local(self, key: Any, v: T) -> None:
-    self.locals[key] = v
+    if not isinstance(self.locals, dict):
+      raise Exception(f'Cannot add {key} to a read-only table')
+    self.locals[str(key)] = v
+
+  def overlay(self) -> 'SymTab[T]':
+    '''Returns an empty scope on top of this one, for names that
+    shadow the names of this scope without changing it.'''
+    return SymTab[T]({}, self)
+
+  def flatten(self) -> dict[str, T]:
+    '''Returns all the names visible in this scope, with the innermost
+    definition of each.'''
+    scopes = []
+    tab: SymTab[T] | None = self
+    while tab is not None:
+      scopes.append(tab.locals)
+      tab = tab.parent
+    names: dict[str, T] = {}
+    for locals in reversed(scopes):
+      names.update(locals)
+    return names
+
+def read_only[T](names: dict[str, T]) -> SymTab[T]:
+  return SymTab(MappingProxyType(names))
 
-TopTab = SymTab({
+TopTab = read_only({
   '+': lambda a, b: a + b,
   '-': lambda a, b: a - b,
   '*': lambda a, b: a * b,
@@ -34,4 +69,4 @@ TopTab = SymTab({
   'and': lambda a, b: a and b,
   'unary_-': lambda a: -a,
   'unary_not': lambda a: not a,
-})
\ No newline at end of file
+})
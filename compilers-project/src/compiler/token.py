@@ -1,8 +1,166 @@
-from dataclasses import dataclass
-from compiler.location import Location
+from array import array
+from dataclasses import dataclass, field
+from enum import IntEnum
+from sys import intern
+from typing import Iterator
+from compiler.location import Location, LazyLocation, SourceMap
 
-@dataclass
+class TokenKind(IntEnum):
+  END = 0
+  INT_LITERAL = 1
+  IDENTIFIER = 2
+
+  # Keywords
+  IF = 3
+  THEN = 4
+  ELSE = 5
+  WHILE = 6
+  DO = 7
+  VAR = 8
+  FUN = 9
+  RETURN = 10
+  TRUE = 11
+  FALSE = 12
+  AND = 13
+  OR = 14
+  NOT = 15
+
+  # Operators
+  ASSIGN = 16
+  EQ = 17
+  NE = 18
+  LT = 19
+  LE = 20
+  GT = 21
+  GE = 22
+  PLUS = 23
+  MINUS = 24
+  STAR = 25
+  SLASH = 26
+  PERCENT = 27
+
+  # Punctuation
+  LPAREN = 28
+  RPAREN = 29
+  LBRACE = 30
+  RBRACE = 31
+  COMMA = 32
+  SEMICOLON = 33
+  COLON = 34
+
+# Kinds of keywords, operators and punctuation by their text
+kinds_by_text = {
+  'if': TokenKind.IF,
+  'then': TokenKind.THEN,
+  'else': TokenKind.ELSE,
+  'while': TokenKind.WHILE,
+  'do': TokenKind.DO,
+  'var': TokenKind.VAR,
+  'fun': TokenKind.FUN,
+  'return': TokenKind.RETURN,
+  'true': TokenKind.TRUE,
+  'false': TokenKind.FALSE,
+  'and': TokenKind.AND,
+  'or': TokenKind.OR,
+  'not': TokenKind.NOT,
+  '=': TokenKind.ASSIGN,
+  '==': TokenKind.EQ,
+  '!=': TokenKind.NE,
+  '<': TokenKind.LT,
+  '<=': TokenKind.LE,
+  '>': TokenKind.GT,
+  '>=': TokenKind.GE,
+  '+': TokenKind.PLUS,
+  '-': TokenKind.MINUS,
+  '*': TokenKind.STAR,
+  '/': TokenKind.SLASH,
+  '%': TokenKind.PERCENT,
+  '(': TokenKind.LPAREN,
+  ')': TokenKind.RPAREN,
+  '{': TokenKind.LBRACE,
+  '}': TokenKind.RBRACE,
+  ',': TokenKind.COMMA,
+  ';': TokenKind.SEMICOLON,
+  ':': TokenKind.COLON,
+}
+
+kinds_by_type = {
+  'end': TokenKind.END,
+  'int_literal': TokenKind.INT_LITERAL,
+  'identifier': TokenKind.IDENTIFIER,
+}
+
+def token_kind(text: str, type: str) -> TokenKind:
+  kind = kinds_by_text.get(text)
+  if kind is None:
+    return kinds_by_type.get(type, TokenKind.IDENTIFIER)
+  return kind
+
+@dataclass(slots=True, init=False)
 class Token:
   text: str
   type: str
-  loc: Location
\ No newline at end of file
+  loc: Location
+  kind: TokenKind = field(compare=False, repr=False)
+
+  def __init__(self, text: str, type: str, loc: Location, kind: TokenKind | None = None) -> None:
+    self.text = text
+    self.type = type
+    self.loc = loc
+    # Token streams already know the kind
+    self.kind = token_kind(text, type) if kind is None else kind
+
+# The kinds by their numbers in a TokenStream
+kinds_by_number = list(TokenKind)
+
+# The token type of each kind, for the kinds stored in a TokenStream
+types_by_kind = ['identifier'] * len(TokenKind)
+types_by_kind[TokenKind.END] = 'end'
+types_by_kind[TokenKind.INT_LITERAL] = 'int_literal'
+for text, kind in kinds_by_text.items():
+  if not text.isalpha():
+    types_by_kind[kind] = 'punctuation' if text in '(){},;:' else 'operator'
+
+class TokenStream:
+  '''The tokens of one source string stored as parallel arrays of kinds,
+  start offsets and lengths.
+
+  Token objects are only created when the stream is iterated or indexed,
+  and their locations are resolved from the offsets when needed.'''
+  def __init__(self, source: str, file: str = 'file') -> None:
+    self.source = source
+    self.source_map = SourceMap(file, source)
+    self.kinds = array('i')
+    self.starts = array('i')
+    self.lengths = array('i')
+
+  def append(self, kind: TokenKind, start: int, end: int) -> None:
+    self.kinds.append(kind)
+    self.starts.append(start)
+    self.lengths.append(end - start)
+
+  def __len__(self) -> int:
+    return len(self.kinds)
+
+  def __getitem__(self, i: int) -> Token:
+    start = self.starts[i]
+    kind = self.kinds[i]
+    return Token(
+      self.source[start:start + self.lengths[i]],
+      types_by_kind[kind],
+      LazyLocation(self.source_map, start),
+      kinds_by_number[kind]
+    )
+
+  def __iter__(self) -> Iterator[Token]:
+    return self.tokens(0, len(self))
+
+  def tokens(self, first: int, last: int) -> Iterator[Token]:
+    '''Iterates over the tokens from index 'first' up to 'last'.'''
+    source = self.source
+    source_map = self.source_map
+    for kind, start, length in zip(self.kinds[first:last], self.starts[first:last], self.lengths[first:last]):
+      text = source[start:start + length]
+      if kind != TokenKind.INT_LITERAL:
+        text = intern(text)
+      yield Token(text, types_by_kind[kind], LazyLocation(source_map, start), kinds_by_number[kind])
@@ -1,80 +1,140 @@
+import codecs
+import mmap
 import re
+from sys import intern
+from typing import BinaryIO, Iterable, Iterator
 from compiler.location import Location
-from compiler.token import Token
+from compiler.token import Token, TokenKind, TokenStream, kinds_by_text
+
+# All token rules combined into one pattern. Alternatives are tried left to
+# right, so the order here is the priority order of the rules. The block
+# comment rule is written so that it never backtracks: it consumes runs of
+# non-'*' characters and only looks for the closing '/' after a '*'.
+# The last alternative matches any other character so that the matches
+# always cover the whole source and the error can be reported.
+token_pattern = re.compile(r'''
+  (?P<comment>(?://|\#)[^\n]*|/\*[^*]*\*+(?:[^/*][^*]*\*+)*/)
+  |(?P<whitespace>[ \n]+)
+  |(?P<int_literal>[0-9]+)
+  |(?P<identifier>[a-zA-Z_][0-9a-zA-Z_]*)
+  |(?P<operator>==|!=|<=|>=|[-+*/=<>%])
+  |(?P<punctuation>[(){},;:])
+  |(?P<error>.)
+''', re.VERBOSE | re.DOTALL)
+
+chunk_size = 1 << 16
 
 def tokenize(source_code: str) -> list[Token]:
-  re_identifier = re.compile(r'[a-zA-Z_][0-9a-zA-Z_]*')
-  re_int_lit = re.compile(r'[0-9]+')
-  re_whitespace = re.compile(r'[ \n]+')
-  re_operator = re.compile(r'==|!=|<=|>=|\+|-|\*|/|=|<|>|%')
-  re_punctuation = re.compile(r'\(|\)|\{|\}|,|;|:')
-  re_comment = re.compile(r'(//|#).*|/\*(\n|.)*?\*/')
-  
+  return list(tokenize_stream((source_code,)))
+
+def tokenize_compact(source_code: str) -> TokenStream:
+  '''Tokenizes source code into a TokenStream, without creating an
+  object for every token.'''
+  stream = TokenStream(source_code)
+  append = stream.append
+  get_kind = kinds_by_text.get
+  for match in token_pattern.finditer(source_code):
+    type = match.lastgroup
+    if type == 'whitespace' or type == 'comment':
+      continue
+    start, end = match.span()
+    if type == 'int_literal':
+      append(TokenKind.INT_LITERAL, start, end)
+    elif type == 'error':
+      loc = stream.source_map.location(start)
+      raise Exception(f'{loc}: Syntax Error, unexpected character {source_code[start]!r}')
+    else:
+      append(get_kind(match.group(), TokenKind.IDENTIFIER), start, end)
+  return stream
+
+def tokenize_stream(chunks: Iterable[str]) -> Iterator[Token]:
+  '''Lazily tokenizes source code that arrives in pieces.
 
-  i = 0
-  tokens: list[Token] = []
+  Only the text that has not been tokenized yet is kept in memory.
+  A chunk is tokenized up to its last newline, because apart from block
+  comments no token can continue past the end of a line. Until a later
+  chunk ends the line or the comment, only the new chunks are searched,
+  so long lines and comments take linear time.'''
+  finditer = token_pattern.finditer
+  buffer = ''
+  # Chunks that end nothing started in 'buffer', so it is not tokenized
+  # again until one does
+  pending: list[str] = []
+  # Whether 'buffer' starts with a block comment whose end has not arrived
+  in_comment = False
   line = 1
-  col = 1
-  
-  def checkMatch(type: str) -> None:
-    nonlocal i
-    nonlocal tokens
-    nonlocal line
-    nonlocal col
+  # Offset of the first character of the current line in 'buffer'.
+  # Negative when the line started in text that was already dropped.
+  line_start = 0
+  chunk_iter = iter(chunks)
+  eof = False
 
-    if not match:
-      return
+  while not eof:
+    chunk = next(chunk_iter, None)
+    if chunk is None:
+      eof = True
+    else:
+      # Only the new text is searched, with the character before it
+      # in case the end of the comment is split between the chunks
+      before = pending[-1][-1:] if pending else buffer[-1:]
+      if ('*/' not in before + chunk) if in_comment else ('\n' not in chunk):
+        pending.append(chunk)
+        continue
+    buffer = ''.join([buffer, *pending, chunk or ''])
+    pending.clear()
+    if eof:
+      safe_end = len(buffer)
+    elif in_comment:
+      safe_end = max(buffer.rfind('\n') + 1, buffer.find('*/', 2) + 2)
+    else:
+      safe_end = buffer.rfind('\n') + 1
 
-    i = match.end()
-    
-    match_lines = 0
-    match_cols = 0
-    
-    for char in match.group():
-      if char == '\n':
-        match_lines += 1
-        match_cols = 0
-        col = 1
+    pos = 0
+    in_comment = False
+    for match in finditer(buffer, 0, safe_end):
+      type = match.lastgroup
+      start, end = match.span()
+      if type == 'whitespace' or type == 'comment':
+        newlines = buffer.count('\n', start, end)
+        if newlines:
+          line += newlines
+          line_start = buffer.rfind('\n', start, end) + 1
+      elif type == 'error':
+        loc = Location('file', line, start - line_start + 1)
+        raise Exception(f'{loc}: Syntax Error, unexpected character {buffer[start]!r}')
+      elif not eof and type == 'operator' and buffer.startswith('/*', start):
+        # A block comment that may end in a later chunk
+        in_comment = buffer.find('*/', start + 2) < 0
+        break
       else:
-        match_cols += 1
+        text = match.group()
+        if type == 'identifier':
+          # Names are looked up from dicts in every later pass
+          text = intern(text)
+        yield Token(text, type, Location('file', line, start - line_start + 1)) # type: ignore[arg-type]
+      pos = end
 
-    if type == 'whitespace' or type == 'comment':
-      line += match_lines
-      col += match_cols
-      return
+    buffer = buffer[pos:]
+    line_start -= pos
 
-    tokens.append(Token(match[0], type, Location('file', line, col)))
-    line += match_lines
-    col += match_cols
-    return
+def tokenize_file(file: BinaryIO) -> Iterator[Token]:
+  '''Lazily tokenizes a UTF-8 encoded source file.
 
-  while i < len(source_code):
-    
-    match = re_comment.match(source_code, i)
-    if match:
-      checkMatch('comment')
-      continue
-    match = re_whitespace.match(source_code, i)
-    if match:
-      checkMatch('whitespace')
-      continue
-    match = re_int_lit.match(source_code, i)
-    if match:
-      checkMatch('int_literal')
-      continue
-    match = re_identifier.match(source_code, i)
-    if match:
-      checkMatch('identifier')
-      continue
-    match = re_operator.match(source_code, i)
-    if match:
-      checkMatch('operator')
-      continue
-    match = re_punctuation.match(source_code, i)
-    if match:
-      checkMatch('punctuation')
-      continue
+  Regular files are mapped to memory and decoded one chunk at a time.'''
+  try:
+    source = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+  except (OSError, ValueError):
+    # Pipes and other files that can't be mapped, or an empty file
+    yield from tokenize_stream(_decode(iter(lambda: file.read(chunk_size), b'')))
+    return
 
-    raise Exception(f'Syntax Error, tokens:{tokens}')
+  with source:
+    yield from tokenize_stream(_decode(
+      source[i:i + chunk_size] for i in range(0, len(source), chunk_size)
+    ))
 
-  return tokens
\ No newline at end of file
+def _decode(chunks: Iterator[bytes]) -> Iterator[str]:
+  decoder = codecs.getincrementaldecoder('utf-8')()
+  for chunk in chunks:
+    yield decoder.decode(chunk)
+  yield decoder.decode(b'', final=True)
@@ -0,0 +1,41 @@
+from types import GeneratorType
+from typing import Any, Generator
+
+# A step of a recursive pass that runs on an explicit stack instead of the
+# Python call stack. Instead of calling itself recursively, the pass yields
+# the step of the recursive call and is sent its result back:
+#
+#   def visit(node: ast.Expression) -> Step[int]:
+#     left = yield visit(node.left)
+#     right = yield visit(node.right)
+#     return left + right
+#
+#   run(visit(tree))
+#
+# A step can also yield a plain value, which is sent straight back, so
+# nodes without children can be handled without creating a step.
+# Nesting depth is then only limited by memory.
+type Step[T] = Generator[Any, Any, T]
+
+def run[T](step: Step[T]) -> T:
+  '''Runs a step and all the steps it yields to completion,
+  and returns the result of the first one.'''
+  if type(step) is not GeneratorType:
+    # A plain value in place of a step
+    return step # type: ignore[return-value]
+  stack: list[Step[Any]] = [step]
+  value: Any = None
+  while True:
+    try:
+      call = stack[-1].send(value)
+    except StopIteration as result:
+      stack.pop()
+      if not stack:
+        return result.value # type: ignore[no-any-return]
+      value = result.value
+    else:
+      if type(call) is GeneratorType:
+        stack.append(call)
+        value = None
+      else:
+        value = call
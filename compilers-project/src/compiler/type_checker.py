@@ -1,128 +1,180 @@
+from typing import Iterable
 import compiler.ast as ast
 from compiler.types import Int, Bool, Unit, Type, FunType
 from compiler.symtab import SymTab
+from compiler.binder import Frames, bind
+from compiler.trampoline import Step, run
+from compiler.visitor import Visitor, visits
 
-def typecheck(mod: ast.Module, typetab: SymTab) -> Type:
-  def typecheck_node(node: ast.Expression, typetab: SymTab) -> Type:
-    def get_type() -> Type:
-      def get_from_tab(key: str, params: tuple) -> Type:
-        tab = typetab
-        while key not in tab.locals.keys():
-          if tab.parent:
-            tab = tab.parent
-          else:
-            raise Exception(f"{node.location}: '{key}' is not defined")
-        f = tab.locals[key]
-        
-        if params != f.params:
-          raise Exception(f"{node.location}: Unsupported parameters for '{key}' Expected: {f.params} got: {params}")
-        
-        return f.rtype
-      
-      match node:
-        case ast.BinaryOp():
-          t1 = typecheck_node(node.left, typetab)
-          t2 = typecheck_node(node.right, typetab)
-          tab = typetab
-          
-          if node.op == '=':
-            if t1 != t2:
-              raise Exception(f"{node.location}, expected matching types for '=', got {t1} and {t2}")
-            return t2
-          
-          if node.op in ['==', '!=']:
-            if t1 != t2:
-              raise Exception(f"{node.location}, expected matching types for {node.op}, got {t1} and {t2}")
-            return Bool
-            
-          return get_from_tab(node.op, (t1, t2))
-        
-        case ast.Literal():
-          if isinstance(node.value, bool):
-            return Bool
-          if node.value is None:
-            return Unit
-          if isinstance(node.value, int):
-            return Int
-          
-        case ast.Identifier():
-          tab = typetab
-          while node.name  not in tab.locals.keys():
-            if tab.parent:
-              tab = tab.parent
-            else:
-              raise Exception
-          return tab.locals[node.name]
-        
-        case ast.Declaration():
-          t1 = typecheck_node(node.val, typetab)
-          if node.declared_type is not None and node.declared_type != t1:
-            raise Exception(f"{node.location}, unmatched declared type and value type: {node.declared_type} != {t1}")
-          if typetab.locals.get(node.name.name) != None:
-            raise Exception(f"{node.location}, Variable already delcared in this scope '{node.name.name}'")
-          typetab.locals[node.name.name] = t1
-          return Unit
-        
-        case ast.Block():
-          local_tab = SymTab['str']({}, typetab)
-          for expr in node.content:
-            typecheck_node(expr, local_tab)
-          
-          return typecheck_node(node.val, local_tab)
-        
-        case ast.Unary():
-          t1 = typecheck_node(node.val, typetab)
-          op = f'unary_{node.op}'
-          return get_from_tab(op, (t1,))
-
-        
-        case ast.FunctionCall():
-          param_types = tuple([typecheck_node(param, typetab) for param in node.params])
-          return get_from_tab(node.name.name, param_types)
-        
-        case ast.Condition():
-          t1 = typecheck_node(node.con, typetab)
-          if t1 is not Bool:
-            raise Exception(f"{node.location}, expected {Bool} got {t1}")
-          
-          t2 = typecheck_node(node.then, typetab)
-          if node.el is None:
-            return t2
-          t3 = typecheck_node(node.el, typetab)
-          if t2 != t3:
-            raise Exception(f"{node.location}, expected matching types for both branches of if, got {t1} and {t2}")
-          return t2
-        
-        case ast.Loop():
-          t1 = typecheck_node(node.condition, typetab)
-          if t1 is not Bool:
-            raise Exception(f"{node.location}, expected {Bool} got {t1}")
-          t2 = typecheck_node(node.do, typetab)
-          return t2
-        
-        case ast.Return():
-          t = typecheck_node(node.val, typetab)
-          if t != get_from_tab(f.name.name, (tuple(p.type for p in f.params))):
-            raise Exception(f"{node.location}, expected {f.name.name} got {t}")
-          return t
-
-        case _:
-          raise NotImplemented
-
-    t = get_type()
+def typecheck(
+  mod: ast.Module,
+  typetab: SymTab,
+  functions: Iterable[ast.FunctionDefinition] | None = None
+) -> Type:
+  '''Checks the module and returns the type of its body. If 'functions'
+  is given, only the bodies of those functions are checked.'''
+  if mod.globals is None:
+    bind(mod, typetab.flatten())
+  checker = TypeChecker(typetab)
+  global_frame = global_types(mod, typetab)
+  for f in mod.funcs if functions is None else functions:
+    checker.check_function(f, global_frame)
+
+  return run(checker.visit(mod.body, [global_frame, [Unit] * mod.frame_size]))
+
+def global_types(mod: ast.Module, typetab: SymTab) -> list[Type | FunType]:
+  '''Returns the types of the global slots of a bound module. These
+  are known before any function body is checked.'''
+  assert mod.globals is not None
+  builtins = mod.globals[:len(mod.globals) - len(mod.funcs)]
+  global_frame = [typetab.require(name) for name in builtins]
+  for f in mod.funcs:
+    global_frame.append(FunType(tuple(p.type for p in f.params), f.type))
+  return global_frame
+
+class TypeChecker(Visitor[Frames, Type]):
+  '''Checks the types of expressions and stores them in node.type.
+
+  Expects a bound module: the types of the variables are kept in frames
+  indexed by the slots given by compiler.binder.'''
+  def __init__(self, typetab: SymTab) -> None:
+    # Operators are not bound, so they are still looked up by name
+    self.operators = typetab.flatten()
+    # The return types of the operators by name and parameter types.
+    # Types are interned, so the parameters can be used in the key.
+    self.overloads: dict[tuple[str, tuple], Type] = {
+      (name, t.params): t.rtype
+      for name, t in self.operators.items() if isinstance(t, FunType)
+    }
+    # The function whose body is being checked
+    self.function: ast.FunctionDefinition | None = None
+
+  def check_function(self, f: ast.FunctionDefinition, global_frame: list[Type | FunType]) -> None:
+    self.function = f
+    run(self.visit(f.body, [global_frame, [p.type for p in f.params]]))
+    self.function = None
+
+  def get_from_tab(self, node: ast.Expression, key: str, params: tuple) -> Type:
+    t = self.overloads.get((key, params))
+    if t is not None:
+      return t
+    if key not in self.operators:
+      raise Exception(f"{node.location}: '{key}' is not defined")
+    return self.call(node, key, self.operators[key], params)
+
+  def call(self, node: ast.Expression, key: str, f: FunType | Type, params: tuple) -> Type:
+    if not isinstance(f, FunType):
+      raise Exception(f"{node.location}: '{key}' is not a function")
+    if params != f.params:
+      raise Exception(f"{node.location}: Unsupported parameters for '{key}' Expected: {f.params} got: {params}")
+
+    return f.rtype
+
+  @visits(ast.BinaryOp)
+  def binary_op(self, node: ast.BinaryOp, frames: Frames) -> Step[Type]:
+    t1 = yield self.visit(node.left, frames)
+    t2 = yield self.visit(node.right, frames)
+
+    if node.op == '=':
+      if t1 is not t2:
+        raise Exception(f"{node.location}, expected matching types for '=', got {t1} and {t2}")
+      t = t2
+
+    elif node.op in ['==', '!=']:
+      if t1 is not t2:
+        raise Exception(f"{node.location}, expected matching types for {node.op}, got {t1} and {t2}")
+      t = Bool
+
+    else:
+      t = self.get_from_tab(node, node.op, (t1, t2))
     node.type = t
     return t
 
-  for f in mod.funcs:
-    t = FunType(tuple(p.type for p in f.params), f.type)
-    typetab.locals[f.name.name] = t
-  
-  for f in mod.funcs:
-    for p in f.params:
-      typetab.locals[p.name] = p.type
-    typecheck_node(f.body, typetab)
+  @visits(ast.Literal)
+  def literal(self, node: ast.Literal, frames: Frames) -> Type:
+    if isinstance(node.value, bool):
+      t = Bool
+    elif node.value is None:
+      t = Unit
+    elif isinstance(node.value, int):
+      t = Int
+    node.type = t
+    return t
+
+  @visits(ast.Identifier)
+  def identifier(self, node: ast.Identifier, frames: Frames) -> Type:
+    t = frames[node.depth][node.slot]
+    node.type = t
+    return t # type: ignore[no-any-return]
+
+  @visits(ast.Declaration)
+  def declaration(self, node: ast.Declaration, frames: Frames) -> Step[Type]:
+    t1 = yield self.visit(node.val, frames)
+    if node.declared_type is not None and node.declared_type is not t1:
+      raise Exception(f"{node.location}, unmatched declared type and value type: {node.declared_type} != {t1}")
+    frames[node.name.depth][node.name.slot] = t1
+    node.type = Unit
+    return Unit
+
+  @visits(ast.Block)
+  def block(self, node: ast.Block, frames: Frames) -> Step[Type]:
+    frames.append([Unit] * node.frame_size)
+    for expr in node.content:
+      yield self.visit(expr, frames)
+
+    t = yield self.visit(node.val, frames)
+    frames.pop()
+    node.type = t
+    return t
+
+  @visits(ast.Unary)
+  def unary(self, node: ast.Unary, frames: Frames) -> Step[Type]:
+    t1 = yield self.visit(node.val, frames)
+    op = f'unary_{node.op}'
+    t = self.get_from_tab(node, op, (t1,))
+    node.type = t
+    return t
 
+  @visits(ast.FunctionCall)
+  def function_call(self, node: ast.FunctionCall, frames: Frames) -> Step[Type]:
+    param_types = []
+    for param in node.params:
+      param_types.append((yield self.visit(param, frames)))
+    name = node.name
+    t = self.call(node, name.name, frames[name.depth][name.slot], tuple(param_types))
+    node.type = t
+    return t
+
+  @visits(ast.Condition)
+  def condition(self, node: ast.Condition, frames: Frames) -> Step[Type]:
+    t1 = yield self.visit(node.con, frames)
+    if t1 is not Bool:
+      raise Exception(f"{node.location}, expected {Bool} got {t1}")
 
-  
-  return typecheck_node(mod.body, typetab)
-  
\ No newline at end of file
+    t2 = yield self.visit(node.then, frames)
+    if node.el is not None:
+      t3 = yield self.visit(node.el, frames)
+      if t2 is not t3:
+        raise Exception(f"{node.location}, expected matching types for both branches of if, got {t1} and {t2}")
+    node.type = t2
+    return t2
+
+  @visits(ast.Loop)
+  def loop(self, node: ast.Loop, frames: Frames) -> Step[Type]:
+    t1 = yield self.visit(node.condition, frames)
+    if t1 is not Bool:
+      raise Exception(f"{node.location}, expected {Bool} got {t1}")
+    t = yield self.visit(node.do, frames)
+    node.type = t
+    return t
+
+  @visits(ast.Return)
+  def return_(self, node: ast.Return, frames: Frames) -> Step[Type]:
+    t = yield self.visit(node.val, frames)
+    f = self.function
+    if f is None:
+      raise Exception(f"{node.location}, return outside of a function")
+    if t is not f.type:
+      raise Exception(f"{node.location}, expected {f.name.name} got {t}")
+    node.type = t
+    return t
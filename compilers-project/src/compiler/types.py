@@ -1,21 +1,51 @@
+import builtins
 from dataclasses import dataclass
-from compiler.symtab import SymTab
+from typing import Any
+from compiler.symtab import read_only
 
-@dataclass(frozen=True)
+# The only instance of each type, by class and fields
+interned: dict[tuple, Any] = {}
+
+@dataclass(frozen=True, eq=False)
 class Type:
+  '''Types are interned, so each type has exactly one instance.
+  They are compared with 'is' and hashed by identity.'''
   type: type | None
-  
-@dataclass
+
+  def __new__(cls, type: builtins.type | None) -> 'Type':
+    key = (cls, type)
+    t = interned.get(key)
+    if t is None:
+      t = interned.setdefault(key, super().__new__(cls))
+    return t # type: ignore[no-any-return]
+
+  def __reduce__(self) -> tuple:
+    # Interned again when unpickled in another process
+    return (Type, (self.type,))
+
+@dataclass(frozen=True, eq=False)
 class FunType:
+  '''The type of a function. Interned like Type, so signatures can be
+  compared with 'is' and used as dict keys.'''
   params: tuple
   rtype: Type
-  
-    
+
+  def __new__(cls, params: tuple, rtype: Type) -> 'FunType':
+    key = (cls, params, rtype)
+    t = interned.get(key)
+    if t is None:
+      t = interned.setdefault(key, super().__new__(cls))
+    return t # type: ignore[no-any-return]
+
+  def __reduce__(self) -> tuple:
+    return (FunType, (self.params, self.rtype))
+
+
 Int = Type(int)
 Bool = Type(bool)
 Unit = Type(None)
 
-TypeTab = SymTab({
+TypeTab = read_only({
   '+': FunType((Int, Int), Int),
   '-': FunType((Int, Int), Int),
   '*': FunType((Int, Int), Int),
@@ -0,0 +1,41 @@
+from typing import Any, Callable, ClassVar
+from compiler import ast
+from compiler.trampoline import Step
+
+type Handler = Callable[..., Any]
+
+def visits(*node_types: type) -> Callable[[Handler], Handler]:
+  '''Marks a method of a Visitor as the handler of the given node classes.'''
+  def mark(handler: Handler) -> Handler:
+    handler.visits = node_types # type: ignore[attr-defined]
+    return handler
+  return mark
+
+class Visitor[C, R]:
+  '''Base class of the passes over the AST.
+
+  The handler of each node class is looked up from a dict keyed by
+  type(node), which is built once for every subclass from the methods
+  marked with @visits. C is the type of the context passed down the
+  tree, usually the symbol table of the current scope, and R the type
+  of the results.
+
+  A handler can be a step of compiler.trampoline.run that yields
+  self.visit(child, context) to visit its children, or a plain method
+  that returns its result directly.'''
+  handlers: ClassVar[dict[type, Handler]] = {}
+
+  def __init_subclass__(cls) -> None:
+    super().__init_subclass__()
+    cls.handlers = dict(cls.handlers)
+    for attribute in vars(cls).values():
+      for node_type in getattr(attribute, 'visits', ()):
+        cls.handlers[node_type] = attribute
+
+  def visit(self, node: ast.Expression, context: C) -> Step[R]:
+    '''Returns the step that visits the node, or for nodes handled by a
+    plain method, the result itself. Either can be yielded or run.'''
+    handler = self.handlers.get(type(node))
+    if handler is None:
+      raise Exception(f'{node.location}: {type(self).__name__} does not support {type(node).__name__}')
+    return handler(self, node, context) # type: ignore[no-any-return]
@@ -0,0 +1,76 @@
+import pytest
+from compiler import ast
+from compiler.binder import bind
+from compiler.parser import parse
+from compiler.tokenizer import tokenize
+
+def bound(source: str) -> ast.Module:
+  module = parse(tokenize(source))
+  bind(module, ['print_int'])
+  return module
+
+def test_slots() -> None:
+  module = bound('{ var a = 1; var b = a; { var a = b; a } }')
+  block = module.body
+  assert isinstance(block, ast.Block) and block.frame_size == 2
+  a, b = block.content
+  assert isinstance(a, ast.Declaration) and isinstance(b, ast.Declaration)
+  assert (a.name.depth, a.name.slot) == (2, 0)
+  assert (b.name.depth, b.name.slot) == (2, 1)
+  assert isinstance(b.val, ast.Identifier) and (b.val.depth, b.val.slot) == (2, 0)
+  inner = block.val
+  assert isinstance(inner, ast.Block) and inner.frame_size == 1
+  shadowing = inner.content[0]
+  assert isinstance(shadowing, ast.Declaration) and isinstance(shadowing.val, ast.Identifier)
+  assert (shadowing.val.depth, shadowing.val.slot) == (2, 1)
+  assert isinstance(inner.val, ast.Identifier) and (inner.val.depth, inner.val.slot) == (3, 0)
+
+def test_value_is_bound_before_the_declared_name() -> None:
+  module = bound('var x = 1; { var x = x; x }')
+  assert isinstance(module.body, ast.Block)
+  inner = module.body.val
+  assert isinstance(inner, ast.Block) and isinstance(inner.content[0], ast.Declaration)
+  val = inner.content[0].val
+  assert isinstance(val, ast.Identifier) and (val.depth, val.slot) == (2, 0)
+
+def test_functions_and_parameters() -> None:
+  module = bound('fun f(a: Int, b: Int): Int { return g(b); } fun g(x: Int): Int { return f(x, x); } print_int(g(1))')
+  assert module.globals == ['print_int', 'f', 'g']
+  assert module.funcs[0].frame_size == 2
+  assert module.frame_size == 0
+  call = module.body
+  assert isinstance(call, ast.FunctionCall) and (call.name.depth, call.name.slot) == (0, 0)
+  inner = call.params[0]
+  assert isinstance(inner, ast.FunctionCall) and (inner.name.depth, inner.name.slot) == (0, 2)
+  body = module.funcs[0].body
+  assert isinstance(body, ast.Block) and isinstance(body.content[0], ast.Return)
+  g_call = body.content[0].val
+  assert isinstance(g_call, ast.FunctionCall) and isinstance(g_call.params[0], ast.Identifier)
+  assert (g_call.params[0].depth, g_call.params[0].slot) == (1, 1)
+
+def test_errors_are_reported_together() -> None:
+  with pytest.raises(Exception) as exc:
+    bound('fun f(a: Int, a: Int): Int { return b; }\n{ var x = 1;\nvar x = y; z }')
+  assert exc.value.args[0] == '\n'.join([
+    "Location(file='file', line=1, column=15): 'a' is already declared in this scope",
+    "Location(file='file', line=1, column=37): 'b' is not defined",
+    "Location(file='file', line=3, column=9): 'y' is not defined",
+    "Location(file='file', line=3, column=5): 'x' is already declared in this scope",
+    "Location(file='file', line=3, column=12): 'z' is not defined",
+  ])
+
+def test_names_go_out_of_scope() -> None:
+  with pytest.raises(Exception) as exc:
+    bound('{ { var a = 1 }; a }')
+  assert exc.value.args[0] == "Location(file='file', line=1, column=18): 'a' is not defined"
+
+def test_deep_nesting() -> None:
+  depth = 5000
+  module = bound('var x = 1;' + '{' * depth + 'x' + '}' * depth)
+  node = module.body
+  assert isinstance(node, ast.Block)
+  node = node.val
+  for _ in range(depth):
+    assert isinstance(node, ast.Block)
+    node = node.val
+  assert isinstance(node, ast.Identifier) and (node.depth, node.slot) == (2, 0)
@@ -0,0 +1,80 @@
+import io
+import pytest
+import subprocess
+import tempfile
+from compiler.__main__ import compile_to_assembly, compile_to_ir
+from compiler.assembler import assemble
+from compiler.bytecode import Op, divide, dump, execute, load, lower, remainder, wrap
+from compiler.tokenizer import tokenize_compact
+
+programs = [
+  'print_int(1 + 2 * 3)',
+  '''
+  fun fib(n: Int): Int { if n < 2 then { return n; } return fib(n - 1) + fib(n - 2); }
+  var i = 0;
+  while i < 10 do { print_int(fib(i)); i = i + 1; }
+  ''',
+  '''
+  fun show(b: Bool): Unit { print_bool(b); }
+  show(1 < 2 and not false); show(1 >= 2 or 3 != 3)
+  ''',
+  'print_int(-7 / 2); print_int(-7 % 2); print_int(7 % -2); -(9223372036854775807 + 2)',
+  '''
+  var i = 0;
+  while true do { i = i + 1; if i % 2 == 0 then continue; if i > 7 then break; print_int(i); }
+  i
+  ''',
+  'var x = read_int(); var y = read_int(); x * y',
+]
+
+def run(source: str, stdin: str = '') -> str:
+  output = io.StringIO()
+  execute(lower(compile_to_ir(tokenize_compact(source))), io.StringIO(stdin), output)
+  return output.getvalue()
+
+def test_programs() -> None:
+  assert run(programs[0]) == '7\n'
+  assert run(programs[1]) == '0\n1\n1\n2\n3\n5\n8\n13\n21\n34\n'
+  assert run(programs[2]) == 'true\nfalse\n'
+  assert run(programs[3]) == '-3\n-1\n1\n9223372036854775807\n'
+  assert run(programs[4]) == '1\n3\n5\n7\n9\n'
+  assert run(programs[5], '-3\n x14\n') == '-42\n'
+
+def test_same_output_as_native() -> None:
+  with tempfile.TemporaryDirectory() as workdir:
+    for source in programs:
+      executable = f'{workdir}/program'
+      assemble(compile_to_assembly(tokenize_compact(source)), executable)
+      native = subprocess.run([executable], input='6\n7\n', capture_output=True, text=True, check=True)
+      assert run(source, '6\n7\n') == native.stdout, source
+
+def test_deep_recursion() -> None:
+  source = 'fun down(n: Int): Int { if n == 0 then { return 0; } return down(n - 1) + 1; } down(100000)'
+  assert run(source) == '100000\n'
+
+def test_instructions_are_arrays() -> None:
+  program = lower(compile_to_ir(tokenize_compact(programs[1])))
+  fib = program.functions[0]
+  assert fib.name == 'fib' and fib.params == 1
+  assert fib.code.typecode == 'q'
+  assert Op(fib.code[-4]) == Op.RETURN
+
+def test_serialization() -> None:
+  program = lower(compile_to_ir(tokenize_compact(programs[1])))
+  data = dump(program)
+  assert load(data) == program
+  assert dump(load(data)) == data
+
+def test_integer_semantics() -> None:
+  assert wrap(2**63) == -2**63
+  assert wrap(-2**63 - 1) == 2**63 - 1
+  assert divide(-7, 2) == -3
+  assert remainder(-7, 2) == -1
+  assert divide(-2**63, 1) == -2**63
+  assert remainder(-2**63, 3) == -2
+  # Stop the program like idivq does
+  for operation in (divide, remainder):
+    with pytest.raises(ArithmeticError, match='Division overflow'):
+      operation(-2**63, -1)
+    with pytest.raises(ArithmeticError, match='Division by zero'):
+      operation(1, 0)
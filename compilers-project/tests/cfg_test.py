@@ -0,0 +1,98 @@
+import pytest
+from compiler import ir
+from compiler.__main__ import compile_to_ir
+from compiler.cfg import build, build_all
+from compiler.location import L
+from compiler.tokenizer import tokenize_compact
+
+source = '''
+fun f(x: Int): Int {
+  var s = 0;
+  while x > 0 do { if x % 2 == 0 then { s = s + x; } else { x = x - 1; continue; } x = x - 1; }
+  return s;
+}
+var i = 0;
+while true do { if i > 3 then break; print_int(f(i)); i = i + 1; }
+'''
+
+def test_round_trip() -> None:
+  functions = compile_to_ir(tokenize_compact(source))
+  for key, cfg in build_all(functions).items():
+    assert cfg.instructions() == functions[key]
+
+def test_blocks_and_edges() -> None:
+  cfg = build('main', compile_to_ir(tokenize_compact(source))[('main', ())])
+  # Entry, the loop condition, the if, break, the loop body and the end
+  assert [b.label.name if b.label else None for b in cfg.blocks] == [None, 'L1', 'L2', 'L4', 'L5', 'L3']
+  entry, condition, test, break_, body, end = cfg.blocks
+  assert condition.successors == [test, end]
+  assert condition.predecessors == [entry, body]
+  assert test.successors == [break_, body]
+  assert end.successors == [] and end.predecessors == [condition, break_]
+  assert isinstance(body.terminator, ir.Jump)
+  assert entry.terminator is None
+
+  order = cfg.reverse_postorder()
+  assert order[0] is entry and set(order) == set(cfg.blocks)
+
+def test_dominators() -> None:
+  cfg = build('main', compile_to_ir(tokenize_compact(source))[('main', ())])
+  entry, condition, test, break_, body, end = cfg.blocks
+  dominators = cfg.dominators
+  assert dominators.idom(entry) is None
+  assert [dominators.idom(b) for b in [condition, test, break_, body, end]] == [entry, condition, test, test, condition]
+  assert dominators.dominates(condition, body) and not dominators.dominates(body, end)
+  assert set(dominators.children(test)) == {break_, body}
+  assert dominators.frontier(body) == [condition]
+  assert dominators.frontier(break_) == [end]
+  assert set(dominators.frontier(test)) == {condition, end}
+
+  post_dominators = cfg.post_dominators
+  assert post_dominators.idom(end) is None
+  assert post_dominators.idom(test) is end
+  assert post_dominators.idom(body) is condition
+  assert post_dominators.dominates(end, entry)
+
+def test_unreachable_and_infinite() -> None:
+  cfg = build('g', [
+    ir.Label(L, 'g_L1'),
+    ir.Jump(L, ir.Label(L, 'g_L1')),
+    ir.Return(L, ir.IRVar('x')),
+  ])
+  loop, dead = cfg.blocks
+  assert cfg.reverse_postorder() == [loop]
+  assert not cfg.dominators.reachable(dead)
+  # The loop never reaches the exit
+  assert not cfg.post_dominators.reachable(loop)
+  assert cfg.post_dominators.reachable(dead)
+
+def test_changed_blocks() -> None:
+  cfg = build('main', compile_to_ir(tokenize_compact('var x = read_int(); if x > 1 then print_int(x); x'))[('main', ())])
+  entry, then, end = cfg.blocks
+  # Moving the end before the then block needs a jump from the then
+  # block to the end, and from the end to the end of the function
+  cfg.blocks = [entry, end, then]
+  cfg.changed()
+  instructions = cfg.instructions()
+  jumps = [insn for insn in instructions if isinstance(insn, ir.Jump)]
+  assert [jump.label for jump in jumps] == [instructions[-1], end.label]
+  assert instructions[-2] == jumps[-1]
+  assert [len(b.successors) for b in build('main', instructions).blocks] == [2, 1, 1, 0]
+
+def test_undefined_label() -> None:
+  with pytest.raises(Exception, match='Undefined label nowhere'):
+    build('main', [ir.Jump(L, ir.Label(L, 'nowhere'))])
+
+def test_many_blocks() -> None:
+  n = 5000
+  source = 'var x = read_int(); var s = 0;\n' + '\n'.join(
+    f'if x > {i} then {{ s = s + {i}; }} else {{ while s > {i} do s = s - 1; }}' for i in range(n)
+  ) + '\ns'
+  instructions = compile_to_ir(tokenize_compact(source))[('main', ())]
+  cfg = build('main', instructions)
+  assert len(cfg.blocks) == 6 * n + 1
+  last = cfg.blocks[-1]
+  assert cfg.dominators.dominates(cfg.entry, last)
+  assert cfg.post_dominators.dominates(last, cfg.entry)
+  assert len(cfg.reverse_postorder()) == len(cfg.blocks)
+  assert cfg.instructions() == instructions
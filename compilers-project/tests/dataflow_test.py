@@ -0,0 +1,90 @@
+from compiler import ir
+from compiler.__main__ import compile_to_ir
+from compiler.cfg import build
+from compiler.dataflow import AvailableExpressions, Liveness, ReachingDefinitions, solve
+from compiler.location import L
+from compiler.tokenizer import tokenize_compact
+
+def var(name: str) -> ir.IRVar:
+  return ir.IRVar(name)
+
+def label(name: str) -> ir.Label:
+  return ir.Label(L, name)
+
+# x = 1; y = x + x; loop: if y then { x = 2; jump loop } else return x + x
+loop = build('f', [
+  ir.LoadIntConst(L, 1, var('x')),
+  ir.Call(L, var('+'), [var('x'), var('x')], var('y')),
+  label('f_L1'),
+  ir.CondJump(L, var('y'), label('f_L2'), label('f_L3')),
+  label('f_L2'),
+  ir.LoadIntConst(L, 2, var('x')),
+  ir.Jump(L, label('f_L1')),
+  label('f_L3'),
+  ir.Call(L, var('+'), [var('x'), var('x')], var('z')),
+  ir.Return(L, var('z')),
+])
+
+def test_liveness() -> None:
+  analysis = Liveness(loop)
+  solution = solve(analysis)
+  members = analysis.numbering.members
+  entry, condition, body, end = loop.blocks
+  assert members(solution.before[entry.index]) == set()
+  assert members(solution.before[condition.index]) == {var('x'), var('y')}
+  assert members(solution.before[body.index]) == {var('y')}
+  assert members(solution.after[end.index]) == set()
+  # After each instruction of the entry
+  assert [members(bits) for bits in solution.instructions(entry)] == [{var('x')}, {var('x'), var('y')}]
+
+def test_reaching_definitions() -> None:
+  analysis = ReachingDefinitions(loop)
+  solution = solve(analysis)
+  entry, condition, body, end = loop.blocks
+  reaching = analysis.members(solution.before[condition.index])
+  assert reaching == entry.instructions + [body.instructions[0]]
+  assert analysis.members(solution.after[body.index]) == [entry.instructions[1], body.instructions[0]]
+  assert solution.instructions(end)[1] == solution.before[condition.index] | (1 << analysis.numbers[id(end.instructions[0])])
+
+def test_available_expressions() -> None:
+  analysis = AvailableExpressions(loop)
+  solution = solve(analysis)
+  entry, condition, body, end = loop.blocks
+  assert analysis.members(solution.after[entry.index]) == [(var('+'), (var('x'), var('x')))]
+  # Killed by x = 2 on the way around the loop
+  assert analysis.members(solution.before[condition.index]) == []
+  assert analysis.members(solution.after[end.index]) == [(var('+'), (var('x'), var('x')))]
+
+def test_entry_in_loop() -> None:
+  # The entry of main can be the start of a loop
+  cfg = build('main', compile_to_ir(tokenize_compact('while read_int() < 10 do print_int(1); 0'))[('main', ())])
+  assert cfg.entry.predecessors
+  # Nothing is available when the function starts
+  assert solve(AvailableExpressions(cfg)).before[cfg.entry.index] == 0
+
+def test_large_function() -> None:
+  n = 1000
+  source = 'var x = read_int(); var s = 0;\n' + '\n'.join(
+    f'if x > {i} then {{ s = s + x; }} else {{ while s > {i} do s = s - 1; }}' for i in range(n)
+  ) + '\ns'
+  cfg = build('main', compile_to_ir(tokenize_compact(source))[('main', ())])
+  analysis = Liveness(cfg)
+  solution = solve(analysis)
+  # Every block is visited a bounded number of times
+  assert solution.rounds < 3 * len(cfg.blocks)
+
+  # The same sets as going over every instruction until nothing changes
+  live_in = [0] * len(cfg.blocks)
+  changed = True
+  while changed:
+    changed = False
+    for block in reversed(cfg.blocks):
+      bits = 0
+      for successor in block.successors:
+        bits |= live_in[successor.index]
+      for insn in reversed(block.instructions):
+        bits = analysis.transfer(insn, bits)
+      if bits != live_in[block.index]:
+        live_in[block.index] = bits
+        changed = True
+  assert solution.before == live_in
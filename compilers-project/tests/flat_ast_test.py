@@ -0,0 +1,64 @@
+import pickle
+from compiler import ast
+from compiler.flat_ast import NodeKind, from_module, parse_flat, to_module
+from compiler.location import L
+from compiler.parser import parse
+from compiler.tokenizer import tokenize, tokenize_compact
+from compiler.type_checker import typecheck
+from compiler.types import Int, TypeTab
+
+source = '''
+fun square(x: Int): Int { return x * x; }
+fun check(b: Bool): Unit { if not b then print_int(0); }
+var i: Int = 0;
+while i < 10 do {
+  i = i + 1;
+  if i % 2 == 0 then print_int(square(i)) else check(i > -3)
+};
+{ var a = { 1 }; a }
+'''
+
+def test_parse_flat_matches_tree() -> None:
+  flat = parse_flat(tokenize_compact(source))
+  tree = parse(tokenize(source))
+  assert to_module(flat) == tree
+  assert str(to_module(flat).body.location) == str(tree.body.location)
+
+def test_round_trip_keeps_types() -> None:
+  tree = parse(tokenize(source))
+  typecheck(tree, TypeTab)
+  copy = to_module(from_module(tree))
+  assert copy == tree
+  assert copy.funcs[0].type == tree.funcs[0].type
+  assert copy.body.type == tree.body.type
+  body = copy.funcs[0].body
+  assert isinstance(body, ast.Block) and isinstance(body.content[0], ast.Return)
+  assert body.content[0].val.type == Int
+
+def test_children_come_before_parents() -> None:
+  flat = parse_flat(tokenize_compact('{ var x = 1 + 2 * 3; f(x, -x) }'))
+  assert flat.kinds[flat.body] == NodeKind.BLOCK
+  assert flat.body == len(flat) - 1
+  for node in range(len(flat)):
+    if flat.kinds[node] in (NodeKind.BINARY_OP, NodeKind.LOOP):
+      assert flat.a[node] < node
+      assert flat.c[node] < node or flat.kinds[node] == NodeKind.LOOP
+
+def test_pickle() -> None:
+  flat = parse_flat(tokenize_compact(source))
+  assert to_module(pickle.loads(pickle.dumps(flat))) == to_module(flat)
+
+def test_empty_module() -> None:
+  module = ast.Module([], ast.Literal(L, None))
+  assert to_module(from_module(module)) == module
+
+def test_deep_nesting() -> None:
+  depth = 5000
+  flat = parse_flat(tokenize_compact('(' * depth + '1' + ')' * depth + ' + 1'))
+  assert len(flat) == 3
+  source = '{' * depth + '1' + '}' * depth
+  node = to_module(from_module(to_module(parse_flat(tokenize_compact(source))))).body
+  for _ in range(depth):
+    assert isinstance(node, ast.Block)
+    node = node.val
+  assert node == ast.Literal(L, 1)
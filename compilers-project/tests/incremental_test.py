@@ -0,0 +1,113 @@
+import pytest
+from typing import Any
+from concurrent.futures import ThreadPoolExecutor
+from compiler import incremental
+from compiler.__main__ import compile_to_assembly
+from compiler.incremental import CompilationCache
+from compiler.tokenizer import tokenize_compact
+
+source = '''
+fun square(x: Int): Int { return x * x; }
+fun show(b: Bool): Unit { if b then print_int(square(3)); }
+fun count(): Int { var i = 0; while i < 3 do { i = i + 1; } return square(i); }
+show(true); count()
+'''
+
+def compile(cache: CompilationCache, source: str) -> str:
+  assembly = cache.compile_to_assembly(source)
+  assert assembly == compile_to_assembly(tokenize_compact(source))
+  return assembly
+
+def test_same_output_as_full_compilation() -> None:
+  cache = CompilationCache()
+  compile(cache, source)
+  assert (cache.hits, cache.misses) == (0, 3)
+  compile(cache, source)
+  assert (cache.hits, cache.misses) == (3, 3)
+
+def test_edit_recompiles_only_the_edited_function() -> None:
+  cache = CompilationCache()
+  compile(cache, source)
+  compile(cache, source.replace('i + 1', 'i + 2'))
+  assert (cache.hits, cache.misses) == (2, 4)
+
+def test_signature_change_recompiles_callers() -> None:
+  cache = CompilationCache()
+  program = 'fun f(): Int { return 1; }\nfun g(): Unit { f(); }\nfun h(): Int { return 2; }\ng()'
+  compile(cache, program)
+  # 'g' is compiled again although its source is cached
+  compile(cache, program.replace('Int { return 1; }', 'Bool { return true; }'))
+  assert (cache.hits, cache.misses) == (1, 5)
+  compile(cache, source)
+  with pytest.raises(Exception, match="'print_int'"):
+    cache.compile_to_assembly(source.replace('Int { return x * x; }', 'Bool { return x > 0; }'))
+
+def test_moved_and_added_functions() -> None:
+  cache = CompilationCache()
+  compile(cache, source)
+  compile(cache, source.replace('fun show', 'fun zero(): Int { return 0; }\nfun show'))
+  assert (cache.hits, cache.misses) == (3, 4)
+  compile(cache, 'fun f(): Unit { }\n' + source)
+  assert (cache.hits, cache.misses) == (6, 5)
+
+def test_failed_compilation_is_not_cached() -> None:
+  cache = CompilationCache()
+  broken = source.replace('return x * x;', 'return y;')
+  with pytest.raises(Exception, match="'y' is not defined"):
+    cache.compile_to_assembly(broken)
+  assert cache.functions == {}
+  compile(cache, source)
+  assert cache.misses == 3
+
+def test_least_recently_used_functions_are_dropped() -> None:
+  cache = CompilationCache(max_functions=2)
+  compile(cache, source)
+  assert len(cache.functions) == 2
+  compile(cache, source)
+  assert (cache.hits, cache.misses) == (2, 4)
+
+def test_module_without_functions_or_body() -> None:
+  cache = CompilationCache()
+  compile(cache, 'print_int(1)')
+  compile(cache, 'fun f(): Unit { }')
+
+def test_compiles_outside_the_lock(monkeypatch: pytest.MonkeyPatch) -> None:
+  cache = CompilationCache()
+  typecheck = incremental.typecheck
+
+  def unlocked_typecheck(*args: Any) -> Any:
+    assert not cache.lock.locked()
+    return typecheck(*args)
+
+  monkeypatch.setattr(incremental, 'typecheck', unlocked_typecheck)
+  compile(cache, source)
+  compile(cache, source.replace('i + 1', 'i + 2'))
+
+def test_parallel_compilations() -> None:
+  cache = CompilationCache()
+  compile(cache, source)
+  entries = dict(cache.functions)
+  dependencies = {digest: entry.dependencies for digest, entry in entries.items()}
+  # Moving the functions binds the cached ones again
+  sources = [source.replace('fun show', f'fun zero{i}(): Int {{ return {i}; }}\nfun show') for i in range(8)] * 4
+  with ThreadPoolExecutor(8) as pool:
+    list(pool.map(lambda s: compile(cache, s), sources))
+  # The entries of the first compilation were replaced, not changed
+  for digest, entry in entries.items():
+    assert entry is not cache.functions[digest]
+    assert entry.dependencies == dependencies[digest]
+  assert any(dependencies[digest] != cache.functions[digest].dependencies for digest in entries)
+  compile(cache, source)
+
+def test_signature_change_after_a_move() -> None:
+  cache = CompilationCache()
+  program = 'fun f(a: Int): Int { a }\nfun g(b: Int): Int {\n f(b) * 2 }\ng(1)'
+  compile(cache, program)
+  entries = dict(cache.functions)
+  call = [entry for entry in entries.values() if entry.definition.name.name == 'g'][0].definition.body
+  typed = repr(call)
+  # The error is where g is now, and the cached tree is left as it was
+  with pytest.raises(Exception, match='line=5, column=7'):
+    cache.compile_to_assembly(program.replace('Int { a }\n', 'Bool { a > 0 }\n\n\n'))
+  assert cache.functions == entries
+  assert repr(call) == typed
@@ -1,5 +1,11 @@
+import io
+import pytest
 import compiler.ast as ast
-from compiler.interpreter import interperet
+from compiler.__main__ import compile_to_ir
+from compiler.bytecode import execute, lower
+from compiler.interpreter import interperet, interperet_module
+from compiler.parser import parse
+from compiler.tokenizer import tokenize, tokenize_compact
 from compiler.location import Location
 from compiler.symtab import SymTab, TopTab
 
@@ -206,4 +212,89 @@ def test_loop() -> None:
         )
       )
     ), TopTab
-  ) == 10
\ No newline at end of file
+  ) == 10
+def test_deep_nesting() -> None:
+  depth = 2000
+  node: ast.Expression = ast.Literal(L, 0)
+  for _ in range(depth):
+    node = ast.Block(L, [], ast.BinaryOp(L, node, '+', ast.Literal(L, 1)))
+  assert interperet(node, TopTab) == depth
+
+compiled_programs = [
+  'var a = 1; while a < 10 do a = a + 1; a',
+  'var s = 0; var i = 0; while i < 100 do { i = i + 1; if i % 3 == 0 or i % 5 == 0 then { s = s + i; } }; s',
+  'var x = 5; { var x = 2; x = x * 10; }; x',
+  'var b = true; if not b and 1 / 0 > 0 then 1 else -2',
+  'var a = 3; var b = 4; a * a + b * b == 25',
+]
+
+def test_compiled_closures() -> None:
+  for source in compiled_programs:
+    node = parse(tokenize(source)).body
+    assert interperet(node, TopTab, compile=True) == interperet(node, TopTab), source
+
+def test_compiled_deep_nesting() -> None:
+  depth = 2000
+  node: ast.Expression = ast.Literal(L, 0)
+  for _ in range(depth):
+    node = ast.Block(L, [], ast.BinaryOp(L, node, '+', ast.Literal(L, 1)))
+  assert interperet(node, TopTab, compile=True) == depth
+
+def test_compiled_undefined_operator() -> None:
+  symtab = SymTab({'+': lambda a, b: a + b})
+  node = parse(tokenize('if 1 + 1 then 2 else 3 * 4')).body
+  assert interperet(node, symtab, compile=True) == 2
+  with pytest.raises(Exception, match='\\* not defined'):
+    interperet(parse(tokenize('3 * 4')).body, symtab, compile=True)
+
+module_programs = [
+  '''
+  fun fib(n: Int): Int { if n < 2 then { return n; } return fib(n - 1) + fib(n - 2); }
+  var i = 0;
+  while i < 10 do { print_int(fib(i)); i = i + 1; }
+  ''',
+  '''
+  fun even(n: Int): Bool { if n == 0 then { return true; } return odd(n - 1); }
+  fun odd(n: Int): Bool { if n == 0 then { return false; } return even(n - 1); }
+  print_bool(even(10)); print_bool(odd(10));
+  ''',
+  '''
+  var i = 0;
+  while true do { i = i + 1; if i % 2 == 0 then continue; if i > 7 then break; print_int(i); }
+  print_int(i);
+  ''',
+  '''
+  fun first(limit: Int): Int {
+    var i = 0;
+    while i < limit do { { var j = i * i; if j > 50 then return i; } i = i + 1; }
+    return -1;
+  }
+  print_int(first(100)); print_int(first(3));
+  ''',
+  '''
+  fun pick(x: Int): Int { var y = if x > 0 then { return 1; 0 } else 2; return y + 10; }
+  print_int(pick(1)); print_int(pick(-1)); print_int(-7 / 2); print_int(-7 % 2);
+  ''',
+]
+
+def run_module(source: str) -> str:
+  output = io.StringIO()
+  interperet_module(parse(tokenize(source)), stdout=output)
+  return output.getvalue()
+
+def test_modules() -> None:
+  # The bytecode VM gives the same output as the compiled program
+  for source in module_programs:
+    expected = io.StringIO()
+    execute(lower(compile_to_ir(tokenize_compact(source))), stdout=expected)
+    assert run_module(source) == expected.getvalue(), source
+
+def test_module_value() -> None:
+  source = 'fun fib(n: Int): Int { if n < 2 then n else fib(n - 1) + fib(n - 2) } fib(20)'
+  assert interperet_module(parse(tokenize(source))) == 6765
+
+def test_module_errors() -> None:
+  with pytest.raises(Exception, match='break not allowed outside of a loop'):
+    run_module('fun f(): Int { break; 1 } while true do f()')
+  with pytest.raises(Exception, match='nested too deep'):
+    run_module('fun down(n: Int): Int { if n == 0 then 0 else down(n - 1) + 1 } down(100000)')
@@ -0,0 +1,70 @@
+import io
+import pytest
+from compiler.interpreter import interperet_module
+from compiler.jit import run_tiered
+from compiler.parser import parse
+from compiler.tokenizer import tokenize
+
+source = '''
+fun fib(n: Int): Int { if n < 2 then { return n; } return fib(n - 1) + fib(n - 2); }
+fun even(n: Int): Bool { if n == 0 then true else odd(n - 1) }
+fun odd(n: Int): Bool { if n == 0 then false else even(n - 1) }
+fun show(x: Int): Unit { print_int(x); }
+fun sum(n: Int): Int { var s = 0; var i = 0; while i < n do { i = i + 1; if i % 3 == 0 then continue; s = s + i; } s }
+var i = 0;
+while i < 10 do { show(fib(i + 5)); print_bool(even(i * 7)); print_int(sum(i * 20)); i = i + 1; }
+fib(15)
+'''
+
+def tiered(source: str, threshold: int, stdin: str = '') -> tuple[object, str, str]:
+  output = io.StringIO()
+  log = io.StringIO()
+  value = run_tiered(parse(tokenize(source)), io.StringIO(stdin), output, threshold, log)
+  return value, output.getvalue(), log.getvalue()
+
+def test_same_results_as_interpreter() -> None:
+  output = io.StringIO()
+  expected = interperet_module(parse(tokenize(source)), stdout=output)
+  for threshold in [1, 10, 100, 10**9]:
+    assert tiered(source, threshold)[:2] == (expected, output.getvalue())
+
+def test_transitions_are_logged() -> None:
+  _, _, log = tiered(source, 50)
+  # odd is compiled with even, which calls it
+  promoted = [line.split()[1] for line in log.splitlines()]
+  assert sorted(promoted) == ['even:', 'fib:', 'sum:']
+  assert all(' ms' in line and 'interpreter -> native' in line for line in log.splitlines())
+  assert tiered(source, 10**9)[2] == ''
+
+def test_native_builtins() -> None:
+  source = 'fun twice(): Int { var x = read_int(); print_bool(x > 0); return x * 2; } twice() + twice() + twice()'
+  value, output, log = tiered(source, 2, '1\n-2\n30\n')
+  assert (value, output) == (58, 'true\nfalse\ntrue\n')
+  assert 'twice: interpreter -> native after 2 calls' in log
+  # Errors in the built-ins are raised when the native code returns
+  with pytest.raises(Exception, match='read_int'):
+    tiered(source, 2, '1\n-2\n')
+
+def test_failed_read_stops_the_native_code() -> None:
+  source = 'fun r(i: Int): Int { var x = read_int(); print_int(x * 100); x } var i = 0; while i < 5 do { r(i); i = i + 1; }'
+  output = io.StringIO()
+  with pytest.raises(Exception, match='read_int'):
+    run_tiered(parse(tokenize(source)), io.StringIO('1\n2\n3\n'), output, 2)
+  # Nothing is printed after the read that failed
+  assert output.getvalue() == '100\n200\n300\n'
+  assert tiered(source, 2, '1\n2\n3\n4\n5\n')[1] == '100\n200\n300\n400\n500\n'
+  # Also from a read in nested native calls
+  source = 'fun d(n: Int): Int { if n == 0 then read_int() else { var x = d(n - 1); print_int(x); x } } d(3) + d(3)'
+  output = io.StringIO()
+  with pytest.raises(Exception, match='read_int'):
+    run_tiered(parse(tokenize(source)), io.StringIO('7\n'), output, 1)
+  assert output.getvalue() == '7\n' * 3
+
+def test_too_many_parameters() -> None:
+  source = '''
+  fun add(a: Int, b: Int, c: Int, d: Int, e: Int, f: Int, g: Int): Int { a + b + c + d + e + f + g }
+  add(1, 2, 3, 4, 5, 6, 7) + add(1, 1, 1, 1, 1, 1, 1)
+  '''
+  value, _, log = tiered(source, 1)
+  assert value == 35
+  assert 'add: stays interpreted: add has more than 6 parameters' in log
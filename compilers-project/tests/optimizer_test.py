@@ -0,0 +1,134 @@
+import io
+import subprocess
+import tempfile
+from compiler import ir
+from compiler.__main__ import compile_to_assembly, compile_to_ir
+from compiler.assembler import assemble
+from compiler.bytecode import execute, lower
+from compiler.cfg import build
+from compiler.optimizer import fold_constants, optimize
+from compiler.location import L
+from compiler.tokenizer import tokenize_compact
+from tests.bytecode_test import programs
+
+def main_ir(source: str) -> list[ir.Instruction]:
+  return compile_to_ir(tokenize_compact(source), optimized=True)[('main', ())]
+
+def calls(instructions: list[ir.Instruction]) -> list[str]:
+  return [insn.fun.name for insn in instructions if isinstance(insn, ir.Call)]
+
+def printed(instructions: list[ir.Instruction]) -> list[int | bool | None]:
+  '''The constants passed to print_int and print_bool, or None.'''
+  loads = {
+    insn.dest: insn.value for insn in instructions if isinstance(insn, (ir.LoadIntConst, ir.LoadBoolConst))
+  }
+  return [
+    loads.get(insn.args[0]) for insn in instructions
+    if isinstance(insn, ir.Call) and insn.fun.name in ('print_int', 'print_bool')
+  ]
+
+def run(source: str, optimized: bool, stdin: str = '') -> str:
+  output = io.StringIO()
+  execute(lower(compile_to_ir(tokenize_compact(source), optimized)), io.StringIO(stdin), output)
+  return output.getvalue()
+
+loops = '''
+var i = 0;
+while true do { i = i + 1; if i > 5 then { break; print_int(7); } else { continue; } }
+if i > 3 then print_int(i);
+i
+'''
+
+def test_same_output() -> None:
+  for source in programs + [loops]:
+    assert run(source, True, '-3\n14\n') == run(source, False, '-3\n14\n')
+
+def test_same_native_output() -> None:
+  with tempfile.TemporaryDirectory() as workdir:
+    for source in programs + [loops]:
+      executable = f'{workdir}/program'
+      assemble(compile_to_assembly(tokenize_compact(source), optimized=True), executable)
+      native = subprocess.run([executable], input='6\n7\n', capture_output=True, text=True, check=True)
+      assert run(source, False, '6\n7\n') == native.stdout, source
+
+def test_folding() -> None:
+  instructions = main_ir('print_int(1 + 2 * 3); print_bool(not (2 < 1))')
+  assert calls(instructions) == ['print_int', 'print_bool']
+  assert printed(instructions) == [7, True]
+
+def test_propagation() -> None:
+  # Through variables, copies and the blocks after an if
+  instructions = main_ir('var x = 5; var y = x; if read_int() > 0 then print_int(1); print_int(y * 2)')
+  assert calls(instructions) == ['read_int', '>', 'print_int', 'print_int']
+  assert printed(instructions) == [1, 10]
+  # Not when a branch or a loop changes the variable
+  instructions = main_ir('var x = 5; if read_int() > 0 then x = 6; print_int(x * 2)')
+  assert '*' in calls(instructions)
+  instructions = main_ir('var x = 5; while read_int() > 0 do x = x + 1; print_int(x * 2)')
+  assert calls(instructions).count('+') == 1 and '*' in calls(instructions)
+
+def test_branches() -> None:
+  # The else branch is never taken, so x is 6 after the if
+  instructions = main_ir('var x = 5; if 1 < 2 then x = 6 else x = 7; print_int(x * 2)')
+  assert not any(isinstance(insn, ir.CondJump) for insn in instructions)
+  assert printed(instructions) == [12]
+  assert run('var x = 5; if 1 < 2 then x = 6 else x = 7; x * 2', True) == '12\n'
+
+def test_native_semantics() -> None:
+  min_int = -9223372036854775808
+  instructions = main_ir(f'print_int(9223372036854775807 + 1); print_int(-7 / 2); print_int(-7 % 2); print_int({min_int} * -1)')
+  assert calls(instructions) == ['print_int'] * 4
+  assert printed(instructions) == [min_int, -3, -1, min_int]
+  # Left for run time, where they stop the program
+  assert '/' in calls(main_ir('print_int(1 / 0)'))
+  assert '%' in calls(main_ir(f'print_int({min_int} % -1)'))
+
+def test_count() -> None:
+  cfg = build('main', compile_to_ir(tokenize_compact('var x = 1 + 2; x * x'))[('main', ())])
+  # The addition, the copy into x, the multiplication
+  assert fold_constants(cfg) == 3
+  assert fold_constants(cfg) == 0
+
+def test_simplified() -> None:
+  instructions = main_ir(loops)
+  jumps = [insn for insn in instructions if isinstance(insn, (ir.Jump, ir.CondJump))]
+  targets = {label.name for jump in jumps for label in ([jump.label] if isinstance(jump, ir.Jump) else [jump.then_label, jump.else_label])}
+  labels = [insn.name for insn in instructions if isinstance(insn, ir.Label)]
+  # The code after break, the empty blocks and the labels nothing jumps to are gone
+  assert calls(instructions).count('print_int') == 2
+  assert set(labels) == targets
+  # 'continue' in the else branch jumps straight back to the start
+  assert isinstance(jumps[0], ir.CondJump) and jumps[0].else_label.name == labels[0]
+  for i, insn in enumerate(instructions[:-1]):
+    if isinstance(insn, ir.Jump):
+      assert instructions[i + 1] != insn.label
+
+def test_infinite_loop() -> None:
+  # A chain of empty blocks that loops back to itself
+  start = ir.Label(L, 'L1')
+  instructions = [start, ir.Jump(L, ir.Label(L, 'L2')), ir.Label(L, 'L2'), ir.Jump(L, start)]
+  assert optimize({('main', ()): instructions})[('main', ())] == [start, ir.Jump(L, start)]
+
+def test_report() -> None:
+  log = io.StringIO()
+  optimize(compile_to_ir(tokenize_compact('fun f(): Int { return 1; 2 } ' + loops)), log)
+  lines = log.getvalue().splitlines()
+  assert len(lines) == 2
+  assert lines[0].startswith('[optimize] f: ') and lines[1].startswith('[optimize] main: ')
+  assert lines[1].endswith('%)') and ' -> ' in lines[1]
+
+def test_entry_values() -> None:
+  # The parameter keeps its value when the branch isn't taken
+  source = 'fun g(a: Int): Int { if read_int() > 2 then { a = 9; } a = a; return a; } print_int(g(3));'
+  for ssa in (False, True):
+    functions = optimize(compile_to_ir(tokenize_compact(source)), ssa=ssa)
+    output = io.StringIO()
+    execute(lower(functions), io.StringIO('1\n'), output)
+    assert output.getvalue() == '3\n'
+  # Also when the branch can't be taken
+  source = 'fun g(a: Int): Int { if 1 > 2 then { a = 9; } a = a; return a; } print_int(g(3));'
+  functions = optimize(compile_to_ir(tokenize_compact(source)), ssa=False)
+  assert not any(isinstance(insn, ir.LoadIntConst) and insn.value == 9 for insn in functions[('g', (ir.IRVar('a'),))])
+  output = io.StringIO()
+  execute(lower(functions), io.StringIO(), output)
+  assert output.getvalue() == '3\n'
@@ -0,0 +1,60 @@
+import io
+import pickle
+import pytest
+from compiler.__main__ import compile_to_assembly, compile_to_ir
+from compiler.ir_generator import generate_ir
+from compiler.parallel import compile_parallel
+from compiler.parser import parse
+from compiler.root_types import root_types
+from compiler.tokenizer import tokenize_compact
+from compiler.type_checker import typecheck
+from compiler.types import Bool, FunType, Int, TypeTab, Unit
+
+def program(functions: int) -> str:
+  lines = ['fun f0(x: Int): Int { return x; }']
+  for i in range(1, functions):
+    lines.append(
+      f'fun f{i}(x: Int, b: Bool): Int {{ var y = f{i - 1}(x{", b" if i > 1 else ""}); '
+      f'if b and y > {i} then {{ y = y - 1; }} while y > 100 do {{ y = y / 2; }} return y; }}'
+    )
+  lines.append(f'print_int(f{functions - 1}(1, true));')
+  return '\n'.join(lines)
+
+def test_types_survive_pickling() -> None:
+  for t in [Int, Bool, Unit]:
+    assert pickle.loads(pickle.dumps(t)) is t
+  assert pickle.loads(pickle.dumps(FunType((Int, Bool), Unit))).params[1] is Bool
+
+def test_same_output_as_serial() -> None:
+  source = program(40)
+  module = parse(tokenize_compact(source))
+  typecheck(module, TypeTab)
+  expected = generate_ir(root_types, module)
+  output, assembly = compile_parallel(source, 3, keep_ir=True)
+  assert output is not None
+  assert list(output) == list(expected)
+  assert str(output) == str(expected)
+  assert assembly == compile_to_assembly(tokenize_compact(source))
+
+def test_optimized() -> None:
+  source = program(10)
+  serial = io.StringIO()
+  expected = compile_to_ir(tokenize_compact(source), optimized=True, log=serial)
+  log = io.StringIO()
+  output, assembly = compile_parallel(source, 3, keep_ir=True, optimized=True, log=log)
+  assert output == expected
+  assert assembly == compile_to_assembly(tokenize_compact(source), optimized=True)
+  assert log.getvalue() == serial.getvalue()
+
+def test_module_without_functions() -> None:
+  _, assembly = compile_parallel('print_int(1)', 2)
+  assert assembly == compile_to_assembly(tokenize_compact('print_int(1)'))
+
+def test_error_of_the_first_function() -> None:
+  source = program(20).replace('fun f5(x: Int, b: Bool): Int {', 'fun f5(x: Int, b: Bool): Int { x = b;')
+  source = source.replace('fun f15(x: Int, b: Bool): Int {', 'fun f15(x: Int, b: Bool): Int { x = b;')
+  with pytest.raises(Exception) as serial:
+    compile_to_assembly(tokenize_compact(source))
+  with pytest.raises(Exception) as parallel:
+    compile_parallel(source, 4)
+  assert str(parallel.value) == str(serial.value)
@@ -1,4 +1,6 @@
+from typing import Iterator
 from compiler.parser import parse
+from compiler.tokenizer import tokenize, tokenize_compact
 from compiler.location import L, Location
 from compiler.token import Token
 import compiler.ast as ast
@@ -619,4 +621,94 @@ def test_no_block_multiple_expressions() -> None:
     L,
     [ast.Literal(L, 15)],
     ast.Literal(L, 15)
-  ))
\ No newline at end of file
+  ))
+def test_parse_token_stream() -> None:
+  def tokens() -> Iterator[Token]:
+    yield Token(loc=Location('file', 1, 1), type='identifier', text='a')
+    yield Token(loc=Location('file', 1, 3), type='operator', text='+')
+    yield Token(loc=Location('file', 1, 5), type='identifier', text='b')
+
+  assert parse(tokens()) == ast.Module([], ast.BinaryOp(L,
+    ast.Identifier(L, 'a'),
+    '+',
+    ast.Identifier(L, 'b')
+  ))
+
+  try:
+    parse(iter([]))
+    assert False == True
+  except Exception as exc:
+    assert exc.args[0] == 'Tokens empty, nothing to parse'
+
+def test_parse_compact_token_stream() -> None:
+  source = 'fun f(a: Int): Int {\n  return a * 2;\n}\nvar x = f(1);\n{ x y }'
+  try:
+    parse(tokenize_compact(source))
+    assert False == True
+  except Exception as exc:
+    assert exc.args[0] == "Location(file='file', line=5, column=5): expected one of: ';', '}' got 'y'"
+
+  source = 'fun f(a: Int): Int {\n  return a * 2;\n}\nvar x = f(1);\nx'
+  assert parse(tokenize_compact(source)) == parse(tokenize(source))
+
+def test_all_precedence_levels() -> None:
+  assert parse(tokenize('x = a or b and c == d < e + f * -g')) == ast.Module([], ast.BinaryOp(L,
+    ast.Identifier(L, 'x'),
+    '=',
+    ast.BinaryOp(L,
+      ast.Identifier(L, 'a'),
+      'or',
+      ast.BinaryOp(L,
+        ast.Identifier(L, 'b'),
+        'and',
+        ast.BinaryOp(L,
+          ast.Identifier(L, 'c'),
+          '==',
+          ast.BinaryOp(L,
+            ast.Identifier(L, 'd'),
+            '<',
+            ast.BinaryOp(L,
+              ast.Identifier(L, 'e'),
+              '+',
+              ast.BinaryOp(L,
+                ast.Identifier(L, 'f'),
+                '*',
+                ast.Unary(L, '-', ast.Identifier(L, 'g'))
+              )
+            )
+          )
+        )
+      )
+    )
+  ))
+
+  assert parse(tokenize('-a * b - c - d')) == ast.Module([], ast.BinaryOp(L,
+    ast.BinaryOp(L,
+      ast.BinaryOp(L,
+        ast.Unary(L, '-', ast.Identifier(L, 'a')),
+        '*',
+        ast.Identifier(L, 'b')
+      ),
+      '-',
+      ast.Identifier(L, 'c')
+    ),
+    '-',
+    ast.Identifier(L, 'd')
+  ))
+
+def test_deep_nesting() -> None:
+  depth = 5000
+  parsed = parse(tokenize('{ ' * depth + 'if true then -(a) else b' + ' }' * depth))
+  node = parsed.body
+  for _ in range(depth):
+    assert isinstance(node, ast.Block)
+    node = node.val
+  assert isinstance(node, ast.Condition)
+
+  parsed = parse(tokenize(' + '.join(['1'] * depth)))
+  node = parsed.body
+  for _ in range(depth - 1):
+    assert isinstance(node, ast.BinaryOp)
+    assert node.right == ast.Literal(L, 1)
+    node = node.left
+  assert node == ast.Literal(L, 1)
@@ -0,0 +1,63 @@
+import json
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from compiler.__main__ import Handler, ThreadPoolServer, compile_to_assembly
+from compiler.tokenizer import tokenize_compact
+from compiler.types import FunType, Int, TypeTab
+
+def program(i: int) -> str:
+  return f'''
+fun f{i}(x: Int): Int {{ return x * {i}; }}
+fun g(b: Bool): Unit {{ if b then print_int({i}); }}
+var y{i} = f{i}({i});
+while y{i} > 0 do {{ y{i} = y{i} - 1; g(y{i} % 2 == 0); }}
+y{i} + {i}
+'''
+
+def test_builtin_tables_are_read_only() -> None:
+  with pytest.raises(Exception):
+    TypeTab.add_local('x', FunType((), Int))
+  overlay = TypeTab.overlay()
+  overlay.add_local('print_int', FunType((), Int))
+  assert overlay.require('print_int') == FunType((), Int)
+  assert TypeTab.require('print_int') != FunType((), Int)
+  assert 'x' not in TypeTab.locals
+
+def test_compilation_does_not_change_builtins() -> None:
+  before = dict(TypeTab.locals)
+  compile_to_assembly(tokenize_compact(program(1)))
+  assert dict(TypeTab.locals) == before
+
+def test_parallel_compilations() -> None:
+  sources = [program(i) for i in range(16)]
+  expected = [compile_to_assembly(tokenize_compact(source)) for source in sources]
+  with ThreadPoolExecutor(8) as pool:
+    for _ in range(4):
+      assert list(pool.map(lambda s: compile_to_assembly(tokenize_compact(s)), sources)) == expected
+
+def request(port: int, message: dict[str, str]) -> dict[str, str]:
+  with socket.create_connection(('127.0.0.1', port)) as connection:
+    connection.sendall(json.dumps(message).encode())
+    connection.shutdown(socket.SHUT_WR)
+    response = b''
+    while chunk := connection.recv(4096):
+      response += chunk
+  result: dict[str, str] = json.loads(response)
+  return result
+
+def test_thread_pool_server() -> None:
+  with ThreadPoolServer(('127.0.0.1', 0), Handler, 4) as server:
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+      port = server.server_address[1]
+      with ThreadPoolExecutor(8) as pool:
+        pings = list(pool.map(lambda _: request(port, {'command': 'ping'}), range(16)))
+      assert pings == [{}] * 16
+      error = request(port, {'command': 'compile', 'code': '1 + true'})
+      assert 'Unsupported parameters' in error['error']
+    finally:
+      server.shutdown()
+      thread.join()
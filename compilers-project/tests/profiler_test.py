@@ -0,0 +1,56 @@
+import io
+import re
+from compiler.interpreter import interperet_module
+from compiler.parser import parse
+from compiler.profiler import Profiler
+from compiler.tokenizer import tokenize
+
+source = '''fun fib(n: Int): Int { if n < 2 then { return n; } return fib(n - 1) + fib(n - 2); }
+var i = 0;
+while i < 10 do { i = i + 1; }
+print_int(fib(10));
+'''
+
+def profile() -> tuple[Profiler, str]:
+  profiler = Profiler()
+  output = io.StringIO()
+  interperet_module(parse(tokenize(source)), stdout=output, profiler=profiler)
+  return profiler, output.getvalue()
+
+def test_same_output() -> None:
+  output = io.StringIO()
+  interperet_module(parse(tokenize(source)), stdout=output)
+  assert profile()[1] == output.getvalue() == '55\n'
+
+def test_counts_by_location() -> None:
+  profiler, _ = profile()
+  counts: dict[tuple[int, str], int] = {}
+  for stats in profiler.nodes.values():
+    key = (stats.location.line, stats.node)
+    counts[key] = counts.get(key, 0) + stats.count
+  assert counts[3, 'Loop'] == 1
+  assert counts[3, 'BinaryOp ='] == 10
+  # The first call is made from the body, the others from fib
+  assert counts[4, 'FunctionCall fib'] == 1
+  assert counts[1, 'FunctionCall fib'] == 176
+  assert counts[1, 'Return'] == 177
+  for stats in profiler.nodes.values():
+    assert 0 <= stats.own <= stats.total
+
+def test_report() -> None:
+  profiler, _ = profile()
+  report = io.StringIO()
+  profiler.report(report, limit=3)
+  lines = report.getvalue().splitlines()
+  assert len(lines) == 4
+  assert lines[0].split() == ['own', 's', '%', 'total', 's', 'count', 'location', 'node']
+  own = [float(line.split()[0]) for line in lines[1:]]
+  assert own == sorted(own, reverse=True)
+
+def test_collapsed_stacks() -> None:
+  profiler, _ = profile()
+  stacks = io.StringIO()
+  profiler.write_collapsed(stacks)
+  lines = stacks.getvalue().splitlines()
+  assert all(re.fullmatch(r'main(;fib)* [0-9]+', line) for line in lines)
+  assert any(line.startswith('main;fib;fib;fib ') for line in lines)
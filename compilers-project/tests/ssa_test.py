@@ -0,0 +1,100 @@
+from compiler import ir
+from compiler.__main__ import compile_to_assembly, compile_to_ir
+from compiler.cfg import build
+from compiler.dataflow import definition
+from compiler.location import L
+from compiler.optimizer import propagate_constants
+from compiler.ssa import from_ssa, parallel_copies, phis, to_ssa
+from compiler.tokenizer import tokenize_compact
+from tests.optimizer_test import calls, main_ir, printed, run
+
+def var(name: str) -> ir.IRVar:
+  return ir.IRVar(name)
+
+def test_single_definitions() -> None:
+  source = 'var x = read_int(); var y = 0; while x > 0 do { y = y + x; x = x - 1; } if y > 5 then x = 1 else x = 2; print_int(x + y)'
+  cfg = build('main', compile_to_ir(tokenize_compact(source))[('main', ())])
+  to_ssa(cfg)
+  dests = [definition(insn) for block in cfg.blocks for insn in block.instructions]
+  dests = [dest for dest in dests if dest is not None]
+  assert len(dests) == len(set(dests))
+  # x and y meet at the loop condition, and x again after the if
+  loop, = [block for block in cfg.blocks if len(phis(block)) == 2]
+  assert len(loop.predecessors) == 2
+  after, = [block for block in cfg.blocks if len(phis(block)) == 1]
+  assert all(len(phi.sources) == len(after.predecessors) for phi in phis(after))
+  from_ssa(cfg)
+  assert not any(isinstance(insn, ir.Phi) for block in cfg.blocks for insn in block.instructions)
+
+def test_parallel_copies() -> None:
+  # A swap needs a temporary, a chain only the right order
+  a, b, c = var('a'), var('b'), var('c')
+  assert parallel_copies([(a, b), (b, a)]) == [(var('a.old'), a), (a, b), (b, var('a.old'))]
+  assert parallel_copies([(a, b), (b, c), (c, c)]) == [(a, b), (b, c)]
+
+def test_swap() -> None:
+  source = '''
+  var a = read_int(); var b = read_int(); var i = 0;
+  while i < 3 do { var t = a; a = b; b = t; i = i + 1; }
+  print_int(a); print_int(b);
+  var x = 0; var y = 0;
+  while y < 3 do { x = y; y = y + 1; }
+  x
+  '''
+  assert run(source, True, '4\n9\n') == run(source, False, '4\n9\n') == '9\n4\n2\n'
+
+def test_constant_loop_condition() -> None:
+  # j stays 1 around the loop, which only SCCP finds
+  source = 'var j = 1; var i = 0; while i < 10 do { if j == 1 then print_int(i); j = 2 - j; i = i + 1; } j'
+  instructions = main_ir(source)
+  assert calls(instructions).count('<') == 1 and '==' not in calls(instructions)
+  assert run(source, True) == run(source, False)
+
+def test_repeated_expressions() -> None:
+  instructions = main_ir('var x = read_int(); var y = x * x; if y > 3 then print_int(x * x); print_int(y + x * x)')
+  assert calls(instructions).count('*') == 1
+  # Not across sibling branches
+  instructions = main_ir('var x = read_int(); if x > 3 then print_int(x * x) else print_int(x * x + 1)')
+  assert calls(instructions).count('*') == 2
+
+def test_dead_code() -> None:
+  instructions = main_ir('var x = read_int(); var y = x * 2; var z = x / 3; var w = x / 0; print_int(x)')
+  assert calls(instructions) == ['read_int', '/', 'print_int']
+  assert printed(instructions) == [None]
+
+def test_unreachable_phi_sources() -> None:
+  # The phi after the if loses the source from the else branch
+  cfg = build('main', compile_to_ir(tokenize_compact('var x = 1; if x > 0 then x = 2 else x = 3; print_int(x)'))[('main', ())])
+  to_ssa(cfg)
+  assert propagate_constants(cfg) > 0
+  assert not any(phis(block) for block in cfg.blocks)
+  assert len(cfg.blocks) == 3
+  from_ssa(cfg)
+  assert printed(cfg.instructions()) == [2]
+
+def test_unused_parameter() -> None:
+  source = 'fun f(x: Int, y: Int): Int { y } print_int(f(1, 2))'
+  assert run(source, True) == run(source, False) == '2\n'
+  assert compile_to_ir(tokenize_compact(source), optimized=True)[('f', (var('x'), var('y')))][-1] == ir.Return(L, var('y'))
+  # x is never read, but still has a place on the stack
+  assert 'f:' in compile_to_assembly(tokenize_compact('fun f(x: Int): Int { 1 } f(2)'))
+
+def test_copies_before_branch() -> None:
+  # s is set before the branch that can skip the addition, not in a block of its own
+  source = 'var x = read_int(); var s = 0; if x > 3 then s = s + x; print_int(s)'
+  instructions = main_ir(source)
+  assert sum(isinstance(insn, ir.Label) for insn in instructions) == 2
+  assert run(source, True, '5\n') == run(source, False, '5\n') == '5\n'
+  assert run(source, True, '2\n') == '0\n'
+
+def test_copies_of_both_edges() -> None:
+  # The then branch is empty after value numbering, but its copy can't
+  # be made before the branch, where the else edge has its own copy
+  source = 'var c = read_int(); var b = read_int(); if c > b then { c = b; } print_int(c)'
+  for stdin in ['5\n2\n', '1\n2\n']:
+    assert run(source, True, stdin) == run(source, False, stdin)
+  # Both branches are empty once c is found unused, and each edge to
+  # the join has its own copies
+  source = 'var a = read_int(); var b = read_int(); var c = 0; if a > b then { b = a; } else { c = a; } print_int(b)'
+  for stdin in ['5\n2\n', '1\n2\n']:
+    assert run(source, True, stdin) == run(source, False, stdin)
@@ -0,0 +1,41 @@
+import pytest
+from compiler.ir import IRVar
+from compiler.symtab import SymTab
+
+def test_require_finds_innermost() -> None:
+  root = SymTab[int]({'a': 1, 'b': 2})
+  inner = SymTab[int]({'a': 3}, SymTab[int]({}, root))
+  assert inner.require('a') == 3
+  assert inner.require('b') == 2
+  assert inner.flatten() == {'a': 3, 'b': 2}
+
+def test_keys_are_canonical_names() -> None:
+  tab = SymTab[int]({IRVar('print_int'): 1})
+  tab.add_local(IRVar('x'), 2)
+  assert tab.require('print_int') == 1
+  assert tab.require('x') == 2
+
+def test_undefined() -> None:
+  with pytest.raises(Exception) as exc:
+    SymTab[int]({}, SymTab[int]({'a': 1})).require('b')
+  assert exc.value.args[0] == 'b is not defined'
+
+class CountingDict(dict[str, int]):
+  '''Counts the times it is searched.'''
+  searches = 0
+
+  def __contains__(self, key: object) -> bool:
+    CountingDict.searches += 1
+    return super().__contains__(key)
+
+def test_one_search_per_scope() -> None:
+  root = SymTab[int](CountingDict({f'f{i}': i for i in range(5000)}))
+  inner = SymTab[int](CountingDict({f'x{i}': i for i in range(5000)}), SymTab[int]({}, root))
+  assert isinstance(inner.locals, CountingDict)
+  CountingDict.searches = 0
+  assert inner.require('x4999') == 4999
+  assert CountingDict.searches == 1
+  CountingDict.searches = 0
+  assert inner.require('f4999') == 4999
+  # The inner scope and the root, but no scan of their keys
+  assert CountingDict.searches == 2
@@ -1,6 +1,14 @@
-from compiler.location import Location
-from compiler.token import Token
-from compiler.tokenizer import tokenize
+import copy
+import pickle
+import pytest
+import re
+import sys
+from pathlib import Path
+from typing import Iterator
+from compiler import tokenizer
+from compiler.location import Location, LazyLocation, SourceMap
+from compiler.token import Token, TokenKind
+from compiler.tokenizer import token_pattern, tokenize, tokenize_compact, tokenize_file, tokenize_stream
 
 L = Location('L',-1, -1)
 
@@ -39,4 +47,123 @@ tadaa
   Token(loc=Location('file', 2, 1), type="identifier", text="c"),
   Token(loc=Location('file', 2, 7), type="identifier", text="ag"),
   Token(loc=Location('file', 9, 1), type="identifier", text="tadaa"),
-  ]
\ No newline at end of file
+  ]
+
+def test_block_comments() -> None:
+  assert tokenize('a /* x ** y */ b /***/ c /* *\n/ */ d') == [
+    Token(loc=Location('file', 1, 1), type="identifier", text="a"),
+    Token(loc=Location('file', 1, 16), type="identifier", text="b"),
+    Token(loc=Location('file', 1, 24), type="identifier", text="c"),
+    Token(loc=Location('file', 2, 6), type="identifier", text="d"),
+  ]
+
+def test_unterminated_block_comment_is_not_a_comment() -> None:
+  assert [t.text for t in tokenize('a /* b')] == ['a', '/', '*', 'b']
+
+def test_unknown_character() -> None:
+  try:
+    tokenize('a $ b')
+    assert False == True
+  except Exception as exc:
+    assert exc.args[0] == "Location(file='file', line=1, column=3): Syntax Error, unexpected character '$'"
+
+
+stream_source = '''fun f(a: Int): Int {
+  # comment
+  return a /* block
+  comment */ * 2;
+}
+var long_name_for_a_variable = f(12345) <= 10;
+// done'''
+
+def test_stream_matches_tokenize_for_any_chunking() -> None:
+  expected = tokenize(stream_source)
+  for size in range(1, 12):
+    chunks = [stream_source[i:i + size] for i in range(0, len(stream_source), size)]
+    assert list(tokenize_stream(chunks)) == expected
+
+def test_stream_tokenizes_again_only_after_an_end(monkeypatch: pytest.MonkeyPatch) -> None:
+  scans = []
+
+  class CountingPattern:
+    def finditer(self, text: str, start: int, end: int) -> Iterator[re.Match[str]]:
+      scans.append(end - start)
+      return token_pattern.finditer(text, start, end)
+
+  monkeypatch.setattr(tokenizer, 'token_pattern', CountingPattern())
+  # A long block comment and a long line are each scanned once they end
+  for source in ['a /*' + ' x\n' * 1000 + '*/ b\n', 'a' + ' b' * 1000 + '\n']:
+    expected = tokenize(source)
+    scans.clear()
+    chunks = [source[i:i + 10] for i in range(0, len(source), 10)]
+    assert list(tokenize_stream(chunks)) == expected
+    assert sum(scans) < 2 * len(source)
+  # The end of a comment can be split between chunks
+  for source in ['/*/ a */ b\n', '/* a *', '/* a **/ b\n']:
+    for size in range(1, 5):
+      chunks = [source[i:i + size] for i in range(0, len(source), size)]
+      assert list(tokenize_stream(chunks)) == tokenize(source)
+
+def test_stream_is_lazy() -> None:
+  def chunks() -> Iterator[str]:
+    yield 'a b\n'
+    raise Exception('read too far')
+  tokens = tokenize_stream(chunks())
+  assert next(tokens).text == 'a'
+  assert next(tokens).text == 'b'
+
+def test_tokenize_file(tmp_path: Path) -> None:
+  path = tmp_path / 'source'
+  path.write_text(stream_source)
+  with open(path, 'rb') as f:
+    assert list(tokenize_file(f)) == tokenize(stream_source)
+
+  path.write_text('')
+  with open(path, 'rb') as f:
+    assert list(tokenize_file(f)) == []
+
+def test_compact_stream_matches_tokenize() -> None:
+  stream = tokenize_compact(stream_source)
+  assert len(stream) == len(tokenize(stream_source))
+  assert list(stream) == tokenize(stream_source)
+  assert stream[2] == Token(loc=Location('file', 1, 6), type='punctuation', text='(')
+
+def test_lazy_location() -> None:
+  source_map = SourceMap('file', 'a\nbc\n\nd')
+  assert [source_map.location(i) for i in [0, 2, 3, 5, 6]] == [
+    Location('file', 1, 1),
+    Location('file', 2, 1),
+    Location('file', 2, 2),
+    Location('file', 3, 1),
+    Location('file', 4, 1),
+  ]
+  loc = LazyLocation(source_map, 3)
+  assert repr(loc) == "Location(file='file', line=2, column=2)"
+  assert loc == Location('file', 2, 2)
+  assert loc != Location('file', 2, 3)
+  # No larger than a Location, and copied as one
+  source_map = SourceMap('file', 'a\n' * 300 + 'bc')
+  loc = LazyLocation(source_map, 601)
+  assert sys.getsizeof(loc) == sys.getsizeof(Location('file', 1, 1))
+  assert pickle.loads(pickle.dumps(loc)) == Location('file', 301, 2)
+  assert type(copy.copy(loc)) is Location
+  loc = LazyLocation(source_map, 601)
+  loc.column = 5
+  assert (loc.file, loc.line, loc.column) == ('file', 301, 5)
+
+def test_token_kinds() -> None:
+  source = 'if x then var y = 1 <= 2 else not true; f(a, b) Int'
+  assert [t.kind for t in tokenize(source)] == [
+    TokenKind.IF, TokenKind.IDENTIFIER, TokenKind.THEN, TokenKind.VAR,
+    TokenKind.IDENTIFIER, TokenKind.ASSIGN, TokenKind.INT_LITERAL, TokenKind.LE,
+    TokenKind.INT_LITERAL, TokenKind.ELSE, TokenKind.NOT, TokenKind.TRUE,
+    TokenKind.SEMICOLON, TokenKind.IDENTIFIER, TokenKind.LPAREN, TokenKind.IDENTIFIER,
+    TokenKind.COMMA, TokenKind.IDENTIFIER, TokenKind.RPAREN, TokenKind.IDENTIFIER,
+  ]
+  assert [t.kind for t in tokenize_compact(source)] == [t.kind for t in tokenize(source)]
+  assert tokenize('while')[0].type == 'identifier'
+  assert Token(loc=L, type='int_literal', text='*').kind == TokenKind.STAR
+  # A stream gives the kinds it stored without classifying the text again
+  stream = tokenize_compact(source)
+  assert all(type(t.kind) is TokenKind for t in stream)
+  assert Token(loc=L, type='identifier', text='if', kind=TokenKind.IDENTIFIER).kind == TokenKind.IDENTIFIER
@@ -1,5 +1,6 @@
-from compiler.type_checker import typecheck
-from compiler.types import Int, Bool, Unit, Type, TypeTab
+import pytest
+from compiler.type_checker import TypeChecker, typecheck
+from compiler.types import Int, Bool, Unit, Type, FunType, TypeTab
 from compiler import ast
 from compiler.location import L
 
@@ -100,4 +101,30 @@ def test_function_call() -> None:
       ast.FunctionCall(L, ast.Identifier(L, 'f'), [ast.Literal(L, 10)])
     )), TypeTab
   ) == Unit
-  
\ No newline at end of file
+  
+def test_deep_nesting() -> None:
+  depth = 2000
+  node: ast.Expression = ast.Literal(L, 1)
+  for _ in range(depth):
+    node = ast.Block(L, [], ast.BinaryOp(L, node, '+', ast.Literal(L, 1)))
+  assert typecheck(ast.Module([], node), TypeTab) == Int
+
+def test_types_are_stored_on_slotted_nodes() -> None:
+  expr = ast.BinaryOp(L, ast.Literal(L, 1), '<', ast.Literal(L, 2))
+  assert not hasattr(expr, '__dict__')
+  typecheck(ast.Module([], expr), TypeTab)
+  assert expr.type == Bool
+  assert expr.left.type == Int
+
+def test_types_are_interned() -> None:
+  assert Type(int) is Int
+  assert FunType((Int, Int), Bool) is TypeTab.require('<')
+  signatures = {FunType((Int,), Unit): 'print_int'}
+  assert signatures[FunType((Int,), Unit)] == 'print_int'
+
+def test_operator_overloads() -> None:
+  checker = TypeChecker(TypeTab)
+  assert checker.overloads[('+', (Int, Int))] is Int
+  expr = ast.BinaryOp(L, ast.Literal(L, True), '+', ast.Literal(L, 1))
+  with pytest.raises(Exception, match="Unsupported parameters for '\\+'"):
+    typecheck(ast.Module([], expr), TypeTab)
@@ -0,0 +1,42 @@
+import pytest
+from compiler import ast
+from compiler.location import L
+from compiler.trampoline import Step, run
+from compiler.visitor import Visitor, visits
+
+class Counter(Visitor[None, int]):
+  @visits(ast.Literal, ast.Identifier)
+  def leaf(self, node: ast.Expression, context: None) -> int:
+    return 1
+
+  @visits(ast.BinaryOp)
+  def binary_op(self, node: ast.BinaryOp, context: None) -> Step[int]:
+    left = yield self.visit(node.left, context)
+    right = yield self.visit(node.right, context)
+    return left + right + 1
+
+class UnaryCounter(Counter):
+  @visits(ast.Unary)
+  def unary(self, node: ast.Unary, context: None) -> Step[int]:
+    return (yield self.visit(node.val, context)) + 1
+
+def test_dispatch() -> None:
+  node = ast.BinaryOp(L, ast.Literal(L, 1), '+', ast.Identifier(L, 'a'))
+  assert run(Counter().visit(node, None)) == 3
+  assert run(Counter().visit(ast.Literal(L, 1), None)) == 1
+
+def test_subclass_extends_handlers() -> None:
+  node = ast.Unary(L, '-', ast.BinaryOp(L, ast.Literal(L, 1), '+', ast.Literal(L, 2)))
+  assert run(UnaryCounter().visit(node, None)) == 4
+  assert ast.Unary not in Counter.handlers
+
+def test_unsupported_node() -> None:
+  with pytest.raises(Exception) as exc:
+    run(Counter().visit(ast.Unary(L, '-', ast.Literal(L, 1)), None))
+  assert exc.value.args[0] == "Location(file='L', line=-1, column=-1): Counter does not support Unary"
+
+def test_deep_nesting() -> None:
+  node: ast.Expression = ast.Literal(L, 1)
+  for _ in range(100000):
+    node = ast.BinaryOp(L, node, '+', ast.Literal(L, 1))
+  assert run(Counter().visit(node, None)) == 200001